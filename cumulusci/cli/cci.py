@@ -28,6 +28,8 @@ from jinja2 import Environment
 from jinja2 import PackageLoader
 
 import cumulusci
+from cumulusci.core.checkpoint import FlowCheckpoint
+from cumulusci.core.checkpoint import get_flow_hash
 from cumulusci.core.config import FlowConfig
 from cumulusci.core.config import OrgConfig
 from cumulusci.core.config import ScratchOrgConfig
@@ -50,6 +52,7 @@ from cumulusci.core.exceptions import ServiceNotConfigured
 from cumulusci.core.exceptions import TaskNotFoundError
 from cumulusci.core.exceptions import TaskOptionsError
 from cumulusci.core.exceptions import TaskRequiresSalesforceOrg
+from cumulusci.core.trace import TRACER
 from cumulusci.core.utils import import_class
 from cumulusci.cli.config import CliConfig
 from cumulusci.utils import doc_task
@@ -148,6 +151,11 @@ def handle_exception_debug(config, debug, e, throw_exception=None, no_prompt=Non
             handle_sentry_event(config, no_prompt)
             raise
 
+def export_trace(path):
+    TRACER.stop()
+    TRACER.export(path)
+    click.echo('Wrote {} trace events to {}'.format(len(TRACER.events), path))
+
 def render_recursive(data, indent=None):
     if indent is None:
         indent = 0
@@ -833,8 +841,9 @@ def task_info(config, task_name):
 @click.option('--debug-before', is_flag=True, help="Drops into the Python debugger right before task start.")
 @click.option('--debug-after', is_flag=True, help="Drops into the Python debugger at task completion.")
 @click.option('--no-prompt', is_flag=True, help="Disables all prompts.  Set for non-interactive mode use such as calling from scripts or CI systems")
+@click.option('--trace', help="Writes the timings of the task, polling, retries and API calls to this file as a Chrome trace_event JSON file, or as CSV if the file name ends in .csv")
 @click.pass_obj
-def task_run(config, task_name, org, o, debug, debug_before, debug_after, no_prompt):
+def task_run(config, task_name, org, o, debug, debug_before, debug_after, no_prompt, trace):
     # Check environment
     check_keychain(config)
 
@@ -894,6 +903,8 @@ def task_run(config, task_name, org, o, debug, debug_before, debug_after, no_pro
         pdb.set_trace()
 
     if not exception:
+        if trace:
+            TRACER.start()
         try:
             task()
         except TaskOptionsError as e:
@@ -919,6 +930,9 @@ def task_run(config, task_name, org, o, debug, debug_before, debug_after, no_pro
             handle_exception_debug(config, debug, e, throw_exception=exception)
         except Exception as e:
             handle_exception_debug(config, debug, e, no_prompt=no_prompt)
+        finally:
+            if trace:
+                export_trace(trace)
 
     if debug_after:
         import pdb
@@ -962,6 +976,16 @@ def flow_info(config, flow_name):
         raise FlowNotFoundError('Flow not found: {}'.format(flow_name))
     click.echo(render_recursive(flow))
 
+    flow_config = FlowConfig(flow)
+    class_path = flow_config.config.get(
+        'class_path', 'cumulusci.core.flows.BaseFlow')
+    flow_class = import_class(class_path)
+    flow = flow_class(config.project_config, flow_config, None,
+                      prep=False, name=flow_name)
+    click.echo('')
+    for line in flow.render_step_graph():
+        click.echo(line)
+
 
 @click.command(name='run', help="Runs a flow")
 @click.argument('flow_name')
@@ -971,8 +995,11 @@ def flow_info(config, flow_name):
 @click.option('-o', nargs=2, multiple=True, help="Pass task specific options for the task as '-o taskname__option value'.  You can specify more than one option by using -o more than once.")
 @click.option('--skip', multiple=True, help="Specify task names that should be skipped in the flow.  Specify multiple by repeating the --skip option")
 @click.option('--no-prompt', is_flag=True, help="Disables all prompts.  Set for non-interactive mode use such as calling from scripts or CI systems")
+@click.option('--max-workers', type=int, help="The number of steps which can run at the same time.  Overrides max_workers in the flow's configuration, which defaults to 1 to run the steps in order")
+@click.option('--trace', help="Writes the timings of the flow, sub-flows, tasks, polling, retries and API calls to this file as a Chrome trace_event JSON file, or as CSV if the file name ends in .csv")
+@click.option('--resume', is_flag=True, help="Skips the steps which completed in the last run of the flow against the org and restores their return values.  Steps run again if the flow's definition has changed.")
 @click.pass_obj
-def flow_run(config, flow_name, org, delete_org, debug, o, skip, no_prompt):
+def flow_run(config, flow_name, org, delete_org, debug, o, skip, no_prompt, max_workers, trace, resume):
     # Check environment
     check_keychain(config)
 
@@ -1014,10 +1041,24 @@ def flow_run(config, flow_name, org, delete_org, debug, o, skip, no_prompt):
         for option in o:
             options[option[0]] = option[1]
 
+    # Save the completed steps so the flow can be resumed after a failure
+    checkpoint = FlowCheckpoint(
+        os.path.join(
+            config.project_config.project_local_dir,
+            'flow_checkpoints',
+            '{}__{}.json'.format(org, flow_name),
+        ),
+        get_flow_hash(config.project_config, flow_config, options, skip),
+        org_config,
+    )
+    if not resume:
+        checkpoint.clear()
+
     # Create the flow and handle initialization exceptions
     try:
         flow = flow_class(config.project_config, flow_config,
-                          org_config, options, skip, name=flow_name)
+                          org_config, options, skip, name=flow_name,
+                          max_workers=max_workers, checkpoint=checkpoint)
     except TaskRequiresSalesforceOrg as e:
         exception = click.UsageError(
             'This flow requires a salesforce org.  Use org default <name> to set a default org or pass the org name with the --org option')
@@ -1028,7 +1069,19 @@ def flow_run(config, flow_name, org, delete_org, debug, o, skip, no_prompt):
         handle_exception_debug(config, debug, e, no_prompt=no_prompt)
 
     if not exception:
+        # The checkpoint is loaded once the flow has initialized the org
+        # since it is only used against the org it was saved for
+        if resume:
+            if checkpoint.load():
+                click.echo('Resuming flow with {} completed steps'.format(
+                    len(checkpoint.steps)))
+            else:
+                click.echo(
+                    'No checkpoint found for this flow definition and org, running all steps')
+
         # Run the flow and handle exceptions
+        if trace:
+            TRACER.start()
         try:
             flow()
         except TaskOptionsError as e:
@@ -1055,6 +1108,9 @@ def flow_run(config, flow_name, org, delete_org, debug, o, skip, no_prompt):
             handle_exception_debug(config, debug, e, throw_exception=exception)
         except Exception as e:
             handle_exception_debug(config, debug, e, no_prompt=no_prompt)
+        finally:
+            if trace:
+                export_trace(trace)
 
     # Delete the scratch org if --delete-org was set
     if delete_org:
@@ -0,0 +1,189 @@
+""" Checkpoints of the completed steps of a flow
+
+A FlowCheckpoint saves the return_values of each step as the step
+completes so `cci flow run --resume` can skip the steps which completed
+before a failure.  A checkpoint is only used against the org it was saved
+for and is discarded if the definition of the flow, its sub-flows or its
+tasks has changed.
+"""
+from __future__ import unicode_literals
+
+from builtins import object
+import hashlib
+import json
+import os
+import threading
+
+from cumulusci.utils import write_file_atomic
+
+
+def get_flow_definition(project_config, flow_config):
+    """ Returns the flow's steps with the configs of their tasks and sub-flows
+    resolved from the project config """
+    steps = {}
+    for step_num, step_config in list((flow_config.steps or {}).items()):
+        step = {'step_config': step_config}
+        if step_config.get('flow') not in (None, 'None'):
+            step['flow'] = get_flow_definition(
+                project_config,
+                project_config.get_flow(step_config['flow']),
+            )
+        elif step_config.get('task') not in (None, 'None'):
+            step['task'] = project_config.get_task(step_config['task']).config
+        steps[str(step_num)] = step
+    return steps
+
+
+def get_flow_hash(project_config, flow_config, options=None, skip=None):
+    """ Returns a hash of the flow definition and the options and skipped
+    steps passed to the flow """
+    definition = json.dumps({
+        'steps': get_flow_definition(project_config, flow_config),
+        'options': options or {},
+        'skip': sorted(skip or []),
+    }, sort_keys=True, default=str)
+    return hashlib.sha1(definition.encode('utf-8')).hexdigest()
+
+
+class CompletedStep(object):
+    """ Stands in for a task restored from a checkpoint so later steps can
+    look up its return_values with ^^ """
+
+    def __init__(self, name, stepnum, return_values, result=None):
+        self.name = name
+        self.stepnum = stepnum
+        self.return_values = return_values
+        self.result = result
+
+
+class PendingStep(object):
+    """ Records a step in the checkpoint once its task and the background
+    steps the task started have all succeeded """
+
+    def __init__(self, checkpoint, step_path, task):
+        self.checkpoint = checkpoint
+        self.step_path = step_path
+        self.task = task
+        self.task_succeeded = False
+        self.background_steps = 0
+        self._lock = threading.Lock()
+
+    def wrap_on_success(self, on_success=None):
+        """ Returns the on_success callback of a background step started by
+        the task, which records the step once the background step succeeds """
+        with self._lock:
+            self.background_steps += 1
+
+        def background_step_succeeded(result):
+            if on_success:
+                on_success(result)
+            with self._lock:
+                self.background_steps -= 1
+            self._add_step()
+        return background_step_succeeded
+
+    def succeeded(self):
+        """ Called once the task has run successfully """
+        with self._lock:
+            self.task_succeeded = True
+        self._add_step()
+
+    def _add_step(self):
+        with self._lock:
+            if not self.task_succeeded or self.background_steps:
+                return
+        self.checkpoint.add_step(
+            self.step_path,
+            self.task.name,
+            self.task.return_values,
+            self.task.result,
+        )
+
+
+class FlowCheckpoint(object):
+    """ Saves the completed steps of a flow to a JSON file
+
+    Steps are keyed by their step path, the step numbers from the top level
+    flow joined by /, for example 2/1 for the first step of the sub-flow
+    run as step 2.  The org's id and username are only read when the
+    checkpoint is loaded or saved so a scratch org isn't created before the
+    flow initializes it.
+    """
+
+    def __init__(self, path, flow_hash, org_config):
+        self.path = path
+        self.flow_hash = flow_hash
+        self.org_config = org_config
+        self.steps = {}
+        self._lock = threading.Lock()
+
+    def load(self):
+        """ Loads the completed steps from the saved checkpoint.  Returns
+        False and starts from no completed steps if there is no checkpoint
+        or it was saved for a different flow definition or org. """
+        self.steps = {}
+        if not os.path.isfile(self.path):
+            return False
+        try:
+            with open(self.path, 'r') as f:
+                checkpoint = json.load(f)
+        except ValueError:
+            return False
+        if (checkpoint.get('flow_hash') != self.flow_hash or
+                checkpoint.get('org_id') != self.org_config.org_id or
+                checkpoint.get('username') != self.org_config.username):
+            return False
+        self.steps = checkpoint.get('steps', {})
+        return True
+
+    def get_step(self, step_path, stepnum=None):
+        """ Returns a CompletedStep if the step completed before """
+        step = self.steps.get(step_path)
+        if step is None:
+            return
+        return CompletedStep(
+            step['name'],
+            stepnum,
+            step['return_values'],
+            step.get('result'),
+        )
+
+    def add_step(self, step_path, name, return_values, result=None):
+        """ Records a completed step and saves the checkpoint.  Steps whose
+        return_values can't be saved as JSON are not recorded so they run
+        again on resume. """
+        try:
+            json.dumps(return_values)
+        except (TypeError, ValueError):
+            return False
+        try:
+            json.dumps(result)
+        except (TypeError, ValueError):
+            result = None
+        with self._lock:
+            self.steps[step_path] = {
+                'name': name,
+                'return_values': return_values,
+                'result': result,
+            }
+            self._save()
+        return True
+
+    def _save(self):
+        dirname = os.path.dirname(self.path)
+        if dirname and not os.path.isdir(dirname):
+            os.makedirs(dirname)
+        checkpoint = json.dumps({
+            'flow_hash': self.flow_hash,
+            'org_id': self.org_config.org_id,
+            'username': self.org_config.username,
+            'steps': self.steps,
+        }, sort_keys=True)
+        write_file_atomic(self.path, checkpoint.encode('utf-8'))
+
+    def clear(self):
+        """ Removes the saved checkpoint """
+        with self._lock:
+            self.steps = {}
+            if os.path.isfile(self.path):
+                os.remove(self.path)
@@ -494,6 +494,25 @@ class BaseProjectConfig(BaseTaskFlowConfig):
         else:
             tag = None
 
+        # Resolve the ref to a commit so the archive of the repo can be
+        # cached by its sha
+        ref = tag if tag else repo.default_branch
+        commit = repo.commit(ref)
+        if not commit:
+            raise DependencyResolutionError(
+                '{}Could not find commit for {} in {}'.format(
+                    indent, ref, dependency['github'])
+            )
+        zip_url = '{}/archive/{}.zip'.format(repo.html_url, commit.sha)
+        archive_root = '{}-{}'.format(repo.name, commit.sha)
+        archive = {
+            'zip_url': zip_url,
+            'repo_owner': repo_owner,
+            'repo_name': repo_name,
+            'ref': commit.sha,
+            'headers': headers,
+        }
+
         # Get the cumulusci.yml file
         contents = repo.contents('cumulusci.yml', **kwargs)
         cumulusci_yml = hiyapyco.load(contents.decoded, loglevel='INFO')
@@ -512,39 +531,31 @@ class BaseProjectConfig(BaseTaskFlowConfig):
             for dirname in list(contents.keys()):
                 if 'unpackaged/pre/{}'.format(dirname) in skip:
                     continue
-                subfolder = "{}-{}/unpackaged/pre/{}".format(
-                    repo.name, repo.default_branch, dirname)
-                zip_url = "{}/archive/{}.zip".format(
-                    repo.html_url, repo.default_branch)
+                subfolder = "{}/unpackaged/pre/{}".format(
+                    archive_root, dirname)
 
-                unpackaged_pre.append({
-                    'zip_url': zip_url,
+                unpackaged_pre.append(dict(archive, **{
                     'subfolder': subfolder,
-                    'headers': headers,
                     'unmanaged': dependency.get('unmanaged'),
                     'namespace_tokenize': dependency.get('namespace_tokenize'),
                     'namespace_inject': dependency.get('namespace_inject'),
                     'namespace_strip': dependency.get('namespace_strip'),
-                })
+                }))
 
         # Look for metadata under src (deployed if no namespace)
         unmanaged_src = None
         if unmanaged or not namespace:
             contents = repo.contents('src', **kwargs)
             if contents:
-                zip_url = "{}/archive/{}.zip".format(
-                    repo.html_url, repo.default_branch)
-                subfolder = "{}-{}/src".format(repo.name, repo.default_branch)
+                subfolder = "{}/src".format(archive_root)
 
-                unmanaged_src = {
-                    'zip_url': zip_url,
+                unmanaged_src = dict(archive, **{
                     'subfolder': subfolder,
-                    'headers': headers,
                     'unmanaged': dependency.get('unmanaged'),
                     'namespace_tokenize': dependency.get('namespace_tokenize'),
                     'namespace_inject': dependency.get('namespace_inject'),
                     'namespace_strip': dependency.get('namespace_strip'),
-                }
+                })
 
         # Look for subfolders under unpackaged/post
         unpackaged_post = []
@@ -553,20 +564,16 @@ class BaseProjectConfig(BaseTaskFlowConfig):
             for dirname in list(contents.keys()):
                 if 'unpackaged/post/{}'.format(dirname) in skip:
                     continue
-                zip_url = "{}/archive/{}.zip".format(
-                    repo.html_url, repo.default_branch)
-                subfolder = "{}-{}/unpackaged/post/{}".format(
-                    repo.name, repo.default_branch, dirname)
+                subfolder = "{}/unpackaged/post/{}".format(
+                    archive_root, dirname)
 
-                dependency = {
-                    'zip_url': zip_url,
+                dependency = dict(archive, **{
                     'subfolder': subfolder,
-                    'headers': headers,
                     'unmanaged': dependency.get('unmanaged'),
                     'namespace_tokenize': dependency.get('namespace_tokenize'),
                     'namespace_inject': dependency.get('namespace_inject'),
                     'namespace_strip': dependency.get('namespace_strip'),
-                }
+                })
                 # By default, we always inject the project's namespace into
                 # unpackaged/post metadata
                 if namespace and not dependency.get('namespace_inject'):
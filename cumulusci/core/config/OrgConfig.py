@@ -9,6 +9,11 @@ from cumulusci.oauth.salesforce import SalesforceOAuth2
 class OrgConfig(BaseConfig):
     """ Salesforce org configuration (i.e. org credentials) """
 
+    # Namespace to version of the installed packages, cached by
+    # cumulusci.salesforce_api.installed_packages.  Not stored in the
+    # keychain so the cache only lasts as long as this config, i.e. a flow.
+    installed_packages = None
+
     def __init__(self, config, name):
         self.name = name
         super(OrgConfig, self).__init__(config)
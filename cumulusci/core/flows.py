@@ -6,18 +6,34 @@ from builtins import object
 import copy
 from distutils.version import LooseVersion  # pylint: disable=import-error,no-name-in-module
 import logging
+import threading
 import traceback
 
+from concurrent.futures import FIRST_COMPLETED
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import wait
+
+from cumulusci.core.checkpoint import PendingStep
 from cumulusci.core.config import FlowConfig
 from cumulusci.core.config import TaskConfig
 from cumulusci.core.exceptions import FlowConfigError
 from cumulusci.core.exceptions import FlowInfiniteLoopError
 from cumulusci.core.exceptions import FlowNotReadyError
+from cumulusci.core.trace import span
 from cumulusci.core.utils import import_class
+from cumulusci.core.utils import process_list_arg
 
 
 class BaseFlow(object):
-    """ BaseFlow handles initializing and running a flow """
+    """ BaseFlow handles initializing and running a flow
+
+    Steps run one after another unless the flow's max_workers is more than
+    1.  Then steps run as soon as the steps they depend on are complete.  A
+    step depends on the steps listed in its depends_on, by name or step
+    number, and the steps whose return values its options reference with
+    ^^.  A step without depends_on also depends on all steps before it so
+    flows only run concurrently where they declare it.
+    """
 
     def __init__(
             self,
@@ -30,7 +46,9 @@ class BaseFlow(object):
             parent=None,
             prep=True,
             name=None,
-            stepnum=None
+            stepnum=None,
+            max_workers=None,
+            checkpoint=None
     ):
         self.project_config = project_config # a subclass of BaseTaskFlowConfig, tho tasks may expect more than that
         self.flow_config = flow_config
@@ -42,10 +60,14 @@ class BaseFlow(object):
         self.step_return_values = []  # A collection of return_values dicts in task execution order
         self.step_results = []  # A collection of result objects in task execution order
         self.steps = []  # A collection of configured task objects, either run or failed
+        self.background_steps = []  # A collection of (name, future, on_success) tuples for steps still running in the background
         self.nested = nested  # indicates if flow is called from another flow
         self.parent = parent # parent flow, if nested
         self.name = name # the flows name.
         self.stepnum = stepnum # a nested flow has a stepnum
+        self.max_workers = max_workers # overrides max_workers in the flow config
+        self.checkpoint = checkpoint # a FlowCheckpoint to record completed steps, if any
+        self._running_steps = threading.local() # the PendingStep of the task running on each thread
         self._skip_next = False # internal only control flow option for subclasses to override a step execution in their pre.
         self._init_options()
         self._init_skip(skip)
@@ -184,6 +206,9 @@ class BaseFlow(object):
                 description,
             ))
 
+        if self._get_max_workers() > 1:
+            config.extend(self.render_step_graph())
+
         if self.org_config is not None:
             config.append('Organization:')
             config.append('  {}: {}'.format(
@@ -194,14 +219,168 @@ class BaseFlow(object):
         return config
 
     def __call__(self):
+        category = 'subflow' if self.nested else 'flow'
+        with span(self._get_span_name(), category):
+            self._run_flow_steps()
+
+    def _run_flow_steps(self):
         if not self.nested:
             self._pre_flow()
         if not self.prepped:
             raise FlowNotReadyError('Flow executed before init_flow was called')
-        for stepnum, step_config in self._get_steps_ordered():
-            self._run_step(stepnum, step_config)
+        steps = self._get_steps_ordered()
+        max_workers = self._get_max_workers()
+        if max_workers > 1:
+            self._run_steps_concurrent(steps, max_workers)
+        else:
+            for stepnum, step_config in steps:
+                self._run_step(stepnum, step_config)
         if not self.nested:
+            self.wait_background_steps()
             self._post_flow()
+            if self.checkpoint:
+                self.checkpoint.clear()
+
+    def _get_span_name(self):
+        """ Returns the name of the flow's span in an execution trace """
+        name = self.name or self.__class__.__name__
+        if self.stepnum:
+            return '{}: {}'.format(self.stepnum, name)
+        return name
+
+    def _get_max_workers(self):
+        max_workers = self.max_workers
+        if max_workers is None:
+            max_workers = self.flow_config.max_workers
+        try:
+            return int(max_workers or 1)
+        except ValueError:
+            raise FlowConfigError(
+                'max_workers must be an integer: {}'.format(max_workers)
+            )
+
+    def _get_step_name(self, step_config):
+        if 'flow_config' in step_config:
+            return step_config['step_config']['flow']
+        return step_config['step_config']['task']
+
+    def _get_step_dependencies(self, steps):
+        """ Returns a list with the set of indexes in steps of the steps each
+        step depends on """
+        dependencies = []
+        for i, (stepnum, step_config) in enumerate(steps):
+            config = step_config['step_config']
+            if 'depends_on' in config:
+                names = process_list_arg(config['depends_on']) or []
+                depends = set()
+            else:
+                names = []
+                depends = set(range(i))
+            names.extend(self._get_step_references(step_config))
+            for name in names:
+                depends.update(self._find_step_indexes(steps, i, name))
+            dependencies.append(depends)
+        return dependencies
+
+    def _get_step_references(self, step_config):
+        """ Returns the names of the steps referenced with ^^ by the step's
+        options """
+        options = dict(step_config['step_config'].get('options', {}))
+        if 'task_config' in step_config:
+            options.update(step_config['task_config'].options or {})
+            options.update(self.task_options.get(
+                step_config['step_config']['task'],
+                {},
+            ))
+        names = []
+        for value in options.values():
+            if isinstance(value, basestring) and value.startswith('^^'):
+                names.append(value[2:].split('.')[0])
+        return names
+
+    def _find_step_indexes(self, steps, index, name):
+        """ Returns the indexes of the steps before index with the step
+        number or name """
+        name = str(name)
+        found = [
+            i for i, (stepnum, step_config) in enumerate(steps[:index])
+            if name == str(stepnum) or name == self._get_step_name(step_config)
+        ]
+        if found:
+            return found
+        for stepnum, config in self.flow_config.steps.items():
+            if name == str(stepnum) or name in (config.get('task'), config.get('flow')):
+                # The step was removed from the flow with task: None or
+                # comes later in the flow
+                if LooseVersion(str(stepnum)) < steps[index][0]:
+                    return []
+                raise FlowConfigError(
+                    'Step {} depends on step {} which runs after it'.format(
+                        steps[index][0],
+                        name,
+                    )
+                )
+        raise FlowConfigError(
+            'Step {} depends on unknown step {}'.format(steps[index][0], name)
+        )
+
+    def render_step_graph(self):
+        """ Returns lines describing the steps each step waits for """
+        steps = self._get_steps_ordered()
+        dependencies = self._get_step_dependencies(steps)
+        lines = ['Step Graph (max_workers: {}):'.format(self._get_max_workers())]
+        for i, (stepnum, step_config) in enumerate(steps):
+            line = '  {}: {}'.format(stepnum, self._get_step_name(step_config))
+            # Steps reached through another dependency aren't listed
+            depends = set(dependencies[i])
+            for j in dependencies[i]:
+                depends -= dependencies[j]
+            if depends:
+                line += ' (after {})'.format(', '.join(
+                    str(steps[j][0]) for j in sorted(depends)
+                ))
+            lines.append(line)
+        return lines
+
+    def _run_steps_concurrent(self, steps, max_workers):
+        """ Runs each step once the steps it depends on are complete, with at
+        most max_workers steps running at a time.  After a step fails no
+        more steps are started and the first exception is raised once the
+        running steps complete. """
+        dependencies = self._get_step_dependencies(steps)
+        executor = ThreadPoolExecutor(max_workers=max_workers)
+        running = {}
+        done = set()
+        errors = []
+        try:
+            while True:
+                if not errors:
+                    for i, (stepnum, step_config) in enumerate(steps):
+                        if len(running) >= max_workers:
+                            break
+                        if i in done or i in running.values():
+                            continue
+                        if dependencies[i] <= done:
+                            future = executor.submit(
+                                self._run_step,
+                                stepnum,
+                                step_config,
+                            )
+                            running[future] = i
+                if not running:
+                    break
+                finished, not_finished = wait(
+                    list(running),
+                    return_when=FIRST_COMPLETED,
+                )
+                for future in finished:
+                    done.add(running.pop(future))
+                    if future.exception() is not None:
+                        errors.append(future.exception())
+        finally:
+            executor.shutdown()
+        if errors:
+            raise errors[0]
 
     def _pre_flow(self):
         pass
@@ -209,20 +388,70 @@ class BaseFlow(object):
     def _post_flow(self):
         pass
 
+    def add_background_step(self, name, future, on_success=None):
+        """ Register a future for a step which continues running in the
+        background.  Background steps are tracked by the top level flow and
+        joined either by wait_background_steps() or at the end of the flow.
+        If on_success is passed, it is called with the future's result from
+        the flow's thread once the step completes successfully. """
+        # The checkpoint records the task that started the background step
+        # only once the background step succeeds
+        pending_step = getattr(self._running_steps, 'step', None)
+        if pending_step:
+            on_success = pending_step.wrap_on_success(on_success)
+        if self.parent:
+            return self.parent.add_background_step(name, future, on_success)
+        self.background_steps.append((name, future, on_success))
+
+    def wait_background_steps(self, names=None):
+        """ Wait for background steps to complete.  If names is passed, only
+        wait on the steps with those names.  Raises the first exception from
+        a failed background step after all have completed. """
+        if self.parent:
+            return self.parent.wait_background_steps(names)
+        pending = []
+        exception = None
+        for name, future, on_success in self.background_steps:
+            if names and name not in names:
+                pending.append((name, future, on_success))
+                continue
+            self.logger.info('Waiting for background task: %s', name)
+            try:
+                result = future.result()
+                if on_success:
+                    on_success(result)
+                self.logger.info('Background task complete: %s', name)
+            except Exception as e:
+                self.logger.error('Background task failed: %s', name)
+                if exception is None:
+                    exception = e
+        self.background_steps = pending
+        if exception is not None:
+            raise exception
+
+    def _get_checkpoint(self):
+        """ Returns the checkpoint of the top level flow """
+        if self.parent:
+            return self.parent._get_checkpoint()
+        return self.checkpoint
+
+    def _get_step_path(self, stepnum):
+        """ Returns the step numbers from the top level flow to the step,
+        joined by / """
+        path = str(stepnum)
+        if self.parent:
+            path = '{}/{}'.format(self.parent._get_step_path(self.stepnum), path)
+        return path
+
     def _find_step_by_name(self, name):
         if not self.flow_config.steps:
             return
 
-        i = 0
-        for step in self._get_steps():
-            if 'flow_config' in step:
-                item = step['step_config']['flow']
-            elif 'task_config' in step:
-                item = step['step_config']['task']
-            if item == name:
-                if len(self.steps) > i:
-                    return self.steps[i]
-            i += 1
+        # Steps are matched by name since concurrent steps are added to
+        # self.steps in the order they start
+        for step in self.steps:
+            if step.name == name:
+                return step
 
     def _run_step(self, stepnum, step_config):
         if 'flow_config' in step_config:
@@ -272,6 +501,21 @@ class BaseFlow(object):
 
     def _run_task(self, stepnum, step_config):
 
+        # Restore the task from the checkpoint if it completed before
+        checkpoint = self._get_checkpoint()
+        if checkpoint:
+            step = checkpoint.get_step(self._get_step_path(stepnum), stepnum)
+            if step:
+                self.logger.info('')
+                self.logger.info(
+                    'Task already completed, restored from checkpoint: %s',
+                    step.name,
+                )
+                self.steps.append(step)
+                self.step_results.append(step.result)
+                self.step_return_values.append(step.return_values)
+                return
+
         task = self._get_task(stepnum, step_config)
 
         # Skip the task if skip was requested
@@ -292,11 +536,21 @@ class BaseFlow(object):
         if self._skip_next:
             self._skip_next = False
             return
+        pending_step = None
+        if checkpoint:
+            pending_step = PendingStep(
+                checkpoint, self._get_step_path(stepnum), task)
         try:
-            task()
+            self._running_steps.step = pending_step
+            try:
+                task()
+            finally:
+                self._running_steps.step = None
             self.logger.info('Task complete: %s', task.name)
             self.step_results.append(task.result)
             self.step_return_values.append(task.return_values)
+            if pending_step:
+                pending_step.succeeded()
             self._post_task(task)
         except Exception as e:
             self._post_task_exception(task, e)
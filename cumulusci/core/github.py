@@ -1,9 +1,16 @@
 """Wraps the github3 library to configure request retries."""
 
+import os
+import tempfile
+import threading
+import zipfile
+
 from github3 import login
 from requests.adapters import HTTPAdapter
 from requests.packages.urllib3.util.retry import Retry
 
+from cumulusci.utils import download_file
+
 retries = Retry(
     status_forcelist=(502, 503, 504),
     backoff_factor=0.3
@@ -16,3 +23,112 @@ def get_github_api(username, password):
     gh._session.mount('http://', adapter)
     gh._session.mount('https://', adapter)
     return gh
+
+
+class GithubArchiveCache(object):
+    """ Local cache of Github repository archives keyed by owner, repo and
+    commit sha
+
+    The archive for a commit never changes so it is downloaded once per
+    machine and reused by later runs.  Concurrent requests for the same
+    archive in a process wait for a single download.  Once the cache grows
+    past max_size, the least recently used archives are removed.
+    """
+
+    # 1 GB
+    default_max_size = 1024 * 1024 * 1024
+
+    # Shared by all instances so an archive is downloaded once per process
+    _locks = {}
+    _locks_lock = threading.Lock()
+
+    def __init__(self, cache_dir=None, max_size=None):
+        if cache_dir is None:
+            cache_dir = os.path.join(
+                os.path.expanduser('~'),
+                '.cumulusci',
+                'github_archives',
+            )
+        self.cache_dir = cache_dir
+        if max_size is None:
+            max_size = self.default_max_size
+        self.max_size = max_size
+
+    def get_path(self, owner, repo, sha):
+        return os.path.join(self.cache_dir, owner, repo, '{}.zip'.format(sha))
+
+    def get(self, owner, repo, sha, url, headers=None, logger=None):
+        """ Returns the path of the archive in the cache, downloading it from
+        url if it is not already cached """
+        path = self.get_path(owner, repo, sha)
+        with self._get_lock(path):
+            if os.path.isfile(path):
+                # Mark the archive as recently used
+                os.utime(path, None)
+                if logger:
+                    logger.info('Using cached archive of {}/{} at {}'.format(
+                        owner, repo, sha,
+                    ))
+                return path
+            self._download(path, url, headers, logger)
+        self.evict(keep=path)
+        return path
+
+    def open(self, owner, repo, sha, url, headers=None, logger=None):
+        """ Returns the cached archive as a ZipFile """
+        return zipfile.ZipFile(self.get(owner, repo, sha, url, headers, logger))
+
+    def _get_lock(self, path):
+        with self._locks_lock:
+            return self._locks.setdefault(path, threading.Lock())
+
+    def _download(self, path, url, headers, logger):
+        dirname = os.path.dirname(path)
+        if not os.path.isdir(dirname):
+            try:
+                os.makedirs(dirname)
+            except OSError:
+                # Created by another process
+                if not os.path.isdir(dirname):
+                    raise
+        # Download to a temporary file which is renamed into place so other
+        # processes never see a partial archive
+        fd, temp_path = tempfile.mkstemp(dir=dirname, suffix='.download')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                download_file(url, f, headers=headers, logger=logger)
+            os.rename(temp_path, path)
+        except Exception:
+            os.remove(temp_path)
+            raise
+
+    def evict(self, keep=None):
+        """ Removes the least recently used archives until the cache is no
+        larger than max_size and returns the paths removed """
+        archives = []
+        total = 0
+        for root, dirs, filenames in os.walk(self.cache_dir):
+            for filename in filenames:
+                if not filename.endswith('.zip'):
+                    continue
+                path = os.path.join(root, filename)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                archives.append((stat.st_mtime, stat.st_size, path))
+                total += stat.st_size
+
+        removed = []
+        for mtime, size, path in sorted(archives):
+            if total <= self.max_size:
+                break
+            if path == keep:
+                continue
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+            removed.append(path)
+        return removed
@@ -12,6 +12,7 @@ import time
 
 from cumulusci.core.exceptions import TaskRequiresSalesforceOrg
 from cumulusci.core.exceptions import TaskOptionsError
+from cumulusci.core.trace import span
 
 CURRENT_TASK = None
 
@@ -124,13 +125,20 @@ class BaseTask(object):
         self._set_current_task()
 
         try:
-            self._log_begin()
-            self.result = self._run_task()
+            with span(self._get_span_name(), 'task'):
+                self._log_begin()
+                self.result = self._run_task()
             return self.return_values
         except Exception as e:
             self._process_exception(e)
             raise
 
+    def _get_span_name(self):
+        """ Returns the name of the task's span in an execution trace """
+        if self.name and self.stepnum:
+            return '{}: {}'.format(self.stepnum, self.name)
+        return self.name or self.__class__.__name__
+
     def _process_exception(self, e):
         if self.project_config.use_sentry:
             self.logger.info('Logging error to sentry.io')
@@ -161,9 +169,11 @@ class BaseTask(object):
         self.logger.info('')
 
     def _retry(self):
+        attempt = 1
         while True:
             try:
-                self._try()
+                with span('try', 'retry', attempt=attempt):
+                    self._try()
                 break
             except Exception as e:
                 if not (self.options['retries'] and self._is_retry_valid(e)):
@@ -180,6 +190,7 @@ class BaseTask(object):
                             self.options['retry_interval_add']
                         )
                 self.options['retries'] -= 1
+                attempt += 1
                 self.logger.warning(
                     'Retrying ({} attempts remaining)'.format(
                         self.options['retries']
@@ -198,10 +209,12 @@ class BaseTask(object):
         ''' poll for a result in a loop '''
         while True:
             self.poll_count += 1
-            self._poll_action()
+            with span('poll', 'poll', poll_count=self.poll_count):
+                self._poll_action()
             if self.poll_complete:
                 break
-            time.sleep(self.poll_interval_s)
+            with span('sleep', 'poll', seconds=self.poll_interval_s):
+                time.sleep(self.poll_interval_s)
             self._poll_update_interval()
 
     def _poll_action(self):
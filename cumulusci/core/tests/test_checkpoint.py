@@ -0,0 +1,160 @@
+""" Tests for the CumulusCI flow checkpoint module """
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import mock
+
+from cumulusci.core.checkpoint import FlowCheckpoint
+from cumulusci.core.checkpoint import get_flow_hash
+from cumulusci.core.checkpoint import PendingStep
+from cumulusci.core.config import FlowConfig
+from cumulusci.core.config import OrgConfig
+from cumulusci.tests.util import create_project_config
+
+
+class TestFlowCheckpoint(unittest.TestCase):
+
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tempdir, 'checkpoints', 'flow.json')
+        self.org_config = OrgConfig({
+            'username': 'sample@example',
+            'org_id': '00D000000000001',
+        }, 'test')
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+
+    def test_add_step_and_load(self):
+        checkpoint = FlowCheckpoint(self.path, 'hash', self.org_config)
+        self.assertTrue(checkpoint.add_step('1', 'foo', {'name': 'bar'}, -1))
+        checkpoint = FlowCheckpoint(self.path, 'hash', self.org_config)
+        self.assertTrue(checkpoint.load())
+        step = checkpoint.get_step('1', 1)
+        self.assertEqual('foo', step.name)
+        self.assertEqual({'name': 'bar'}, step.return_values)
+        self.assertEqual(-1, step.result)
+        self.assertIsNone(checkpoint.get_step('2'))
+
+    def test_add_step_not_serializable(self):
+        checkpoint = FlowCheckpoint(self.path, 'hash', self.org_config)
+        self.assertFalse(checkpoint.add_step('1', 'foo', {'obj': object()}))
+        self.assertEqual({}, checkpoint.steps)
+
+    def test_load_no_checkpoint(self):
+        checkpoint = FlowCheckpoint(self.path, 'hash', self.org_config)
+        self.assertFalse(checkpoint.load())
+
+    def test_load_flow_changed(self):
+        FlowCheckpoint(self.path, 'hash', self.org_config).add_step(
+            '1', 'foo', {})
+        checkpoint = FlowCheckpoint(self.path, 'changed', self.org_config)
+        self.assertFalse(checkpoint.load())
+        self.assertEqual({}, checkpoint.steps)
+
+    def test_load_org_changed(self):
+        FlowCheckpoint(self.path, 'hash', self.org_config).add_step(
+            '1', 'foo', {})
+        self.org_config.config['org_id'] = '00D000000000002'
+        checkpoint = FlowCheckpoint(self.path, 'hash', self.org_config)
+        self.assertFalse(checkpoint.load())
+
+    def test_org_read_lazily(self):
+        org_config = mock.Mock(spec=['org_id', 'username'])
+        org_config.username = 'sample@example'
+        org_id = mock.PropertyMock(return_value='00D000000000001')
+        type(org_config).org_id = org_id
+        checkpoint = FlowCheckpoint(self.path, 'hash', org_config)
+        org_id.assert_not_called()
+        checkpoint.add_step('1', 'foo', {})
+        org_id.assert_called_once_with()
+
+    def test_clear(self):
+        checkpoint = FlowCheckpoint(self.path, 'hash', self.org_config)
+        checkpoint.add_step('1', 'foo', {})
+        checkpoint.clear()
+        self.assertFalse(os.path.exists(self.path))
+        self.assertEqual({}, checkpoint.steps)
+
+
+class TestPendingStep(unittest.TestCase):
+
+    def setUp(self):
+        self.checkpoint = mock.Mock()
+        self.task = mock.Mock(return_values={'foo': 'bar'}, result=None)
+        self.task.name = 'foo'
+
+    def test_succeeded(self):
+        step = PendingStep(self.checkpoint, '1', self.task)
+        step.succeeded()
+        self.checkpoint.add_step.assert_called_once_with(
+            '1', 'foo', {'foo': 'bar'}, None)
+
+    def test_background_step(self):
+        step = PendingStep(self.checkpoint, '1', self.task)
+        results = []
+        on_success = step.wrap_on_success(results.append)
+        step.succeeded()
+        self.checkpoint.add_step.assert_not_called()
+        on_success('Success')
+        self.assertEqual(['Success'], results)
+        self.checkpoint.add_step.assert_called_once()
+
+
+class TestGetFlowHash(unittest.TestCase):
+
+    def setUp(self):
+        self.project_config = create_project_config('TestOwner', 'TestRepo')
+        self.project_config.config['tasks'] = {
+            'foo': {'class_path': 'cumulusci.core.tasks.BaseTask'},
+        }
+        self.project_config.config['flows'] = {
+            'nested': {'steps': {1: {'task': 'foo'}}},
+        }
+        self.flow_config = FlowConfig({
+            'steps': {
+                1: {'task': 'foo'},
+                2: {'flow': 'nested'},
+                3: {'task': 'None'},
+            },
+        })
+
+    def test_hash(self):
+        flow_hash = get_flow_hash(self.project_config, self.flow_config)
+        self.assertEqual(
+            flow_hash,
+            get_flow_hash(self.project_config, self.flow_config),
+        )
+        self.assertNotEqual(
+            flow_hash,
+            get_flow_hash(self.project_config, self.flow_config, skip=['foo']),
+        )
+        self.assertNotEqual(
+            flow_hash,
+            get_flow_hash(
+                self.project_config,
+                self.flow_config,
+                options={'foo__bar': 'baz'},
+            ),
+        )
+
+    def test_hash_task_changed(self):
+        flow_hash = get_flow_hash(self.project_config, self.flow_config)
+        self.project_config.config['tasks']['foo']['options'] = {'a': 'b'}
+        self.assertNotEqual(
+            flow_hash,
+            get_flow_hash(self.project_config, self.flow_config),
+        )
+
+    def test_hash_nested_flow_changed(self):
+        flow_hash = get_flow_hash(self.project_config, self.flow_config)
+        self.project_config.config['flows']['nested']['steps'][2] = {
+            'task': 'foo',
+        }
+        self.assertNotEqual(
+            flow_hash,
+            get_flow_hash(self.project_config, self.flow_config),
+        )
@@ -180,6 +180,10 @@ class DummyContents(object):
     def __init__(self, content):
         self.decoded = content
 
+class DummyCommit(object):
+    def __init__(self, sha):
+        self.sha = sha
+
 class DummyRepository(object):
     default_branch = 'master'
     _api = 'http://'
@@ -197,6 +201,9 @@ class DummyRepository(object):
             raise AssertionError(
                 'Accessed unexpected file: {}'.format(path))
 
+    def commit(self, sha):
+        return DummyCommit('abcdef')
+
     def _build_url(self, *args, **kw):
         return self._api
 
@@ -284,9 +291,12 @@ class TestBaseProjectConfig(unittest.TestCase):
                 u'namespace_inject': None,
                 u'namespace_strip': None,
                 u'namespace_tokenize': None,
-                u'subfolder': u'CumulusCI-Test-master/unpackaged/pre/pre',
+                u'subfolder': u'CumulusCI-Test-abcdef/unpackaged/pre/pre',
                 u'unmanaged': True,
-                u'zip_url': u'https://github.com/SalesforceFoundation/CumulusCI-Test/archive/master.zip',
+                u'zip_url': u'https://github.com/SalesforceFoundation/CumulusCI-Test/archive/abcdef.zip',
+                u'repo_owner': u'SalesforceFoundation',
+                u'repo_name': u'CumulusCI-Test',
+                u'ref': u'abcdef',
             },
             {u'version': '2', u'namespace': 'ccitestdep'},
             {
@@ -294,18 +304,24 @@ class TestBaseProjectConfig(unittest.TestCase):
                 u'namespace_inject': None,
                 u'namespace_strip': None,
                 u'namespace_tokenize': None,
-                u'subfolder': u'CumulusCI-Test-master/src',
+                u'subfolder': u'CumulusCI-Test-abcdef/src',
                 u'unmanaged': True,
-                u'zip_url': u'https://github.com/SalesforceFoundation/CumulusCI-Test/archive/master.zip',
+                u'zip_url': u'https://github.com/SalesforceFoundation/CumulusCI-Test/archive/abcdef.zip',
+                u'repo_owner': u'SalesforceFoundation',
+                u'repo_name': u'CumulusCI-Test',
+                u'ref': u'abcdef',
             },
             {
                 u'headers': {u'Authorization': u'token password'},
                 u'namespace_inject': 'ccitest',
                 u'namespace_strip': None,
                 u'namespace_tokenize': None,
-                u'subfolder': u'CumulusCI-Test-master/unpackaged/post/post',
+                u'subfolder': u'CumulusCI-Test-abcdef/unpackaged/post/post',
                 u'unmanaged': True,
-                u'zip_url': u'https://github.com/SalesforceFoundation/CumulusCI-Test/archive/master.zip',
+                u'zip_url': u'https://github.com/SalesforceFoundation/CumulusCI-Test/archive/abcdef.zip',
+                u'repo_owner': u'SalesforceFoundation',
+                u'repo_name': u'CumulusCI-Test',
+                u'ref': u'abcdef',
             },
         ])
 
@@ -1,18 +1,25 @@
 """ Tests for the Flow engine """
 
+import os
+import shutil
+import tempfile
 import unittest
 import logging
 import mock
 
 from collections import Callable
+from concurrent.futures import Future
 from nose.tools import raises
 
+from cumulusci.core.checkpoint import CompletedStep
+from cumulusci.core.checkpoint import FlowCheckpoint
 from cumulusci.core.flows import BaseFlow
 from cumulusci.core.tasks import BaseTask
 from cumulusci.core.config import FlowConfig
 from cumulusci.core.config import OrgConfig
 from cumulusci.core.exceptions import FlowConfigError
 from cumulusci.core.exceptions import TaskNotFoundError
+from cumulusci.core.trace import TRACER
 from cumulusci.core.tests.utils import MockLoggingHandler
 from cumulusci.tests.util import create_project_config
 import cumulusci.core
@@ -41,6 +48,19 @@ class _TaskRaisesException(BaseTask):
     def _run_task(self):
         raise self.options['exception'](self.options['message'])
 
+class _TaskRunsInBackground(BaseTask):
+    task_options = {
+        'exception': {'description': 'The exception to set on the future'},
+    }
+
+    def _run_task(self):
+        future = Future()
+        if self.options.get('exception'):
+            future.set_exception(self.options['exception']('background'))
+        else:
+            future.set_result(self.name)
+        self.flow.add_background_step(self.name, future)
+
 class _SfdcTask(BaseTask):
     salesforce_task = True
 
@@ -86,6 +106,20 @@ class TestBaseFlow(unittest.TestCase):
                 'class_path':
                     'cumulusci.core.tests.test_flows._SfdcTask'
             },
+            'background': {
+                'description': 'Runs in the background',
+                'class_path':
+                    'cumulusci.core.tests.test_flows._TaskRunsInBackground'
+            },
+            'background_2': {
+                'description': 'Runs in the background',
+                'class_path':
+                    'cumulusci.core.tests.test_flows._TaskRunsInBackground'
+            },
+            'wait_background': {
+                'description': 'Waits for background steps',
+                'class_path': 'cumulusci.tasks.util.WaitBackgroundTasks',
+            },
         }
         self.project_config.config['flows'] = {
             'nested_flow': {
@@ -473,3 +507,244 @@ class TestBaseFlow(unittest.TestCase):
             flow.step_return_values[0],
             flow.step_return_values[1][1][0],
         )
+
+    def test_background_steps_joined_at_end(self, mock_class):
+        """ Background steps are waited on at the end of the top level flow """
+        flow_config = FlowConfig({
+            'description': 'Run a background task in a nested flow',
+            'steps': {
+                1: {'flow': 'background_flow'},
+                2: {'task': 'pass_name'},
+            },
+        })
+        self.project_config.config['flows']['background_flow'] = {
+            'description': 'Runs a background task',
+            'steps': {
+                1: {'task': 'background'},
+            },
+        }
+        flow = BaseFlow(self.project_config, flow_config, self.org_config)
+        flow()
+        self.assertEqual([], flow.background_steps)
+        self.assertTrue(any(
+            'Background task complete: background' in s
+            for s in self.flow_log['info']
+        ))
+
+    def test_background_steps_failure(self, mock_class):
+        """ A failed background step fails the flow when joined """
+        flow_config = FlowConfig({
+            'description': 'Run a failing background task',
+            'steps': {
+                1: {'task': 'background', 'options': {
+                    'exception': ValueError,
+                }},
+                2: {'task': 'pass_name'},
+            },
+        })
+        flow = BaseFlow(self.project_config, flow_config, self.org_config)
+        self.assertRaises(ValueError, flow)
+        self.assertEqual(2, len(flow.steps))
+
+    def test_background_step_on_success(self, mock_class):
+        """ on_success is called with the result when the step is joined """
+        flow_config = FlowConfig({
+            'description': 'No steps',
+            'steps': {},
+        })
+        flow = BaseFlow(self.project_config, flow_config, self.org_config)
+        results = []
+        future = Future()
+        flow.add_background_step('background', future, results.append)
+        future.set_result('Success')
+        self.assertEqual([], results)
+        flow.wait_background_steps()
+        self.assertEqual(['Success'], results)
+
+    def test_wait_background_task(self, mock_class):
+        """ The wait_background task joins only the named background steps """
+        flow_config = FlowConfig({
+            'description': 'Run background tasks and wait for one',
+            'steps': {
+                1: {'task': 'background'},
+                2: {'task': 'background_2'},
+                3: {'task': 'wait_background', 'options': {
+                    'tasks': 'background',
+                }},
+                4: {'task': 'pass_name'},
+            },
+        })
+        flow = BaseFlow(self.project_config, flow_config, self.org_config)
+        flow()
+        log = self.flow_log['info']
+        self.assertLess(
+            log.index('Background task complete: background'),
+            log.index('Running task: pass_name'),
+        )
+        self.assertLess(
+            log.index('Running task: pass_name'),
+            log.index('Background task complete: background_2'),
+        )
+
+    def test_concurrent_steps(self, mock_class):
+        """ Steps run concurrently after the steps they depend on """
+        flow_config = FlowConfig({
+            'description': 'Run steps concurrently',
+            'max_workers': 2,
+            'steps': {
+                1: {'task': 'pass_name'},
+                2: {'task': 'background', 'depends_on': []},
+                3: {'task': 'name_response', 'depends_on': [], 'options': {
+                    'response': '^^pass_name.name',
+                }},
+                4: {'task': 'sfdc_task'},
+            },
+        })
+        flow = BaseFlow(self.project_config, flow_config, self.org_config)
+        self.assertEqual([set(), set(), set([0]), set([0, 1, 2])],
+            flow._get_step_dependencies(flow._get_steps_ordered()))
+        flow()
+        self.assertEqual(4, len(flow.steps))
+        self.assertIn('supername', flow.step_results)
+        self.assertEqual('sfdc_task', flow.steps[-1].name)
+
+    def test_concurrent_steps_failure(self, mock_class):
+        """ No more steps are started after a concurrent step fails """
+        flow_config = FlowConfig({
+            'description': 'Run steps concurrently',
+            'max_workers': 2,
+            'steps': {
+                1: {'task': 'raise_exception'},
+                2: {'task': 'pass_name'},
+            },
+        })
+        flow = BaseFlow(self.project_config, flow_config, self.org_config)
+        self.assertRaises(Exception, flow)
+        self.assertEqual(1, len(flow.steps))
+
+    def test_render_step_graph(self, mock_class):
+        flow_config = FlowConfig({
+            'description': 'Run steps concurrently',
+            'max_workers': 2,
+            'steps': {
+                1: {'task': 'pass_name'},
+                2: {'task': 'sfdc_task', 'depends_on': []},
+                3: {'task': 'name_response', 'depends_on': '2', 'options': {
+                    'response': '^^pass_name.name',
+                }},
+                4: {'task': 'background'},
+            },
+        })
+        flow = BaseFlow(
+            self.project_config, flow_config, self.org_config, prep=False)
+        self.assertEqual([
+            'Step Graph (max_workers: 2):',
+            '  1: pass_name',
+            '  2: sfdc_task',
+            '  3: name_response (after 1, 2)',
+            '  4: background (after 3)',
+        ], flow.render_step_graph())
+
+    def test_depends_on_unknown_step(self, mock_class):
+        flow_config = FlowConfig({
+            'description': 'Depends on a step which does not exist',
+            'max_workers': 2,
+            'steps': {
+                1: {'task': 'pass_name', 'depends_on': ['pass_names']},
+                2: {'task': 'sfdc_task', 'depends_on': ['name_response']},
+                3: {'task': 'name_response'},
+            },
+        })
+        flow = BaseFlow(
+            self.project_config, flow_config, self.org_config, prep=False)
+        steps = flow._get_steps_ordered()
+        with self.assertRaises(FlowConfigError):
+            flow._find_step_indexes(steps, 0, 'pass_names')
+        with self.assertRaises(FlowConfigError):
+            flow._find_step_indexes(steps, 1, 'name_response')
+
+    def test_trace(self, mock_class):
+        """ Flows, nested flows and tasks are recorded as trace spans """
+        flow_config = FlowConfig({
+            'description': 'Run a task and a flow',
+            'steps': {
+                1: {'task': 'pass_name'},
+                2: {'flow': 'nested_flow'},
+            },
+        })
+        flow = BaseFlow(
+            self.project_config, flow_config, self.org_config, name='test')
+        TRACER.start()
+        try:
+            flow()
+        finally:
+            TRACER.stop()
+        self.assertEqual([
+            ('test', 'flow'),
+            ('1: pass_name', 'task'),
+            ('2: nested_flow', 'subflow'),
+            ('1: pass_name', 'task'),
+        ], [(e['name'], e['cat']) for e in TRACER.get_events()])
+
+    def test_resume_from_checkpoint(self, mock_class):
+        """ Steps completed before a failure are restored on resume """
+        tempdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tempdir)
+        path = os.path.join(tempdir, 'checkpoint.json')
+        flow_config = FlowConfig({
+            'description': 'Fails after a task and a flow',
+            'steps': {
+                1: {'task': 'pass_name'},
+                2: {'flow': 'nested_flow'},
+                3: {'task': 'raise_exception'},
+            },
+        })
+        checkpoint = FlowCheckpoint(path, 'hash', self.org_config)
+        flow = BaseFlow(self.project_config, flow_config, self.org_config,
+                        checkpoint=checkpoint)
+        with self.assertRaises(Exception):
+            flow()
+        self.assertEqual(['1', '2/1'], sorted(checkpoint.steps))
+
+        flow_config.config['steps'][3] = {
+            'task': 'name_response',
+            'options': {'response': '^^pass_name.name'},
+        }
+        checkpoint = FlowCheckpoint(path, 'hash', self.org_config)
+        self.assertTrue(checkpoint.load())
+        flow = BaseFlow(self.project_config, flow_config, self.org_config,
+                        checkpoint=checkpoint)
+        flow()
+        self.assertIsInstance(flow.steps[0], CompletedStep)
+        self.assertIsInstance(flow.steps[1].steps[0], CompletedStep)
+        self.assertEqual('supername', flow.step_results[1])
+        self.assertEqual(
+            flow.step_return_values[0],
+            flow.step_return_values[1][0],
+        )
+        self.assertFalse(os.path.exists(path))
+
+    def test_checkpoint_background_step(self, mock_class):
+        """ Background steps are recorded once they succeed """
+        tempdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tempdir)
+        checkpoint = FlowCheckpoint(
+            os.path.join(tempdir, 'checkpoint.json'), 'hash', self.org_config)
+        flow_config = FlowConfig({
+            'description': 'Run background tasks and fail',
+            'steps': {
+                1: {'task': 'background'},
+                2: {'task': 'background_2', 'options': {
+                    'exception': ValueError,
+                }},
+                3: {'task': 'wait_background', 'options': {
+                    'tasks': 'background',
+                }},
+                4: {'task': 'raise_exception'},
+            },
+        })
+        flow = BaseFlow(self.project_config, flow_config, self.org_config,
+                        checkpoint=checkpoint)
+        with self.assertRaises(Exception):
+            flow()
+        self.assertEqual(['1', '3'], sorted(checkpoint.steps))
@@ -1,10 +1,16 @@
 from http.client import HTTPMessage
 import io
+import os
+import shutil
+import tempfile
 import unittest
+import zipfile
 
 import mock
+import responses
 
 from cumulusci.core.github import get_github_api
+from cumulusci.core.github import GithubArchiveCache
 
 
 class MockHttpResponse(mock.Mock):
@@ -41,3 +47,67 @@ class TestGithub(unittest.TestCase):
 
         gh.octocat('meow')
         self.assertEqual(_make_request.call_count, 2)
+
+
+class TestGithubArchiveCache(unittest.TestCase):
+
+    url = 'https://github.com/TestOwner/TestRepo/archive/abcdef.zip'
+
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+        self.cache = GithubArchiveCache(self.cache_dir)
+
+    def tearDown(self):
+        shutil.rmtree(self.cache_dir)
+
+    def _archive(self):
+        zip_content = io.BytesIO()
+        zip_file = zipfile.ZipFile(zip_content, 'w')
+        zip_file.writestr('TestRepo-abcdef/src/package.xml', 'test')
+        zip_file.close()
+        return zip_content.getvalue()
+
+    @responses.activate
+    def test_get_downloads_once(self):
+        responses.add(responses.GET, self.url, body=self._archive())
+
+        path = self.cache.get('TestOwner', 'TestRepo', 'abcdef', self.url)
+        self.assertEqual(
+            os.path.join(self.cache_dir, 'TestOwner', 'TestRepo', 'abcdef.zip'),
+            path,
+        )
+        cache = GithubArchiveCache(self.cache_dir)
+        archive = cache.open('TestOwner', 'TestRepo', 'abcdef', self.url)
+        self.assertEqual(
+            ['TestRepo-abcdef/src/package.xml'],
+            archive.namelist(),
+        )
+        archive.close()
+        self.assertEqual(1, len(responses.calls))
+
+    @responses.activate
+    def test_get_download_error(self):
+        responses.add(responses.GET, self.url, status=404)
+
+        with self.assertRaises(Exception):
+            self.cache.get('TestOwner', 'TestRepo', 'abcdef', self.url)
+        self.assertEqual(
+            [],
+            os.listdir(os.path.join(self.cache_dir, 'TestOwner', 'TestRepo')),
+        )
+
+    def test_evict(self):
+        for i, sha in enumerate(['a', 'b', 'c']):
+            path = self.cache.get_path('TestOwner', 'TestRepo', sha)
+            if not os.path.isdir(os.path.dirname(path)):
+                os.makedirs(os.path.dirname(path))
+            with open(path, 'wb') as f:
+                f.write(b'x' * 10)
+            os.utime(path, (i, i))
+        self.cache.max_size = 15
+
+        removed = self.cache.evict(keep=self.cache.get_path('TestOwner', 'TestRepo', 'a'))
+        self.assertEqual([
+            self.cache.get_path('TestOwner', 'TestRepo', 'b'),
+            self.cache.get_path('TestOwner', 'TestRepo', 'c'),
+        ], removed)
@@ -0,0 +1,119 @@
+""" Tests for the CumulusCI trace module """
+
+import csv
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+import responses
+
+from cumulusci.core.config import BaseGlobalConfig
+from cumulusci.core.config import BaseProjectConfig
+from cumulusci.core.config import TaskConfig
+from cumulusci.core.tasks import BaseTask
+from cumulusci.core.trace import TracedSession
+from cumulusci.core.trace import Tracer
+from cumulusci.core.trace import TRACER
+
+
+class _PollingTask(BaseTask):
+
+    def _run_task(self):
+        self.poll_interval_s = 0
+        self._poll()
+
+    def _poll_action(self):
+        self.poll_complete = self.poll_count == 2
+
+
+class TestTracer(unittest.TestCase):
+
+    def setUp(self):
+        self.tracer = Tracer()
+        self.tempdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+
+    def test_disabled(self):
+        with self.tracer.span('test', 'task'):
+            pass
+        self.assertEqual([], self.tracer.events)
+
+    def test_span(self):
+        self.tracer.start()
+        with self.tracer.span('outer', 'flow'):
+            with self.tracer.span('inner', 'task', foo='bar'):
+                pass
+        events = self.tracer.get_events()
+        self.assertEqual(['outer', 'inner'], [e['name'] for e in events])
+        self.assertEqual('X', events[1]['ph'])
+        self.assertEqual('task', events[1]['cat'])
+        self.assertEqual({'foo': 'bar'}, events[1]['args'])
+        self.assertGreaterEqual(events[0]['dur'], events[1]['dur'])
+
+    def test_span_error(self):
+        self.tracer.start()
+        with self.assertRaises(ValueError):
+            with self.tracer.span('test', 'task'):
+                raise ValueError('test')
+        self.assertEqual(
+            {'error': 'ValueError'},
+            self.tracer.events[0]['args'],
+        )
+
+    def test_export_json(self):
+        self.tracer.start()
+        with self.tracer.span('test', 'task'):
+            pass
+        path = os.path.join(self.tempdir, 'trace.json')
+        self.tracer.export(path)
+        with open(path, 'r') as f:
+            trace = json.load(f)
+        self.assertEqual(['test'], [e['name'] for e in trace['traceEvents']])
+
+    def test_export_csv(self):
+        self.tracer.start()
+        with self.tracer.span('test', 'task', attempt=1):
+            pass
+        path = os.path.join(self.tempdir, 'trace.csv')
+        self.tracer.export(path)
+        with open(path, 'rb') as f:
+            rows = list(csv.DictReader(f))
+        self.assertEqual(1, len(rows))
+        self.assertEqual('test', rows[0]['name'])
+        self.assertEqual('{"attempt": 1}', rows[0]['args'])
+
+
+class TestTraceInstrumentation(unittest.TestCase):
+
+    def setUp(self):
+        self.project_config = BaseProjectConfig(BaseGlobalConfig())
+        TRACER.start()
+
+    def tearDown(self):
+        TRACER.stop()
+
+    def test_task_poll(self):
+        task = _PollingTask(self.project_config, TaskConfig(), name='poller')
+        task()
+        events = TRACER.get_events()
+        self.assertEqual(
+            ['poller', 'poll', 'sleep', 'poll'],
+            [e['name'] for e in events],
+        )
+        self.assertEqual('task', events[0]['cat'])
+
+    @responses.activate
+    def test_traced_session(self):
+        responses.add(
+            method=responses.GET,
+            url='https://example.com/services/data/',
+            json={},
+        )
+        TracedSession().get('https://example.com/services/data/?q=1')
+        events = TRACER.get_events()
+        self.assertEqual('GET https://example.com/services/data/', events[0]['name'])
+        self.assertEqual('rest', events[0]['cat'])
@@ -0,0 +1,131 @@
+""" Timing spans for flows, tasks and API calls
+
+The module level TRACER is disabled by default so spans are cheap no-ops.
+`cci flow run --trace` and `cci task run --trace` enable it and export the
+recorded spans as a Chrome trace_event JSON file, which can be loaded in
+about:tracing or Perfetto, or as a flat CSV file when the path ends in .csv
+"""
+from __future__ import unicode_literals
+
+from builtins import object
+from contextlib import contextmanager
+import csv
+import json
+import os
+import threading
+import time
+
+import requests
+
+CSV_COLUMNS = ('name', 'category', 'start', 'duration', 'thread', 'args')
+
+
+class Tracer(object):
+    """ Records complete ('X' phase) trace events for named spans """
+
+    def __init__(self):
+        self.enabled = False
+        self.events = []
+        self.start_time = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        """ Clears any recorded spans and starts recording """
+        with self._lock:
+            self.events = []
+            self.start_time = time.time()
+            self.enabled = True
+
+    def stop(self):
+        """ Stops recording, keeping the recorded spans for export """
+        self.enabled = False
+
+    @contextmanager
+    def span(self, name, category, **args):
+        """ Records the time spent in the with block as a span """
+        if not self.enabled:
+            yield
+            return
+        start = time.time()
+        try:
+            yield
+        except Exception as e:
+            args['error'] = e.__class__.__name__
+            raise
+        finally:
+            self._add_event(name, category, start, time.time(), args)
+
+    def _add_event(self, name, category, start, end, args):
+        event = {
+            'name': name,
+            'cat': category,
+            'ph': 'X',
+            'ts': int((start - self.start_time) * 1000000),
+            'dur': int((end - start) * 1000000),
+            'pid': os.getpid(),
+            'tid': threading.current_thread().ident,
+            'args': args,
+        }
+        with self._lock:
+            self.events.append(event)
+
+    def get_events(self):
+        """ Returns the recorded events ordered by start time """
+        with self._lock:
+            return sorted(self.events, key=lambda event: event['ts'])
+
+    def to_chrome_trace(self):
+        """ Returns the recorded spans in the Chrome trace_event format """
+        return {
+            'traceEvents': self.get_events(),
+            'displayTimeUnit': 'ms',
+        }
+
+    def write_json(self, f):
+        f.write(json.dumps(self.to_chrome_trace(), sort_keys=True))
+
+    def write_csv(self, f):
+        writer = csv.writer(f)
+        writer.writerow(CSV_COLUMNS)
+        for event in self.get_events():
+            writer.writerow([
+                event['name'],
+                event['cat'],
+                event['ts'],
+                event['dur'],
+                event['tid'],
+                json.dumps(event['args'], sort_keys=True),
+            ])
+
+    def export(self, path):
+        """ Writes the recorded spans to path, as CSV if the path ends in
+        .csv and as Chrome trace_event JSON otherwise """
+        if path.lower().endswith('.csv'):
+            with open(path, 'wb') as f:
+                self.write_csv(f)
+        else:
+            with open(path, 'w') as f:
+                self.write_json(f)
+
+
+TRACER = Tracer()
+
+
+def span(name, category, **args):
+    """ Records a span on the module level TRACER """
+    return TRACER.span(name, category, **args)
+
+
+class TracedSession(requests.Session):
+    """ requests Session which records a span for each request """
+
+    def __init__(self, category='rest'):
+        super(TracedSession, self).__init__()
+        self.category = category
+
+    def request(self, method, url, *args, **kwargs):
+        name = '{} {}'.format(method.upper(), url.split('?')[0])
+        with span(name, self.category):
+            return super(TracedSession, self).request(
+                method, url, *args, **kwargs
+            )
@@ -0,0 +1,105 @@
+'''
+Lookup of the versions of the packages installed in an org
+
+A single Tooling API query on InstalledSubscriberPackage replaces the
+Metadata API retrieve of InstalledPackage components, which is kept as a
+fallback.  The result is cached on the OrgConfig so the steps of a flow
+share a single lookup.
+'''
+
+from __future__ import unicode_literals
+from distutils.version import LooseVersion
+
+from simple_salesforce import Salesforce
+
+from cumulusci.core.trace import TracedSession
+from cumulusci.salesforce_api.metadata import ApiRetrieveInstalledPackages
+
+# InstalledSubscriberPackage was added to the Tooling API in version 41.0
+INSTALLED_PACKAGES_API_VERSION = '41.0'
+
+INSTALLED_PACKAGES_QUERY = (
+    'SELECT SubscriberPackage.NamespacePrefix,' +
+    ' SubscriberPackageVersion.MajorVersion,' +
+    ' SubscriberPackageVersion.MinorVersion,' +
+    ' SubscriberPackageVersion.PatchVersion,' +
+    ' SubscriberPackageVersion.BuildNumber,' +
+    ' SubscriberPackageVersion.IsBeta' +
+    ' FROM InstalledSubscriberPackage'
+)
+
+
+def get_installed_packages(task, refresh=False):
+    """ Returns a dict of namespace to installed version for the packages
+    installed in the task's org
+
+    Versions are formatted like the versionNumber of an InstalledPackage,
+    for example 1.2 or 1.2 (Beta 3).  The result is cached on the org config
+    until refresh is True or reset_installed_packages is called.
+    """
+    org_config = task.org_config
+    if not refresh and org_config.installed_packages is not None:
+        return dict(org_config.installed_packages)
+
+    task.logger.info('Retrieving list of packages from target org')
+    try:
+        packages = query_installed_packages(task)
+    except Exception as e:
+        task.logger.warning(
+            'Could not query InstalledSubscriberPackage ({}: {}), retrieving InstalledPackage metadata instead'.format(
+                e.__class__.__name__,
+                e,
+            )
+        )
+        packages = ApiRetrieveInstalledPackages(task)()
+
+    org_config.installed_packages = packages
+    return dict(packages)
+
+
+def reset_installed_packages(org_config):
+    """ Clears the cached installed packages after packages are installed or
+    uninstalled """
+    org_config.installed_packages = None
+
+
+def query_installed_packages(task):
+    """ Queries the Tooling API for the installed packages with a namespace """
+    tooling = _get_tooling_api(task)
+    packages = {}
+    for record in tooling.query_all(INSTALLED_PACKAGES_QUERY)['records']:
+        namespace = (record.get('SubscriberPackage') or {}).get('NamespacePrefix')
+        version = record.get('SubscriberPackageVersion')
+        if not namespace or not version:
+            continue
+        packages[namespace] = format_package_version(version)
+    return packages
+
+
+def format_package_version(version):
+    """ Formats a SubscriberPackageVersion like an InstalledPackage
+    versionNumber """
+    version_number = '{}.{}'.format(
+        version['MajorVersion'],
+        version['MinorVersion'],
+    )
+    if version.get('PatchVersion'):
+        version_number += '.{}'.format(version['PatchVersion'])
+    if version.get('IsBeta'):
+        version_number += ' (Beta {})'.format(version['BuildNumber'])
+    return version_number
+
+
+def _get_tooling_api(task):
+    api_version = task.project_config.project__package__api_version
+    if (not api_version or
+            LooseVersion(str(api_version)) < LooseVersion(INSTALLED_PACKAGES_API_VERSION)):
+        api_version = INSTALLED_PACKAGES_API_VERSION
+    tooling = Salesforce(
+        instance=task.org_config.instance_url.replace('https://', ''),
+        session_id=task.org_config.access_token,
+        version=api_version,
+        session=TracedSession(),
+    )
+    tooling.base_url += 'tooling/'
+    return tooling
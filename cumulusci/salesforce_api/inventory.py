@@ -0,0 +1,238 @@
+'''
+Local index of the metadata in an org built from listMetadata calls
+
+The index is stored in a SQLite database per org so tasks can look up what
+is in an org without retrieving metadata.  Each (type, folder) pair is
+refreshed with a single listMetadata call and only rows which were added,
+removed, or have a new lastModifiedDate are written back to the index.
+listMetadata can't filter by lastModifiedDate so a refresh always lists
+every requested type and folder; use max_age to skip recently refreshed
+types.
+'''
+
+from __future__ import unicode_literals
+import os
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+from sqlalchemy import and_
+from sqlalchemy import Column
+from sqlalchemy import create_engine
+from sqlalchemy import Float
+from sqlalchemy import MetaData
+from sqlalchemy import String
+from sqlalchemy import Table
+
+from cumulusci.salesforce_api.metadata import ApiListMetadata
+
+
+def list_metadata(task, queries, api_version=None, max_workers=None):
+    """ Runs a listMetadata call for each (type, folder) pair in queries
+    concurrently and returns the list of components for each pair """
+    def list_components(query):
+        md_type, folder = query
+        api = ApiListMetadata(
+            task,
+            md_type,
+            folder=folder,
+            as_of_version=api_version,
+        )
+        return api().get(md_type, [])
+
+    executor = ThreadPoolExecutor(max_workers=max_workers or 4)
+    try:
+        return list(executor.map(list_components, queries))
+    finally:
+        executor.shutdown()
+
+
+class OrgMetadataInventory(object):
+    """ Stores listMetadata results for an org in a local SQLite database
+
+    refresh() updates the index for a list of metadata types and the query
+    methods read from the index without calling the org.
+    """
+
+    # The listMetadata fields stored for each component
+    fields = [
+        'fullName',
+        'type',
+        'fileName',
+        'id',
+        'lastModifiedDate',
+        'manageableState',
+        'namespacePrefix',
+    ]
+
+    def __init__(self, task, path=None, api_version=None, max_workers=None):
+        self.task = task
+        self.logger = task.logger
+        self.api_version = api_version
+        self.max_workers = max_workers if max_workers else 4
+        if path is None:
+            path = self._get_default_path()
+        self.path = path
+        self._init_db()
+
+    def _get_default_path(self):
+        inventory_dir = os.path.join(
+            self.task.project_config.project_local_dir,
+            'org_inventory',
+        )
+        if not os.path.isdir(inventory_dir):
+            os.makedirs(inventory_dir)
+        return os.path.join(
+            inventory_dir,
+            '{}.db'.format(self.task.org_config.org_id),
+        )
+
+    def _init_db(self):
+        self.engine = create_engine('sqlite:///{}'.format(self.path))
+        self.metadata = MetaData()
+        self.components = Table(
+            'components',
+            self.metadata,
+            Column('type', String(255), primary_key=True),
+            Column('fullName', String(255), primary_key=True),
+            Column('folder', String(255), nullable=False, default=''),
+            Column('fileName', String(255)),
+            Column('id', String(18)),
+            Column('lastModifiedDate', String(30)),
+            Column('manageableState', String(30)),
+            Column('namespacePrefix', String(15)),
+        )
+        self.refreshes = Table(
+            'refreshes',
+            self.metadata,
+            Column('type', String(255), primary_key=True),
+            Column('folder', String(255), primary_key=True),
+            Column('refreshed', Float),
+        )
+        self.metadata.create_all(self.engine)
+
+    def refresh(self, types, folders=None, max_age=None):
+        """ Refresh the index for the listed metadata types
+
+        folders is a dict of type to a list of folder names for folder based
+        types like Report and Dashboard.  If max_age is set, types refreshed
+        less than max_age seconds ago are not listed again.  Returns the
+        number of components added, updated, and deleted in the index.
+        """
+        if folders is None:
+            folders = {}
+        queries = []
+        for md_type in types:
+            for folder in folders.get(md_type, [None]):
+                if max_age is not None and self._is_fresh(md_type, folder, max_age):
+                    continue
+                queries.append((md_type, folder))
+        if not queries:
+            return {'added': 0, 'updated': 0, 'deleted': 0}
+
+        results = list_metadata(
+            self.task,
+            queries,
+            api_version=self.api_version,
+            max_workers=self.max_workers,
+        )
+
+        counts = {'added': 0, 'updated': 0, 'deleted': 0}
+        with self.engine.begin() as conn:
+            for (md_type, folder), components in zip(queries, results):
+                changes = self._update_components(conn, md_type, folder, components)
+                for key, value in changes.items():
+                    counts[key] += value
+        self.logger.info(
+            'Org inventory updated: {added} added, {updated} updated, {deleted} deleted'.format(**counts)
+        )
+        return counts
+
+    def _is_fresh(self, md_type, folder, max_age):
+        row = self.engine.execute(self.refreshes.select().where(and_(
+            self.refreshes.c.type == md_type,
+            self.refreshes.c.folder == (folder or ''),
+        ))).first()
+        return row is not None and time.time() - row['refreshed'] < max_age
+
+    def _update_components(self, conn, md_type, folder, components):
+        folder = folder or ''
+        existing = {}
+        for row in conn.execute(self.components.select().where(and_(
+            self.components.c.type == md_type,
+            self.components.c.folder == folder,
+        ))):
+            existing[row['fullName']] = row['lastModifiedDate']
+
+        inserts = []
+        updates = []
+        seen = set()
+        for component in components:
+            full_name = component['fullName']
+            if not full_name or full_name in seen:
+                continue
+            seen.add(full_name)
+            values = dict((field, component.get(field)) for field in self.fields)
+            values['type'] = md_type
+            values['folder'] = folder
+            if full_name not in existing:
+                inserts.append(values)
+            elif existing[full_name] != values['lastModifiedDate']:
+                updates.append(values)
+
+        deletes = set(existing) - seen
+
+        if inserts:
+            conn.execute(self.components.insert(), inserts)
+        for values in updates:
+            conn.execute(self.components.update().where(and_(
+                self.components.c.type == md_type,
+                self.components.c.fullName == values['fullName'],
+            )).values(**values))
+        for full_name in deletes:
+            conn.execute(self.components.delete().where(and_(
+                self.components.c.type == md_type,
+                self.components.c.fullName == full_name,
+            )))
+
+        conn.execute(self.refreshes.delete().where(and_(
+            self.refreshes.c.type == md_type,
+            self.refreshes.c.folder == folder,
+        )))
+        conn.execute(self.refreshes.insert().values(
+            type=md_type,
+            folder=folder,
+            refreshed=time.time(),
+        ))
+        return {
+            'added': len(inserts),
+            'updated': len(updates),
+            'deleted': len(deletes),
+        }
+
+    def query(self, types=None, folders=None, namespace=None, manageable_states=None, modified_since=None):
+        """ Returns a list of component dicts from the index matching the
+        filters.  modified_since is an ISO 8601 datetime string. """
+        components = self.components
+        query = components.select()
+        if types:
+            query = query.where(components.c.type.in_(types))
+        if folders:
+            query = query.where(components.c.folder.in_(folders))
+        if namespace is not None:
+            query = query.where(components.c.namespacePrefix == namespace)
+        if manageable_states:
+            query = query.where(components.c.manageableState.in_(manageable_states))
+        if modified_since:
+            query = query.where(components.c.lastModifiedDate > modified_since)
+        query = query.order_by(components.c.type, components.c.fullName)
+        return [dict(row) for row in self.engine.execute(query)]
+
+    def get_members(self, **kwargs):
+        """ Returns a dict of type to sorted member names matching the query()
+        filters in the format used by package_xml_from_dict """
+        members = {}
+        for component in self.query(**kwargs):
+            members.setdefault(component['type'], []).append(
+                component['fullName']
+            )
+        return members
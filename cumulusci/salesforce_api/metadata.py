@@ -11,19 +11,23 @@ based on mrbelvedere/mpinstaller/mdapi.py
 
 from __future__ import unicode_literals
 import base64
+import datetime
 # import dateutil.parser
 import httplib
 import re
+import threading
 import time
 from xml.dom.minidom import parseString
 from xml.sax.saxutils import escape
 from zipfile import ZipFile
 import StringIO
 
+from concurrent.futures import ThreadPoolExecutor
 import requests
 
 from cumulusci.salesforce_api import soap_envelopes
 from cumulusci.core.exceptions import ApexTestException
+from cumulusci.core.trace import span
 from cumulusci.utils import zip_subfolder
 from cumulusci.salesforce_api.exceptions import MetadataComponentFailure
 from cumulusci.salesforce_api.exceptions import MetadataApiError
@@ -54,6 +58,15 @@ class BaseMetadataApiCall(object):
         if self.status != 'Failed':
             return self._process_response(response)
 
+    def start(self):
+        """ Start the call without waiting for it to complete.
+
+        Returns a MetadataApiCallHandle which can be used to poll or wait for
+        the result of the call. """
+        self.task.logger.info('Pending')
+        response = self._start_call()
+        return MetadataApiCallHandle(self, response)
+
     def _build_endpoint_url(self):
         # Parse org id from id which ends in /ORGID/USERID
         org_id = self.task.org_config.org_id
@@ -104,8 +117,10 @@ class BaseMetadataApiCall(object):
         # Insert the session id
         session_id = self.task.org_config.access_token
         auth_envelope = envelope.replace('###SESSION_ID###', session_id)
-        response = requests.post(self._build_endpoint_url(
-        ), headers=headers, data=auth_envelope)
+        with span(headers.get('SOAPAction', ''), 'metadata',
+                  api_call=self.__class__.__name__):
+            response = requests.post(self._build_endpoint_url(
+            ), headers=headers, data=auth_envelope)
         faultcode = parseString(
             response.content).getElementsByTagName('faultcode')
         # refresh = False can be passed to prevent a loop if refresh fails
@@ -124,46 +139,53 @@ class BaseMetadataApiCall(object):
         return self.check_interval * ((self.check_num / 3) + 1)
 
     def _get_response(self):
+        response = self._start_call()
+        # If no status envelope is configured, return the response directly
+        if not self.soap_envelope_status:
+            return response
+        # Check the status in a loop until done
+        while self.status not in ['Done', 'Failed']:
+            response = self._check_status()
+
+            # start increasing the check interval progressively to handle long pending jobs
+            check_interval = self._get_check_interval()
+            self.check_num += 1
+
+            time.sleep(check_interval)
+        return self._get_result(response)
+
+    def _start_call(self):
         if not self.soap_envelope_start:
             raise NotImplementedError('No soap_start template was provided')
         # Start the call
         envelope = self._build_envelope_start()
-        envelope = envelope.encode('utf-8')
+        if not isinstance(envelope, StreamingSoapEnvelope):
+            envelope = envelope.encode('utf-8')
         headers = self._build_headers(self.soap_action_start, envelope)
         response = self._call_mdapi(headers, envelope)
-        # If no status envelope is configured, return the response directly
-        if not self.soap_envelope_status:
-            return response
-        # Process the response to set self.process_id with the process id
-        # started
-        response = self._process_response_start(response)
-        # Check the status if configured
         if self.soap_envelope_status:
-            while self.status not in ['Done', 'Failed']:
-                # Check status in a loop until done
-                envelope = self._build_envelope_status()
-                envelope = envelope.encode('utf-8')
-                headers = self._build_headers(
-                    self.soap_action_status, envelope)
-                response = self._call_mdapi(headers, envelope)
-                response = self._process_response_status(response)
-
-                # start increasing the check interval progressively to handle long pending jobs
-                check_interval = self._get_check_interval()
-                self.check_num += 1
-
-                time.sleep(check_interval)
-            # Fetch the final result and return
-            if self.soap_envelope_result:
-                envelope = self._build_envelope_result()
-                envelope = envelope.encode('utf-8')
-                headers = self._build_headers(
-                    self.soap_action_result, envelope)
-                response = self._call_mdapi(headers, envelope)
-            else:
-                return response
+            # Process the response to set self.process_id with the process id
+            # started
+            response = self._process_response_start(response)
         return response
 
+    def _check_status(self):
+        envelope = self._build_envelope_status()
+        envelope = envelope.encode('utf-8')
+        headers = self._build_headers(self.soap_action_status, envelope)
+        response = self._call_mdapi(headers, envelope)
+        return self._process_response_status(response)
+
+    def _get_result(self, response):
+        # Fetch the final result if configured, otherwise the last status
+        # response is the result
+        if not self.soap_envelope_result:
+            return response
+        envelope = self._build_envelope_result()
+        envelope = envelope.encode('utf-8')
+        headers = self._build_headers(self.soap_action_result, envelope)
+        return self._call_mdapi(headers, envelope)
+
     def _handle_soap_error(self, headers, envelope, refresh, response):
         faultcode = parseString(
             response.content).getElementsByTagName('faultcode')
@@ -234,6 +256,129 @@ class BaseMetadataApiCall(object):
             logger('[{}]'.format(status))
 
 
+class StreamingSoapEnvelope(object):
+    """ SOAP envelope which streams a zip file into the request as base64
+
+    The envelope is split into the start before the zip content and the end
+    after it.  The zip is read and encoded a chunk at a time when the
+    envelope is iterated or read so the encoded zip is never held in memory.
+    requests sends the envelope with the Content-Length from len().  The
+    envelope can be sent more than once since each iteration starts over
+    from the beginning of the zip file.
+    """
+
+    # A multiple of 3 so each chunk encodes without base64 padding
+    chunk_size = 3 * 64 * 1024
+
+    def __init__(self, start, zip_file, end):
+        self.start = start
+        self.zip_file = zip_file
+        self.end = end
+        self._chunks = None
+        self._buffer = b''
+
+    def replace(self, old, new):
+        return StreamingSoapEnvelope(
+            self.start.replace(old, new),
+            self.zip_file,
+            self.end.replace(old, new),
+        )
+
+    def __len__(self):
+        self.zip_file.seek(0, 2)
+        zip_size = self.zip_file.tell()
+        return len(self.start) + 4 * ((zip_size + 2) // 3) + len(self.end)
+
+    def __iter__(self):
+        yield self.start
+        self.zip_file.seek(0)
+        while True:
+            chunk = self.zip_file.read(self.chunk_size)
+            if not chunk:
+                break
+            yield base64.b64encode(chunk)
+        yield self.end
+
+    def read(self, size=-1):
+        if self._chunks is None:
+            self._chunks = iter(self)
+        while size < 0 or len(self._buffer) < size:
+            try:
+                self._buffer += next(self._chunks)
+            except StopIteration:
+                break
+        if size < 0:
+            size = len(self._buffer)
+        data = self._buffer[:size]
+        self._buffer = self._buffer[size:]
+        return data
+
+
+class MetadataApiCallHandle(object):
+    """ Handle to a Metadata API call started with start()
+
+    poll() checks the status once and returns without blocking, wait() blocks
+    until the call is complete and returns the processed result, and future()
+    runs wait() on an executor so the caller can continue with other work.
+    """
+
+    def __init__(self, api_call, response):
+        self.api_call = api_call
+        self.response = response
+        self.result = None
+        self._complete = False
+        self._lock = threading.Lock()
+
+    @property
+    def process_id(self):
+        return getattr(self.api_call, 'process_id', None)
+
+    @property
+    def status(self):
+        return self.api_call.status
+
+    def done(self):
+        """ Returns True if the call no longer needs to be polled """
+        if self._complete or not self.api_call.soap_envelope_status:
+            return True
+        return self.api_call.status in ['Done', 'Failed']
+
+    def poll(self):
+        """ Check the status of the call once and return done() """
+        with self._lock:
+            if not self.done():
+                self.response = self.api_call._check_status()
+                self.api_call.check_num += 1
+            return self.done()
+
+    def wait(self):
+        """ Block until the call is complete and return the processed result """
+        while not self.poll():
+            time.sleep(self.api_call._get_check_interval())
+        with self._lock:
+            if not self._complete:
+                if self.api_call.soap_envelope_status:
+                    self.response = self.api_call._get_result(self.response)
+                if self.api_call.status != 'Failed':
+                    self.result = self.api_call._process_response(
+                        self.response
+                    )
+                self._complete = True
+        return self.result
+
+    def future(self, executor=None):
+        """ Return a concurrent.futures.Future for the result of wait()
+
+        If no executor is passed, a single use thread is started for the call.
+        """
+        if executor is not None:
+            return executor.submit(self.wait)
+        executor = ThreadPoolExecutor(max_workers=1)
+        future = executor.submit(self.wait)
+        executor.shutdown(wait=False)
+        return future
+
+
 class ApiRetrieveUnpackaged(BaseMetadataApiCall):
     check_interval = 1
     soap_envelope_start = soap_envelopes.RETRIEVE_UNPACKAGED
@@ -339,15 +484,51 @@ class ApiRetrievePackaged(BaseMetadataApiCall):
 class ApiDeploy(BaseMetadataApiCall):
     soap_envelope_start = soap_envelopes.DEPLOY
     soap_envelope_status = soap_envelopes.CHECK_DEPLOY_STATUS
+    soap_envelope_result = soap_envelopes.CHECK_DEPLOY_STATUS
     soap_action_start = 'deploy'
     soap_action_status = 'checkDeployStatus'
+    soap_action_result = 'checkDeployStatus'
+
+    # Numeric DeployResult fields included in progress events
+    progress_fields = [
+        'numberComponentsDeployed',
+        'numberComponentsTotal',
+        'numberComponentErrors',
+        'numberTestsCompleted',
+        'numberTestsTotal',
+        'numberTestErrors',
+    ]
+
+    # Placeholder for the zip content when package_zip is a file
+    package_zip_marker = '###PACKAGE_ZIP###'
 
-    def __init__(self, task, package_zip, purge_on_delete=None, api_version=None):
+    def __init__(
+                self,
+                task,
+                package_zip,
+                purge_on_delete=None,
+                api_version=None,
+                check_only=None,
+                test_level=None,
+                run_tests=None,
+                progress_listeners=None,
+            ):
         super(ApiDeploy, self).__init__(task, api_version)
         if purge_on_delete is None:
             purge_on_delete = True
         self._set_purge_on_delete(purge_on_delete)
+        # Either the base64 encoded zip or a file object containing the zip
+        # which is encoded as it is streamed into the request
         self.package_zip = package_zip
+        self.check_only = 'true' if check_only else 'false'
+        self.test_level = test_level
+        self.run_tests = run_tests if run_tests else []
+        # Callables which are passed each progress event dict
+        self.progress_listeners = [self._log_progress]
+        if progress_listeners:
+            self.progress_listeners.extend(progress_listeners)
+        self.start_time = None
+        self._last_progress = None
 
     def _set_purge_on_delete(self, purge_on_delete):
         if purge_on_delete == False or purge_on_delete == 'false':
@@ -363,13 +544,95 @@ class ApiDeploy(BaseMetadataApiCall):
 
     def _build_envelope_start(self):
         if self.package_zip:
-            return self.soap_envelope_start.format(
-                package_zip = self.package_zip,
+            run_tests = ''.join(
+                '\n        <runTests>{}</runTests>'.format(escape(test))
+                for test in self.run_tests
+            )
+            test_level = ''
+            if self.test_level:
+                test_level = '\n        <testLevel>{}</testLevel>'.format(
+                    self.test_level
+                )
+            streaming = hasattr(self.package_zip, 'read')
+            envelope = self.soap_envelope_start.format(
+                package_zip = (
+                    self.package_zip_marker if streaming else self.package_zip
+                ),
                 purge_on_delete = self.purge_on_delete,
+                check_only = self.check_only,
+                run_tests = run_tests,
+                test_level = test_level,
                 api_version = self.api_version,
             )
+            if streaming:
+                start, end = envelope.encode('utf-8').split(
+                    self.package_zip_marker.encode('utf-8'),
+                )
+                return StreamingSoapEnvelope(start, self.package_zip, end)
+            return envelope
+
+    def _build_envelope_status(self):
+        # Poll without details to keep the status responses small.  The
+        # component and test details are only needed from the final result.
+        return self.soap_envelope_status.format(
+            process_id = self.process_id,
+            include_details = 'false',
+        )
+
+    def _build_envelope_result(self):
+        return self.soap_envelope_result.format(
+            process_id = self.process_id,
+            include_details = 'true',
+        )
+
+    def _start_call(self):
+        self.start_time = time.time()
+        return super(ApiDeploy, self)._start_call()
+
+    def _process_response_status(self, response):
+        response = super(ApiDeploy, self)._process_response_status(response)
+        self._emit_progress('progress', response)
+        return response
+
+    def _emit_progress(self, event_type, response):
+        """ Parse the progress fields from a DeployResult and pass an event
+        dict to each of the progress_listeners """
+        resp_xml = parseString(response.content)
+        if not resp_xml.getElementsByTagName('numberComponentsTotal'):
+            return
+        now = time.time()
+        start_time = now if self.start_time is None else self.start_time
+        event = {
+            'event': event_type,
+            'timestamp': datetime.datetime.utcfromtimestamp(now).isoformat() + 'Z',
+            'elapsed': round(now - start_time, 3),
+            'process_id': getattr(self, 'process_id', None),
+            'status': self._get_element_value(resp_xml, 'status'),
+            'stateDetail': self._get_element_value(resp_xml, 'stateDetail'),
+        }
+        for field in self.progress_fields:
+            value = self._get_element_value(resp_xml, field)
+            event[field] = int(value) if value else 0
+        for listener in self.progress_listeners:
+            listener(event)
+        return event
+
+    def _log_progress(self, event):
+        progress = [event[field] for field in self.progress_fields]
+        if progress == self._last_progress:
+            return
+        self._last_progress = progress
+        message = 'Components: {numberComponentsDeployed}/{numberComponentsTotal} deployed, {numberComponentErrors} errors'.format(**event)
+        if event['elapsed']:
+            message += ' ({:.1f}/s)'.format(
+                event['numberComponentsDeployed'] / float(event['elapsed'])
+            )
+        if event['numberTestsTotal']:
+            message += ', Tests: {numberTestsCompleted}/{numberTestsTotal} completed, {numberTestErrors} errors'.format(**event)
+        self.task.logger.info('[{}]: {}'.format(event['status'], message))
 
     def _process_response(self, response):
+        self._emit_progress('result', response)
         status = parseString(response.content).getElementsByTagName('status')
         if status:
             status = status[0].firstChild.nodeValue
@@ -462,6 +725,34 @@ class ApiDeploy(BaseMetadataApiCall):
             return 'Delete'
         return 'Update'
 
+class ApiDeployRecentValidation(ApiDeploy):
+    """ Quick deploy a validation which recently succeeded with check_only """
+    soap_envelope_start = soap_envelopes.DEPLOY_RECENT_VALIDATION
+    soap_action_start = 'deployRecentValidation'
+
+    def __init__(self, task, validation_id, api_version=None):
+        super(ApiDeployRecentValidation, self).__init__(
+            task,
+            None,
+            api_version=api_version,
+        )
+        self.validation_id = validation_id
+
+    def _build_envelope_start(self):
+        return self.soap_envelope_start.format(
+            validation_id = escape(self.validation_id),
+        )
+
+    def _process_response_start(self, response):
+        if response.status_code == httplib.INTERNAL_SERVER_ERROR:
+            raise MetadataApiError('HTTP ERROR {}: {}'.format(response.status_code, response.content), response)
+        # deployRecentValidation returns the id of the new deployment as the
+        # result element rather than an AsyncResult
+        results = parseString(response.content).getElementsByTagName('result')
+        if results:
+            self.process_id = results[0].firstChild.nodeValue
+        return response
+
 class ApiListMetadata(BaseMetadataApiCall):
     soap_envelope_start = soap_envelopes.LIST_METADATA
     soap_action_start = 'listMetadata'
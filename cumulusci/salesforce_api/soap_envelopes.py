@@ -11,18 +11,32 @@ DEPLOY = '''<?xml version="1.0" encoding="utf-8"?>
       <DeployOptions>
         <allowMissingFiles>false</allowMissingFiles>
         <autoUpdatePackage>false</autoUpdatePackage>
-        <checkOnly>false</checkOnly>
+        <checkOnly>{check_only}</checkOnly>
         <ignoreWarnings>true</ignoreWarnings>
         <performRetrieve>false</performRetrieve>
         <purgeOnDelete>{purge_on_delete}</purgeOnDelete>
         <rollbackOnError>true</rollbackOnError>
-        <runAllTests>false</runAllTests>
-        <singlePackage>true</singlePackage>
+        <runAllTests>false</runAllTests>{run_tests}
+        <singlePackage>true</singlePackage>{test_level}
       </DeployOptions>
     </deploy>
   </soap:Body>
 </soap:Envelope>'''
 
+DEPLOY_RECENT_VALIDATION = '''<?xml version="1.0" encoding="utf-8"?>
+<soap:Envelope xmlns:soap="http://schemas.xmlsoap.org/soap/envelope/" xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance" xmlns:xsd="http://www.w3.org/2001/XMLSchema">
+  <soap:Header>
+    <SessionHeader xmlns="http://soap.sforce.com/2006/04/metadata">
+      <sessionId>###SESSION_ID###</sessionId>
+    </SessionHeader>
+  </soap:Header>
+  <soap:Body>
+    <deployRecentValidation xmlns="http://soap.sforce.com/2006/04/metadata">
+      <validationId>{validation_id}</validationId>
+    </deployRecentValidation>
+  </soap:Body>
+</soap:Envelope>'''
+
 CHECK_DEPLOY_STATUS = '''<?xml version="1.0" encoding="utf-8"?>
 <soap:Envelope xmlns:soap="http://schemas.xmlsoap.org/soap/envelope/" xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance" xmlns:xsd="http://www.w3.org/2001/XMLSchema">
   <soap:Header>
@@ -33,7 +47,7 @@ CHECK_DEPLOY_STATUS = '''<?xml version="1.0" encoding="utf-8"?>
   <soap:Body>
     <checkDeployStatus xmlns="http://soap.sforce.com/2006/04/metadata">
       <asyncProcessId>{process_id}</asyncProcessId>
-      <includeDetails>true</includeDetails>
+      <includeDetails>{include_details}</includeDetails>
     </checkDeployStatus>
   </soap:Body>
 </soap:Envelope>'''
@@ -0,0 +1,97 @@
+import unittest
+
+import mock
+import responses
+
+from cumulusci.core.config import TaskConfig
+from cumulusci.core.tasks import BaseTask
+from cumulusci.salesforce_api.installed_packages import get_installed_packages
+from cumulusci.salesforce_api.installed_packages import reset_installed_packages
+from cumulusci.tests.util import create_project_config
+from cumulusci.tests.util import DummyOrgConfig
+
+
+def _package(namespace, major, minor, patch=0, build=1, beta=False):
+    return {
+        'SubscriberPackage': {'NamespacePrefix': namespace},
+        'SubscriberPackageVersion': {
+            'MajorVersion': major,
+            'MinorVersion': minor,
+            'PatchVersion': patch,
+            'BuildNumber': build,
+            'IsBeta': beta,
+        },
+    }
+
+
+class TestGetInstalledPackages(unittest.TestCase):
+
+    def setUp(self):
+        self.project_config = create_project_config('TestRepo', 'TestOwner')
+        self.project_config.config['project']['package']['api_version'] = '40.0'
+        self.org_config = DummyOrgConfig({
+            'instance_url': 'https://example.com',
+            'access_token': 'abc123',
+        })
+        self.task = BaseTask(
+            self.project_config,
+            TaskConfig({}),
+            self.org_config,
+        )
+        self.query_url = 'https://example.com/services/data/v41.0/tooling/query/'
+
+    def _add_query_response(self, records):
+        responses.add(
+            method=responses.GET,
+            url=self.query_url,
+            json={
+                'done': True,
+                'totalSize': len(records),
+                'records': records,
+            },
+        )
+
+    @responses.activate
+    def test_query(self):
+        self._add_query_response([
+            _package('foo', 1, 2),
+            _package('bar', 2, 0, patch=1),
+            _package('baz', 1, 3, build=4, beta=True),
+            _package(None, 1, 0),
+        ])
+        installed = get_installed_packages(self.task)
+        self.assertEqual({
+            'foo': '1.2',
+            'bar': '2.0.1',
+            'baz': '1.3 (Beta 4)',
+        }, installed)
+
+    @responses.activate
+    def test_cached(self):
+        self._add_query_response([_package('foo', 1, 2)])
+        get_installed_packages(self.task)
+        installed = get_installed_packages(self.task)
+        self.assertEqual({'foo': '1.2'}, installed)
+        self.assertEqual(1, len(responses.calls))
+
+        reset_installed_packages(self.org_config)
+        installed = get_installed_packages(self.task)
+        self.assertEqual({'foo': '1.2'}, installed)
+        self.assertEqual(2, len(responses.calls))
+
+    @responses.activate
+    @mock.patch('cumulusci.salesforce_api.installed_packages.ApiRetrieveInstalledPackages')
+    def test_fallback(self, ApiRetrieveInstalledPackages):
+        responses.add(
+            method=responses.GET,
+            url=self.query_url,
+            status=400,
+            json=[{
+                'errorCode': 'INVALID_TYPE',
+                'message': 'sObject type InstalledSubscriberPackage is not supported',
+            }],
+        )
+        ApiRetrieveInstalledPackages.return_value.return_value = {'foo': '1.2'}
+        installed = get_installed_packages(self.task)
+        self.assertEqual({'foo': '1.2'}, installed)
+        self.assertEqual({'foo': '1.2'}, self.org_config.installed_packages)
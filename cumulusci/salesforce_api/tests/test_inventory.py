@@ -0,0 +1,126 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import mock
+
+from cumulusci.core.config import TaskConfig
+from cumulusci.core.tasks import BaseTask
+from cumulusci.salesforce_api.inventory import OrgMetadataInventory
+from cumulusci.tests.util import create_project_config
+from cumulusci.tests.util import DummyOrgConfig
+
+
+def _component(md_type, full_name, modified, state='unmanaged', namespace=None):
+    return {
+        'type': md_type,
+        'fullName': full_name,
+        'fileName': None,
+        'id': None,
+        'lastModifiedDate': modified,
+        'manageableState': state,
+        'namespacePrefix': namespace,
+    }
+
+
+class TestOrgMetadataInventory(unittest.TestCase):
+
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.project_config = create_project_config('TestRepo', 'TestOwner')
+        self.task = BaseTask(
+            self.project_config,
+            TaskConfig({}),
+            DummyOrgConfig({}),
+        )
+        self.listed = {}
+        self.inventory = OrgMetadataInventory(
+            self.task,
+            path=os.path.join(self.tempdir, 'inventory.db'),
+        )
+        patcher = mock.patch(
+            'cumulusci.salesforce_api.inventory.ApiListMetadata',
+            side_effect=self._api_list_metadata,
+        )
+        self.list_metadata = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+
+    def _api_list_metadata(self, task, md_type, folder=None, as_of_version=None):
+        return mock.Mock(return_value={
+            md_type: self.listed[(md_type, folder)],
+        })
+
+    def test_refresh(self):
+        self.listed[('ApexClass', None)] = [
+            _component('ApexClass', 'Foo', '2018-01-01T00:00:00.000Z'),
+            _component('ApexClass', 'Bar', '2018-01-02T00:00:00.000Z'),
+        ]
+        counts = self.inventory.refresh(['ApexClass'])
+        self.assertEqual({'added': 2, 'updated': 0, 'deleted': 0}, counts)
+        self.assertEqual(
+            {'ApexClass': ['Bar', 'Foo']},
+            self.inventory.get_members(),
+        )
+
+    def test_refresh_incremental(self):
+        self.listed[('ApexClass', None)] = [
+            _component('ApexClass', 'Foo', '2018-01-01T00:00:00.000Z'),
+            _component('ApexClass', 'Bar', '2018-01-02T00:00:00.000Z'),
+        ]
+        self.inventory.refresh(['ApexClass'])
+        self.listed[('ApexClass', None)] = [
+            _component('ApexClass', 'Foo', '2018-01-03T00:00:00.000Z'),
+            _component('ApexClass', 'Baz', '2018-01-01T00:00:00.000Z'),
+        ]
+        counts = self.inventory.refresh(['ApexClass'])
+        self.assertEqual({'added': 1, 'updated': 1, 'deleted': 1}, counts)
+        self.assertEqual(
+            {'ApexClass': ['Baz', 'Foo']},
+            self.inventory.get_members(),
+        )
+        self.assertEqual(
+            ['Foo'],
+            [c['fullName'] for c in self.inventory.query(
+                modified_since='2018-01-02T00:00:00.000Z',
+            )],
+        )
+
+    def test_refresh_max_age(self):
+        self.listed[('ApexClass', None)] = []
+        self.inventory.refresh(['ApexClass'])
+        self.inventory.refresh(['ApexClass'], max_age=3600)
+        self.assertEqual(1, self.list_metadata.call_count)
+
+    def test_refresh_folders(self):
+        self.listed[('Report', 'Sales')] = [
+            _component('Report', 'Sales/Pipeline', '2018-01-01T00:00:00.000Z'),
+        ]
+        self.listed[('Report', 'Service')] = [
+            _component('Report', 'Service/Cases', '2018-01-01T00:00:00.000Z'),
+        ]
+        self.inventory.refresh(
+            ['Report'],
+            folders={'Report': ['Sales', 'Service']},
+        )
+        self.assertEqual(
+            {'Report': ['Sales/Pipeline']},
+            self.inventory.get_members(folders=['Sales']),
+        )
+
+    def test_query_managed(self):
+        self.listed[('CustomObject', None)] = [
+            _component('CustomObject', 'ns__Foo__c', '2018-01-01T00:00:00.000Z', 'beta', 'ns'),
+            _component('CustomObject', 'Bar__c', '2018-01-01T00:00:00.000Z'),
+        ]
+        self.inventory.refresh(['CustomObject'])
+        self.assertEqual(
+            {'CustomObject': ['ns__Foo__c']},
+            self.inventory.get_members(
+                namespace='ns',
+                manageable_states=['beta', 'released'],
+            ),
+        )
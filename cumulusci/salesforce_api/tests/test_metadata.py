@@ -1,4 +1,6 @@
+import base64
 import httplib
+import io
 import unittest
 
 from xml.dom.minidom import parseString
@@ -16,14 +18,17 @@ from cumulusci.salesforce_api.exceptions import MetadataApiError
 from cumulusci.salesforce_api.exceptions import MetadataComponentFailure
 from cumulusci.salesforce_api.metadata import BaseMetadataApiCall
 from cumulusci.salesforce_api.metadata import ApiDeploy
+from cumulusci.salesforce_api.metadata import ApiDeployRecentValidation
 from cumulusci.salesforce_api.metadata import ApiListMetadata
 from cumulusci.salesforce_api.metadata import ApiRetrieveUnpackaged
 from cumulusci.salesforce_api.metadata import ApiRetrieveInstalledPackages
 from cumulusci.salesforce_api.metadata import ApiRetrievePackaged
+from cumulusci.salesforce_api.metadata import StreamingSoapEnvelope
 from cumulusci.salesforce_api.package_zip import BasePackageZipBuilder
 from cumulusci.salesforce_api.package_zip import CreatePackageZipBuilder
 from cumulusci.salesforce_api.package_zip import InstallPackageZipBuilder
 from cumulusci.salesforce_api.tests.metadata_test_strings import deploy_status_envelope
+from cumulusci.salesforce_api.tests.metadata_test_strings import deploy_result_envelope
 from cumulusci.salesforce_api.tests.metadata_test_strings import deploy_result
 from cumulusci.salesforce_api.tests.metadata_test_strings import deploy_result_failure
 from cumulusci.salesforce_api.tests.metadata_test_strings import list_metadata_start_envelope
@@ -44,6 +49,7 @@ class DummyPackageZipBuilder(BasePackageZipBuilder):
 class BaseTestMetadataApi(unittest.TestCase):
     api_class = BaseMetadataApiCall
     envelope_start = None
+    response_start = '<?xml version="1.0" encoding="UTF-8"?><id>1234567890</id>'
     envelope_status = status_envelope
     envelope_result = result_envelope
 
@@ -250,7 +256,7 @@ class BaseTestMetadataApi(unittest.TestCase):
         if not self.api_class.soap_envelope_result:
             api.soap_envelope_result = '{process_id}'
 
-        response = '<?xml version="1.0" encoding="UTF-8"?><id>1234567890</id>'
+        response = self.response_start
         self._mock_call_mdapi(api, response)
         response_status = '<?xml version="1.0" encoding="UTF-8"?><done>true</done>'
         self._mock_call_mdapi(api, response_status)
@@ -270,7 +276,70 @@ class BaseTestMetadataApi(unittest.TestCase):
 
     def _response_call_success_result(self, response_result):
         return response_result
-        
+
+    def _assert_call_success_result(self, resp, response_result):
+        self.assertEquals(
+            resp,
+            self._expected_call_success_result(response_result),
+        )
+
+    def _mock_start_success(self, api, done_after=1):
+        if not self.api_class.soap_envelope_start:
+            api.soap_envelope_start = '{api_version}'
+        if not self.api_class.soap_envelope_status:
+            api.soap_envelope_status = '{process_id}'
+        if not self.api_class.soap_envelope_result:
+            api.soap_envelope_result = '{process_id}'
+        api.check_interval = 0
+
+        self._mock_call_mdapi(api, self.response_start)
+        for i in range(done_after - 1):
+            response_status = '<?xml version="1.0" encoding="UTF-8"?><done>false</done>'
+            self._mock_call_mdapi(api, response_status)
+        response_status = '<?xml version="1.0" encoding="UTF-8"?><done>true</done>'
+        self._mock_call_mdapi(api, response_status)
+        response_result = '<?xml version="1.0" encoding="UTF-8"?><foo>bar</foo>'
+        response_result = self._response_call_success_result(response_result)
+        self._mock_call_mdapi(api, response_result)
+        return response_result
+
+    @responses.activate
+    def test_start_poll_wait(self):
+        org_config = {
+            'instance_url': 'https://na12.salesforce.com',
+            'id': 'https://login.salesforce.com/id/00D000000000000ABC/005000000000000ABC',
+            'access_token': '0123456789',
+        }
+        task = self._create_task(org_config=org_config)
+        api = self._create_instance(task)
+        response_result = self._mock_start_success(api, done_after=2)
+
+        handle = api.start()
+        self.assertEquals(handle.process_id, '1234567890')
+        self.assertFalse(handle.done())
+        self.assertFalse(handle.poll())
+        resp = handle.wait()
+
+        self.assertTrue(handle.done())
+        self._assert_call_success_result(resp, response_result)
+        # A second wait returns the same result without calling the api again
+        self.assertIs(handle.wait(), resp)
+
+    @responses.activate
+    def test_start_future(self):
+        org_config = {
+            'instance_url': 'https://na12.salesforce.com',
+            'id': 'https://login.salesforce.com/id/00D000000000000ABC/005000000000000ABC',
+            'access_token': '0123456789',
+        }
+        task = self._create_task(org_config=org_config)
+        api = self._create_instance(task)
+        response_result = self._mock_start_success(api)
+
+        future = api.start().future()
+
+        self._assert_call_success_result(future.result(), response_result)
+
 
     def test_get_element_value(self):
         task = self._create_task()
@@ -385,9 +454,7 @@ class BaseTestMetadataApi(unittest.TestCase):
             api.soap_envelope_status = '{process_id}'
 
         mock_responses = []
-        mock_responses.append(
-            '<?xml version="1.0" encoding="UTF-8"?><id>123</id>'
-        )
+        mock_responses.append(self.response_start)
         mock_responses.append(
             '<?xml version="1.0" encoding="UTF-8"?><faultcode>sf:INVALID_SESSION_ID</faultcode>'
         )
@@ -440,7 +507,7 @@ class BaseTestMetadataApi(unittest.TestCase):
         if not self.api_class.soap_envelope_status:
             api.soap_envelope_status = '{process_id}'
 
-        response = '<?xml version="1.0" encoding="UTF-8"?><id>1234567890</id>'
+        response = self.response_start
         self._mock_call_mdapi(api, response)
         response_status = '<?xml version="1.0" encoding="UTF-8"?><foo>status</foo>'
         self._mock_call_mdapi(api, response, status_code)
@@ -463,7 +530,7 @@ class BaseTestMetadataApi(unittest.TestCase):
         if not self.api_class.soap_envelope_status:
             api.soap_envelope_status = '{process_id}'
 
-        response = '<?xml version="1.0" encoding="UTF-8"?><id>1234567890</id>'
+        response = self.response_start
         self._mock_call_mdapi(api, response)
         response_status = '<?xml version="1.0" encoding="UTF-8"?><foo>status</foo>'
         self._mock_call_mdapi(api, response, status_code)
@@ -487,7 +554,7 @@ class BaseTestMetadataApi(unittest.TestCase):
         if not self.api_class.soap_envelope_result:
             api.soap_envelope_result = '{process_id}'
 
-        response = '<?xml version="1.0" encoding="UTF-8"?><id>1234567890</id>'
+        response = self.response_start
         self._mock_call_mdapi(api, response)
         response_status = '<?xml version="1.0" encoding="UTF-8"?><done>true</done>'
         self._mock_call_mdapi(api, response_status)
@@ -519,7 +586,7 @@ class BaseTestMetadataApi(unittest.TestCase):
             api.soap_envelope_result = '{process_id}'
         api.check_interval = 0
 
-        response = '<?xml version="1.0" encoding="UTF-8"?><id>1234567890</id>'
+        response = self.response_start
         self._mock_call_mdapi(api, response)
         response_status = '<?xml version="1.0" encoding="UTF-8"?><done>false</done>'
         self._mock_call_mdapi(api, response_status)
@@ -681,19 +748,11 @@ class TestBaseMetadataApiCall(BaseTestMetadataApi):
             response
         )
 
-class TestApiDeploy(BaseTestMetadataApi):
-    api_class = ApiDeploy
+class ApiDeployTests(object):
+    """ Tests of the deploy status and result processing shared by the
+    ApiDeploy and ApiDeployRecentValidation tests """
     envelope_status = deploy_status_envelope
-
-    def setUp(self):
-        super(TestApiDeploy, self).setUp()
-        self.package_zip = DummyPackageZipBuilder()()
-
-    def _expected_envelope_start(self):
-        return self.envelope_start.format(
-            package_zip = self.package_zip,
-            purge_on_delete = 'true',
-        )
+    envelope_result = deploy_result_envelope
 
     def _response_call_success_result(self, response_result):
         return deploy_result.format(
@@ -704,19 +763,6 @@ class TestApiDeploy(BaseTestMetadataApi):
     def _expected_call_success_result(self, response_result):
         return 'Success'
 
-    def _create_instance(self, task, api_version=None, purge_on_delete=None):
-        return self.api_class(
-            task,
-            self.package_zip,
-            api_version=api_version,
-            purge_on_delete=purge_on_delete,
-        )
-
-    def test_init_no_purge_on_delete(self):
-        task = self._create_task()
-        api = self._create_instance(task, purge_on_delete=False)
-        self.assertEqual(api.purge_on_delete, 'false')
-
     def test_process_response_metadata_failure(self):
         task = self._create_task()
         api = self._create_instance(task)
@@ -794,6 +840,49 @@ class TestApiDeploy(BaseTestMetadataApi):
             status = api._process_response(response)
         self.assertEqual(response.content, str(cm.exception))
 
+    def test_process_response_status_progress(self):
+        task = self._create_task()
+        api = self._create_instance(task)
+        events = []
+        api.progress_listeners.append(events.append)
+        api.process_id = '123'
+        api.start_time = 0
+        response = DummyResponse()
+        response.status_code = 200
+        response.content = deploy_result.format(
+            status = 'InProgress',
+            extra = '''  <done>false</done>
+  <numberComponentsDeployed>10</numberComponentsDeployed>
+  <numberComponentsTotal>20</numberComponentsTotal>
+  <numberComponentErrors>1</numberComponentErrors>
+  <numberTestsCompleted>0</numberTestsCompleted>
+  <numberTestsTotal>0</numberTestsTotal>
+  <numberTestErrors>0</numberTestErrors>
+''',
+        )
+        api._process_response_status(response)
+        self.assertEqual(1, len(events))
+        event = events[0]
+        self.assertEqual('progress', event['event'])
+        self.assertEqual('123', event['process_id'])
+        self.assertEqual('InProgress', event['status'])
+        self.assertEqual(10, event['numberComponentsDeployed'])
+        self.assertEqual(20, event['numberComponentsTotal'])
+        self.assertEqual(1, event['numberComponentErrors'])
+        self.assertTrue(event['timestamp'].endswith('Z'))
+        self.assertGreater(event['elapsed'], 0)
+
+    def test_process_response_status_no_progress(self):
+        task = self._create_task()
+        api = self._create_instance(task)
+        events = []
+        api.progress_listeners.append(events.append)
+        response = DummyResponse()
+        response.status_code = 200
+        response.content = '<?xml version="1.0" encoding="UTF-8"?><done>false</done>'
+        api._process_response_status(response)
+        self.assertEqual([], events)
+
     def test_get_action(self):
         task = self._create_task()
         api = self._create_instance(task)
@@ -801,6 +890,107 @@ class TestApiDeploy(BaseTestMetadataApi):
         self.assertEqual('Delete', api._get_action(False, True))
         self.assertEqual('Update', api._get_action(False, False))
 
+
+class TestApiDeploy(ApiDeployTests, BaseTestMetadataApi):
+    api_class = ApiDeploy
+
+    def setUp(self):
+        super(TestApiDeploy, self).setUp()
+        self.package_zip = DummyPackageZipBuilder()()
+
+    def _expected_envelope_start(self):
+        return self.envelope_start.format(
+            package_zip = self.package_zip,
+            purge_on_delete = 'true',
+            check_only = 'false',
+            run_tests = '',
+            test_level = '',
+        )
+
+    def _create_instance(self, task, api_version=None, purge_on_delete=None):
+        return self.api_class(
+            task,
+            self.package_zip,
+            api_version=api_version,
+            purge_on_delete=purge_on_delete,
+        )
+
+    def test_init_no_purge_on_delete(self):
+        task = self._create_task()
+        api = self._create_instance(task, purge_on_delete=False)
+        self.assertEqual(api.purge_on_delete, 'false')
+
+    def test_build_envelope_start_check_only_run_tests(self):
+        task = self._create_task()
+        api = self.api_class(
+            task,
+            self.package_zip,
+            check_only=True,
+            test_level='RunSpecifiedTests',
+            run_tests=['TEST_Foo', 'TEST_Bar'],
+        )
+        envelope = parseString(api._build_envelope_start())
+        self.assertEqual(
+            api._get_element_value(envelope, 'checkOnly'),
+            'true',
+        )
+        self.assertEqual(
+            api._get_element_value(envelope, 'testLevel'),
+            'RunSpecifiedTests',
+        )
+        self.assertEqual(
+            [node.firstChild.nodeValue for node in envelope.getElementsByTagName('runTests')],
+            ['TEST_Foo', 'TEST_Bar'],
+        )
+
+    def test_build_envelope_start_streaming(self):
+        task = self._create_task()
+        zip_content = b''.join(chr(i % 256) for i in range(1000))
+        api = self.api_class(task, io.BytesIO(zip_content))
+        envelope = api._build_envelope_start()
+        self.assertIsInstance(envelope, StreamingSoapEnvelope)
+
+        api.package_zip = base64.b64encode(zip_content)
+        expected = api._build_envelope_start().encode('utf-8')
+        envelope.chunk_size = 30
+        self.assertEqual(expected, b''.join(envelope))
+        self.assertEqual(len(expected), len(envelope))
+
+        auth_envelope = envelope.replace('###SESSION_ID###', 'abc123')
+        self.assertEqual(
+            expected.replace('###SESSION_ID###', 'abc123'),
+            b''.join(iter(lambda: auth_envelope.read(100), b'')),
+        )
+
+class TestApiDeployRecentValidation(ApiDeployTests, BaseTestMetadataApi):
+    api_class = ApiDeployRecentValidation
+    response_start = '<?xml version="1.0" encoding="UTF-8"?><result>1234567890</result>'
+
+    def setUp(self):
+        super(TestApiDeployRecentValidation, self).setUp()
+        self.validation_id = '0Af000000000001AAA'
+
+    def _expected_envelope_start(self):
+        return self.envelope_start.format(
+            validation_id = self.validation_id,
+        )
+
+    def _create_instance(self, task, api_version=None, purge_on_delete=None):
+        return self.api_class(
+            task,
+            self.validation_id,
+            api_version=api_version,
+        )
+
+    def test_process_response_start(self):
+        task = self._create_task()
+        api = self._create_instance(task)
+        response = DummyResponse()
+        response.status_code = 200
+        response.content = self.response_start
+        api._process_response_start(response)
+        self.assertEqual(api.process_id, '1234567890')
+
 class TestApiListMetadata(BaseTestMetadataApi):
     api_class = ApiListMetadata
     envelope_start = list_metadata_start_envelope
@@ -844,6 +1034,12 @@ class TestApiRetrieveUnpackaged(BaseTestMetadataApi):
     def _expected_call_success_result(self, response_result):
         return self.result_zip.zip
 
+    def _assert_call_success_result(self, resp, response_result):
+        self.assertEquals(
+            resp.namelist(),
+            self._expected_call_success_result(response_result).namelist(),
+        )
+
     def _create_instance(self, task, api_version=None):
         return self.api_class(
             task,
@@ -868,7 +1064,7 @@ class TestApiRetrieveUnpackaged(BaseTestMetadataApi):
         if not self.api_class.soap_envelope_result:
             api.soap_envelope_result = '{process_id}'
 
-        response = '<?xml version="1.0" encoding="UTF-8"?><id>1234567890</id>'
+        response = self.response_start
         self._mock_call_mdapi(api, response)
         response_status = '<?xml version="1.0" encoding="UTF-8"?><done>true</done>'
         self._mock_call_mdapi(api, response_status)
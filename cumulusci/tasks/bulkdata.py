@@ -1,3 +1,4 @@
+from cumulusci.core.trace import span
 from cumulusci.tasks.salesforce import BaseSalesforceApiTask
 
 import csv
@@ -68,36 +69,40 @@ class DeleteData(BaseSalesforceApiTask):
 
     def _run_task(self):
         for obj in self.options['objects']:
-            self.logger.info('Deleting all {} records'.format(obj))
-            # Query for all record ids
-            self.logger.info('  Querying for all {} objects'.format(obj))
-            query_job = self.bulk.create_query_job(obj, contentType='CSV')
-            batch = self.bulk.query(query_job, "select Id from {}".format(obj))
-            while not self.bulk.is_batch_done(batch, query_job):
-                time.sleep(10)
-            self.bulk.close_job(query_job)
-            delete_rows = []
-            for result in self.bulk.get_all_results_for_query_batch(batch,query_job):
-                reader = unicodecsv.DictReader(result, encoding='utf-8')
-                for row in reader:
-                    delete_rows.append(row)
-
-            if not delete_rows:
-                self.logger.info('  No {} objects found, skipping delete'.format(obj))
-                continue
+            with span('delete {}'.format(obj), 'bulk'):
+                self._delete_records(obj)
+
+    def _delete_records(self, obj):
+        self.logger.info('Deleting all {} records'.format(obj))
+        # Query for all record ids
+        self.logger.info('  Querying for all {} objects'.format(obj))
+        query_job = self.bulk.create_query_job(obj, contentType='CSV')
+        batch = self.bulk.query(query_job, "select Id from {}".format(obj))
+        while not self.bulk.is_batch_done(batch, query_job):
+            time.sleep(10)
+        self.bulk.close_job(query_job)
+        delete_rows = []
+        for result in self.bulk.get_all_results_for_query_batch(batch,query_job):
+            reader = unicodecsv.DictReader(result, encoding='utf-8')
+            for row in reader:
+                delete_rows.append(row)
 
-            # Delete the records
-            delete_job = self.bulk.create_delete_job(obj, contentType='CSV')
-            self.logger.info('  Deleting {} {} records'.format(len(delete_rows), obj))
-            batch_num = 1
-            for batch in self._upload_batch(delete_job, delete_rows):
-                self.logger.info('    Uploaded batch {}'.format(batch))
-                while not self.bulk.is_batch_done(batch, delete_job):
-                    self.logger.info('      Checking status of batch {0}'.format(batch_num))
-                    time.sleep(10)
-                self.logger.info('      Batch {} complete'.format(batch))
-                batch_num += 1
-            self.bulk.close_job(delete_job)
+        if not delete_rows:
+            self.logger.info('  No {} objects found, skipping delete'.format(obj))
+            return
+
+        # Delete the records
+        delete_job = self.bulk.create_delete_job(obj, contentType='CSV')
+        self.logger.info('  Deleting {} {} records'.format(len(delete_rows), obj))
+        batch_num = 1
+        for batch in self._upload_batch(delete_job, delete_rows):
+            self.logger.info('    Uploaded batch {}'.format(batch))
+            while not self.bulk.is_batch_done(batch, delete_job):
+                self.logger.info('      Checking status of batch {0}'.format(batch_num))
+                time.sleep(10)
+            self.logger.info('      Batch {} complete'.format(batch))
+            batch_num += 1
+        self.bulk.close_job(delete_job)
 
     def _split_batches(self, data, batch_size):
         """Yield successive n-sized chunks from l."""
@@ -185,16 +190,17 @@ class LoadData(BaseSalesforceApiTask):
             # Prepare the rows
             rows = CsvDictsAdapter(iter(batch))
 
-            # Create the batch
-            batch_id = self.bulk.post_batch(job_id, rows)
-            self.logger.info('    Uploaded batch {}'.format(batch_id))
-            while not self.bulk.is_batch_done(batch_id, job_id):
-                self.logger.info('      Checking batch status...')
-                time.sleep(10)
-            
-            # Wait for batch to complete
-            res = self.bulk.wait_for_batch(job_id, batch_id)
-            self.logger.info('      Batch {} complete'.format(batch_id))
+            with span('load {}'.format(mapping['sf_object']), 'bulk'):
+                # Create the batch
+                batch_id = self.bulk.post_batch(job_id, rows)
+                self.logger.info('    Uploaded batch {}'.format(batch_id))
+                while not self.bulk.is_batch_done(batch_id, job_id):
+                    self.logger.info('      Checking batch status...')
+                    time.sleep(10)
+
+                # Wait for batch to complete
+                res = self.bulk.wait_for_batch(job_id, batch_id)
+                self.logger.info('      Batch {} complete'.format(batch_id))
 
             # salesforce_bulk is broken in fetching id results so do it manually
             results_url = '{}/job/{}/batch/{}/result'.format(self.bulk.endpoint, job_id, batch_id)
@@ -419,10 +425,11 @@ class QueryData(BaseSalesforceApiTask):
         job = self.bulk.create_query_job(mapping['sf_object'], contentType='CSV')
         self.logger.info('Job id: {0}'.format(job))
         self.logger.info('Submitting query: {}'.format(soql))
-        batch = self.bulk.query(job, soql)
-        self.logger.info('Batch id: {0}'.format(batch))
-        self.bulk.wait_for_batch(job, batch)
-        self.logger.info('Batch {0} finished'.format(batch))
+        with span('query {sf_object}'.format(**mapping), 'bulk'):
+            batch = self.bulk.query(job, soql)
+            self.logger.info('Batch id: {0}'.format(batch))
+            self.bulk.wait_for_batch(job, batch)
+            self.logger.info('Batch {0} finished'.format(batch))
         self.bulk.close_job(job)
         self.logger.info('Job {0} closed'.format(job))
 
@@ -3,7 +3,8 @@ from distutils.dir_util import copy_tree
 from distutils.dir_util import remove_tree
 from cumulusci.core.exceptions import TaskOptionsError
 from cumulusci.core.tasks import BaseTask
-from cumulusci.utils import removeXmlElement
+from cumulusci.utils import RemoveXmlElements
+from cumulusci.utils import XmlTransform
 
 class CreateUnmanagedEESrc(BaseTask):
     task_options = {
@@ -44,13 +45,15 @@ class CreateUnmanagedEESrc(BaseTask):
             self.options['path'],
         )) 
         
+        transform = XmlTransform()
         for element in self.elements:
             fname_match, element_name = element.split(':')
-            removeXmlElement(
-                element_name,
-                os.path.join(self.options['path']),
+            transform.add_files(
+                RemoveXmlElements('.//ns:{}'.format(element_name)),
+                self.options['path'],
                 fname_match,
             )
+        transform()
     
         self.logger.info('Metadata in {} is now prepared for unmanaged EE deployment'.format(
             self.options['path'],
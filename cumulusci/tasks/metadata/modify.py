@@ -1,8 +1,8 @@
 import glob
 import os
-import lxml.etree as ET
-from xml.sax.saxutils import escape
 from cumulusci.core.tasks import BaseTask
+from cumulusci.utils import RemoveXmlElements
+from cumulusci.utils import XmlTransform
 
 class RemoveElementsXPath(BaseTask):
     task_options = {
@@ -21,30 +21,24 @@ class RemoveElementsXPath(BaseTask):
         if chdir:
             self.logger.info('Changing directory to {}'.format(chdir))
             os.chdir(chdir)
-        for element in self.options['elements']:
-            self._process_element(element)
-        if chdir:
-            os.chdir(cwd)
-   
-    def _process_element(self, element):
+        try:
+            # All of the elements are removed with a single parse and write
+            # of each file
+            transform = XmlTransform()
+            for element in self.options['elements']:
+                self._process_element(transform, element)
+            transform(logger=self.logger)
+        finally:
+            if chdir:
+                os.chdir(cwd)
+
+    def _process_element(self, transform, element):
         self.logger.info(
             'Removing elements matching {xpath} from {path}'.format(
                 **element
             )
         )
-        for f in glob.glob(element['path']):
-            with open(f, 'rw') as fp:
-                orig = fp.read()
-                fp.seek(0)
-                root = ET.parse(open(f))
-                res = root.findall(element['xpath'].replace('ns:','{http://soap.sforce.com/2006/04/metadata}'))
-                for element in res:
-                    element.getparent().remove(element)
-                processed = '{}\n{}\n'.format(
-                    '<?xml version="1.0" encoding="UTF-8"?>',
-                    ET.tostring(root),
-                )
-                if orig != processed:
-                    self.logger.info('Modified {}'.format(f))
-                    fp = open(f, 'w')
-                    fp.write(processed)
+        transform.add(
+            RemoveXmlElements(element['xpath']),
+            glob.glob(element['path']),
+        )
@@ -1,4 +1,6 @@
+from collections import OrderedDict
 import io
+import json
 import os
 import re
 import urllib
@@ -9,6 +11,8 @@ import yaml
 
 from cumulusci.core.tasks import BaseTask
 from cumulusci.utils import elementtree_parse_file
+from cumulusci.utils import parallel_executor
+from cumulusci.utils import write_file_atomic
 
 __location__ = os.path.realpath(
     os.path.join(os.getcwd(), os.path.dirname(__file__)))
@@ -37,12 +41,25 @@ def metadata_sort_key_section(name):
     key = prefix + name
     return key
 
+# PackageXmlGenerator only starts worker processes to parse at least this
+# many XML files
+PACKAGE_XML_PARALLEL_MIN_FILES = 100
+
 class MetadataParserMissingError(Exception):
     pass
 
 class PackageXmlGenerator(object):
+    """ Generates a package.xml listing the metadata in a directory
+
+    The element names listed by MetadataXmlElementParsers are extracted
+    from all of the XML files before rendering, by a pool of max_workers
+    processes (threads in a frozen build or on Windows) when there are many
+    files.  If cache_path is set, the names
+    are stored by file path, mtime and size in that JSON file so unchanged
+    files aren't parsed again by the next run.
+    """
     def __init__(self, directory, api_version, package_name=None, managed=None, delete=None, install_class=None,
-                 uninstall_class=None):
+                 uninstall_class=None, cache_path=None, max_workers=None):
         with open(__location__ + '/metadata_map.yml', 'r') as f_metadata_map:
             self.metadata_map = yaml.load(f_metadata_map)
         self.directory = directory
@@ -52,11 +69,14 @@ class PackageXmlGenerator(object):
         self.delete = delete
         self.install_class = install_class
         self.uninstall_class = uninstall_class
+        self.cache_path = cache_path
+        self.max_workers = max_workers
         self.types = []
 
 
     def __call__(self):
         self.parse_types()
+        self.parse_xml_files()
         return self.render_xml()
 
     def parse_types(self):
@@ -90,6 +110,81 @@ class PackageXmlGenerator(object):
 
                 self.types.append(parser)
 
+    def parse_xml_files(self):
+        """ Sets the element names of each file on the XML element parsers.
+        Each file is parsed once for all of the parsers reading it and the
+        names of unchanged files are read from the cache. """
+        files = OrderedDict()
+        for parser in self.types:
+            if not isinstance(parser, MetadataXmlElementParser):
+                continue
+            for item in parser.get_items():
+                path = os.path.abspath(os.path.join(parser.directory, item))
+                files.setdefault(path, []).append((parser, item))
+
+        cache = self._load_cache()
+        # Entries for other directories are kept
+        directory = os.path.abspath(self.directory) + os.sep
+        used = dict(
+            (path, entry) for path, entry in cache.items()
+            if not path.startswith(directory)
+        )
+        pending = []
+        for path, parsers in files.items():
+            stat = os.stat(path)
+            entry = cache.get(path)
+            if not entry or entry['stat'] != [stat.st_mtime, stat.st_size]:
+                entry = {
+                    'stat': [stat.st_mtime, stat.st_size],
+                    'names': {},
+                }
+            used[path] = entry
+            missing = [
+                parser for parser, item in parsers
+                if parser.get_cache_key() not in entry['names']
+            ]
+            if missing:
+                pending.append((path, missing))
+
+        for (path, parsers), results in zip(pending, self._parse_pending(pending)):
+            for parser, names in zip(parsers, results):
+                used[path]['names'][parser.get_cache_key()] = names
+
+        for path, parsers in files.items():
+            for parser, item in parsers:
+                if parser.parsed is None:
+                    parser.parsed = {}
+                parser.parsed[item] = used[path]['names'][parser.get_cache_key()]
+
+        if pending or len(used) != len(cache):
+            self._save_cache(used)
+
+    def _parse_pending(self, pending):
+        if self.max_workers == 1 or len(pending) < PACKAGE_XML_PARALLEL_MIN_FILES:
+            return [get_element_names(path, parsers) for path, parsers in pending]
+
+        executor = parallel_executor(self.max_workers)
+        try:
+            paths, parsers = zip(*pending)
+            return list(executor.map(get_element_names, paths, parsers))
+        finally:
+            executor.shutdown()
+
+    def _load_cache(self):
+        if not self.cache_path or not os.path.isfile(self.cache_path):
+            return {}
+        with open(self.cache_path, 'r') as f:
+            try:
+                return json.load(f)
+            except ValueError:
+                # Parse the files again if the cache is corrupt
+                return {}
+
+    def _save_cache(self, cache):
+        if not self.cache_path:
+            return
+        write_file_atomic(self.cache_path, json.dumps(cache))
+
     def render_xml(self):
         lines = []
 
@@ -145,6 +240,10 @@ class BaseMetadataParser(object):
         return excludes
 
     def parse_items(self):
+        for item in self.get_items():
+            self.parse_item(item)
+
+    def get_items(self):
         # Loop through items
         for item in sorted(os.listdir(self.directory)):
             # on Macs this file is generated by the OS. Shouldn't be in the package.xml
@@ -164,7 +263,7 @@ class BaseMetadataParser(object):
             if self.check_delete_excludes(item):
                 continue
 
-            self.parse_item(item)
+            yield item
 
     def check_delete_excludes(self, item):
         if not self.delete:
@@ -247,6 +346,10 @@ class MetadataXmlElementParser(BaseMetadataParser):
 
     namespaces = {'sf': 'http://soap.sforce.com/2006/04/metadata'}
 
+    # Dict of item to the element names in the file, set by
+    # PackageXmlGenerator.parse_xml_files
+    parsed = None
+
     def __init__(self, metadata_type, directory, extension, delete, item_xpath=None, name_xpath=None):
         super(MetadataXmlElementParser, self).__init__(metadata_type, directory, extension, delete)
         if not item_xpath:
@@ -257,16 +360,37 @@ class MetadataXmlElementParser(BaseMetadataParser):
         self.name_xpath = name_xpath
 
     def _parse_item(self, item):
-        root = elementtree_parse_file(self.directory + '/' + item)
+        if self.parsed is not None and item in self.parsed:
+            names = self.parsed[item]
+        else:
+            names = self.get_element_names(item)
         members = []
 
         parent = self.strip_extension(item)
 
-        for item in self.get_item_elements(root):
-            members.append(self.get_item_name(item, parent))
+        for name in names:
+            if name is None:
+                raise MissingNameElementError
+            members.append(self.get_member_name(name, parent))
 
         return members
 
+    def get_element_names(self, item, root=None):
+        """ Returns the name of each item element in the file, or None if
+        the element has no name element """
+        if root is None:
+            root = elementtree_parse_file(self.directory + '/' + item)
+        names = []
+        for element in self.get_item_elements(root):
+            name_elements = self.get_name_elements(element)
+            names.append(name_elements[0].text if name_elements else None)
+        return names
+
+    def get_cache_key(self):
+        """ Returns the key of the parser's element names in the cache entry
+        of a file """
+        return '{} {}'.format(self.item_xpath, self.name_xpath)
+
     def check_delete_excludes(self, item):
         return False
 
@@ -282,7 +406,9 @@ class MetadataXmlElementParser(BaseMetadataParser):
         if not names:
             raise MissingNameElementError
 
-        name = names[0].text
+        return self.get_member_name(names[0].text, parent)
+
+    def get_member_name(self, name, parent):
         prefix = self.item_name_prefix(parent)
         if prefix:
             name = prefix + name
@@ -292,6 +418,12 @@ class MetadataXmlElementParser(BaseMetadataParser):
     def item_name_prefix(self, parent):
         return parent + '.'
 
+def get_element_names(path, parsers):
+    """ Parses a file once and returns the element names found by each of
+    the parsers.  Runs in the worker processes of PackageXmlGenerator. """
+    root = elementtree_parse_file(path)
+    return [parser.get_element_names(None, root) for parser in parsers]
+
 # TYPE SPECIFIC PARSERS
 
 class CustomLabelsParser(MetadataXmlElementParser):
@@ -332,6 +464,17 @@ class AuraBundleParser(MetadataFilenameParser):
             return []
         return [item]
 
+class StaticResourceParser(MetadataFilenameParser):
+    def get_items(self):
+        items = set(super(StaticResourceParser, self).get_items())
+        # Directories are bundles deployed as a zipped .resource file
+        for item in os.listdir(self.directory):
+            if item.startswith('.'):
+                continue
+            if os.path.isdir(os.path.join(self.directory, item)):
+                items.add(item + '.resource')
+        return sorted(items)
+
 class DocumentParser(MetadataFolderParser):
     def _parse_subitem(self, item, subitem):
         return [item + '/' + subitem]
@@ -382,6 +525,10 @@ class UpdatePackageXml(BaseTask):
             delete = self.options.get('delete', False),
             install_class = self.project_config.project__package__install_class,
             uninstall_class = self.project_config.project__package__uninstall_class,
+            cache_path = os.path.join(
+                self.project_config.project_local_dir,
+                'package_xml_cache.json',
+            ),
         )
 
     def _run_task(self):
@@ -1,7 +1,13 @@
+import json
 import os
+import shutil
 import tempfile
 import unittest
 
+import mock
+
+from cumulusci.tasks.metadata import package
+from cumulusci.tasks.metadata.package import MissingNameElementError
 from cumulusci.tasks.metadata.package import PackageXmlGenerator
 
 __location__ = os.path.split(os.path.realpath(__file__))[0]
@@ -60,3 +66,94 @@ class TestPackageXmlGenerator(unittest.TestCase):
         package_xml = generator()
 
         self.assertEquals(package_xml, expected_package_xml)
+
+    def test_static_resource_bundle(self):
+        path = tempfile.mkdtemp()
+        try:
+            os.makedirs(os.path.join(path, 'staticresources', 'Bundle'))
+            for name in ('Bundle.resource-meta.xml', 'File.resource', 'File.resource-meta.xml'):
+                with open(os.path.join(path, 'staticresources', name), 'w') as f:
+                    f.write('')
+            package_xml = PackageXmlGenerator(path, '36.0')()
+        finally:
+            shutil.rmtree(path)
+        self.assertIn(
+            '        <members>Bundle</members>\n'
+            '        <members>File</members>\n'
+            '        <name>StaticResource</name>',
+            package_xml,
+        )
+
+
+OBJECT_XML = """<?xml version="1.0" encoding="UTF-8"?>
+<CustomObject xmlns="http://soap.sforce.com/2006/04/metadata">
+    <fields>
+        <fullName>{}</fullName>
+    </fields>
+    <listViews>
+        <fullName>All</fullName>
+    </listViews>
+</CustomObject>
+"""
+
+
+class TestPackageXmlGeneratorCache(unittest.TestCase):
+
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tempdir, 'src')
+        os.makedirs(os.path.join(self.path, 'objects'))
+        self.cache_path = os.path.join(self.tempdir, 'cache.json')
+        self._write_object('Foo__c', 'Bar__c')
+        self._write_object('Baz__c', 'Qux__c')
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+
+    def _write_object(self, name, field):
+        with open(os.path.join(self.path, 'objects', name + '.object'), 'w') as f:
+            f.write(OBJECT_XML.format(field))
+
+    def _generate(self, **kwargs):
+        generator = PackageXmlGenerator(
+            self.path,
+            '36.0',
+            cache_path=self.cache_path,
+            **kwargs
+        )
+        return generator()
+
+    def test_cache(self):
+        package_xml = self._generate()
+        self.assertIn('<members>Foo__c.Bar__c</members>', package_xml)
+        self.assertIn('<members>Baz__c.All</members>', package_xml)
+        with open(self.cache_path, 'r') as f:
+            cache = json.load(f)
+        self.assertEqual(2, len(cache))
+
+        with mock.patch.object(package, 'elementtree_parse_file') as parse:
+            self.assertEqual(package_xml, self._generate())
+        parse.assert_not_called()
+
+    def test_cache_changed_file(self):
+        self._generate()
+        self._write_object('Foo__c', 'Changed__c')
+        os.remove(os.path.join(self.path, 'objects', 'Baz__c.object'))
+        package_xml = self._generate()
+        self.assertIn('<members>Foo__c.Changed__c</members>', package_xml)
+        self.assertNotIn('Foo__c.Bar__c', package_xml)
+        self.assertNotIn('Baz__c', package_xml)
+        with open(self.cache_path, 'r') as f:
+            self.assertEqual(1, len(json.load(f)))
+
+    def test_parallel(self):
+        expected = self._generate(max_workers=1)
+        os.remove(self.cache_path)
+        with mock.patch.object(package, 'PACKAGE_XML_PARALLEL_MIN_FILES', 2):
+            self.assertEqual(expected, self._generate(max_workers=2))
+
+    def test_missing_name(self):
+        with open(os.path.join(self.path, 'objects', 'Foo__c.object'), 'w') as f:
+            f.write(OBJECT_XML.replace('<fullName>{}</fullName>', ''))
+        with self.assertRaises(MissingNameElementError):
+            self._generate()
@@ -1,10 +1,8 @@
-import fileinput
 import os
 import re
-from lxml import etree as ET
-import sys
 
 from cumulusci.core.tasks import BaseTask
+from cumulusci.utils import XmlTransform
 
 
 class MetaXmlBaseTask(BaseTask):
@@ -18,30 +16,62 @@ class MetaXmlBaseTask(BaseTask):
             )
 
     def _run_task(self):
-        for root, dirs, files in os.walk(self.options['dir']):
-            for filename in files:
-                filename = os.path.join(root, filename)
-                if filename.endswith('-meta.xml'):
-                    tree = ET.parse(filename)
-                    if self._process_xml(tree.getroot()):
-                        self._write_file(tree, filename)
-                        self.logger.info('Processed file %s', filename)
-                    else:
-                        self.logger.info('No changes for file %s', filename)
-
-    def _write_file(self, tree, filename):
-        tree.write(
-            filename,
-            xml_declaration=True,
-            encoding='UTF-8',
-            pretty_print=True,
+        transform = XmlTransform()
+        transform.add_files(
+            self._get_operation(),
+            self.options['dir'],
+            '*-meta.xml',
         )
-        # change back to double quotes in header to minimize diffs
-        for line in fileinput.input(filename, inplace=1):
-            if line.startswith('<?xml'):
-                sys.stdout.write(line.replace("'", '"'))
-            else:
-                sys.stdout.write(line)
+        summary = transform(logger=self.logger)
+        self.logger.info(
+            'Processed {files} files, {changed} changed'.format(**summary)
+        )
+
+
+class UpdateApiVersion(object):
+    """ XmlTransform operation which sets the apiVersion of a -meta.xml
+    file """
+
+    def __init__(self, version):
+        self.version = version
+
+    def __call__(self, tree):
+        root = tree.getroot()
+        changed = False
+        xmlns = re.search('({.+}).+', root.tag).group(1)
+        api_version = root.find('{}apiVersion'.format(xmlns))
+        if (api_version is not None and
+                api_version.text != self.version):
+            api_version.text = self.version
+            changed = True
+        return changed
+
+
+class UpdatePackageVersions(object):
+    """ XmlTransform operation which sets the version of the packageVersions
+    for a list of (namespace, version) in a -meta.xml file """
+
+    def __init__(self, dependencies):
+        self.dependencies = dependencies
+
+    def __call__(self, tree):
+        root = tree.getroot()
+        changed = False
+        xmlns = re.search('({.+}).+', root.tag).group(1)
+        for namespace, version in self.dependencies:
+            v_major, v_minor = version.split('.')
+            for package_version in root.findall('{}packageVersions'.format(xmlns)):
+                if package_version.find('{}namespace'.format(xmlns)).text != namespace:
+                    continue
+                major = package_version.find('{}majorNumber'.format(xmlns))
+                if major.text != v_major:
+                    major.text = v_major
+                    changed = True
+                minor = package_version.find('{}minorNumber'.format(xmlns))
+                if minor.text != v_minor:
+                    minor.text = v_minor
+                    changed = True
+        return changed
 
 
 class UpdateApi(MetaXmlBaseTask):
@@ -55,15 +85,8 @@ class UpdateApi(MetaXmlBaseTask):
         },
     }
 
-    def _process_xml(self, root):
-        changed = False
-        xmlns = re.search('({.+}).+', root.tag).group(1)
-        api_version = root.find('{}apiVersion'.format(xmlns))
-        if (api_version is not None and
-                api_version.text != self.options['version']):
-            api_version.text = self.options['version']
-            changed = True
-        return changed
+    def _get_operation(self):
+        return UpdateApiVersion(self.options['version'])
 
 
 class UpdateDependencies(MetaXmlBaseTask):
@@ -87,20 +110,5 @@ class UpdateDependencies(MetaXmlBaseTask):
                     (dependency['namespace'], str(dependency['version']))
                 )
 
-    def _process_xml(self, root):
-        changed = False
-        xmlns = re.search('({.+}).+', root.tag).group(1)
-        for namespace, version in self.dependencies:
-            v_major, v_minor = version.split('.')
-            for package_version in root.findall('{}packageVersions'.format(xmlns)):
-                if package_version.find('{}namespace'.format(xmlns)).text != namespace:
-                    continue
-                major = package_version.find('{}majorNumber'.format(xmlns))
-                if major.text != v_major:
-                    major.text = v_major
-                    changed = True
-                minor = package_version.find('{}minorNumber'.format(xmlns))
-                if minor.text != v_minor:
-                    minor.text = v_minor
-                    changed = True
-        return changed
+    def _get_operation(self):
+        return UpdatePackageVersions(self.dependencies)
@@ -1,6 +1,7 @@
 from salesforce_bulk import SalesforceBulk
 from simple_salesforce import Salesforce
 
+from cumulusci.core.trace import TracedSession
 from cumulusci.tasks.salesforce import BaseSalesforceTask
 
 
@@ -25,6 +26,7 @@ class BaseSalesforceApiTask(BaseSalesforceTask):
             instance=self.org_config.instance_url.replace('https://', ''),
             session_id=self.org_config.access_token,
             version=api_version,
+            session=TracedSession(),
         )
         if base_url is not None:
             rv.base_url += base_url
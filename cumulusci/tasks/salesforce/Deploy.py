@@ -1,15 +1,24 @@
-import base64
+import hashlib
+import io
+import json
 import os
 import tempfile
 import zipfile
 
+from cumulusci.core.exceptions import TaskOptionsError
 from cumulusci.core.utils import process_bool_arg
+from cumulusci.core.utils import process_list_arg
 from cumulusci.salesforce_api.metadata import ApiDeploy
 from cumulusci.tasks.salesforce import BaseSalesforceMetadataApiTask
-from cumulusci.utils import zip_clean_metaxml
-from cumulusci.utils import zip_inject_namespace
-from cumulusci.utils import zip_strip_namespace
-from cumulusci.utils import zip_tokenize_namespace
+from cumulusci.utils import clean_metaxml_transform
+from cumulusci.utils import inject_namespace_transform
+from cumulusci.utils import remove_xml_element_transform
+from cumulusci.utils import strip_managed_comments_transform
+from cumulusci.utils import strip_namespace_transform
+from cumulusci.utils import tokenize_namespace_transform
+from cumulusci.utils import zip_static_resource_bundle
+from cumulusci.utils import zip_transform
+from cumulusci.utils import ZIPFILE_COMPRESSLEVEL
 
 
 class Deploy(BaseSalesforceMetadataApiTask):
@@ -37,44 +46,331 @@ class Deploy(BaseSalesforceMetadataApiTask):
         'clean_meta_xml': {
             'description': "Defaults to True which strips the <packageVersions/> element from all meta.xml files.  The packageVersion element gets added automatically by the target org and is set to whatever version is installed in the org.  To disable this, set this option to False",
         },
+        'managed_src': {
+            'description': "If True, the string //cumulusci-managed is removed from Apex classes and triggers in the deployed metadata for a managed deployment.  The files in path are not modified.  Defaults to False",
+        },
+        'unmanaged_ee': {
+            'description': "If True, availableFields elements are removed from objects in the deployed metadata for an unmanaged deployment to an Enterprise Edition org.  The files in path are not modified.  Defaults to False",
+        },
+        'check_only': {
+            'description': "If True, validates the deployment including running tests but does not save any changes to the org.  The deploy_id return value can be passed to the quick_deploy task to deploy the validated changes.  Defaults to False",
+        },
+        'test_level': {
+            'description': "The level of Apex tests to run with the deployment: NoTestRun, RunSpecifiedTests, RunLocalTests, or RunAllTestsInOrg.  Defaults to the org's default behavior",
+        },
+        'run_tests': {
+            'description': "A list of Apex test classes to run with the deployment when test_level is RunSpecifiedTests",
+        },
+        'metrics_file': {
+            'description': "If set, deploy progress events with the number of components deployed and tests completed are appended to this file as JSON, one event per line",
+        },
+        'force': {
+            'description': "If True, deploys even if the same metadata was already deployed to the org by the last successful deploy from this path.  Defaults to False",
+        },
+        'compress_level': {
+            'description': "The zlib compression level from 0 to 9 of the text files in the deploy zip.  Static resources, documents and content assets are stored without compression.  Levels other than 0 require Python 3.7 or later.  Defaults to zlib's default level",
+        },
+        'background': {
+            'description': "If True and running in a flow, the deploy is started and the flow continues with the next step while the deploy runs.  Use the wait_background task to wait for the deploy to complete, otherwise the flow waits at the end.  Defaults to False",
+        },
     }
-        
+
+    test_levels = [
+        'NoTestRun',
+        'RunSpecifiedTests',
+        'RunLocalTests',
+        'RunAllTestsInOrg',
+    ]
+
+    # Org config key for the hashes of the last successful deploy of each
+    # path, keyed by org id so a recreated scratch org is deployed again
+    deploy_hashes_key = 'deploy_hashes'
+
+    # Options included in the deploy hash along with the zip content
+    deploy_hash_options = [
+        'namespace_inject',
+        'namespace_strip',
+        'namespace_tokenize',
+        'namespaced_org',
+        'unmanaged',
+        'clean_meta_xml',
+        'managed_src',
+        'unmanaged_ee',
+        'test_level',
+        'run_tests',
+    ]
+
+    # Removed from classes and triggers by the managed_src option
+    managed_token = '//cumulusci-managed'
+
+    # filename pattern:element name removed by the unmanaged_ee option
+    unmanaged_ee_elements = ['*.object:availableFields']
+
+    # Set by _get_api to the (path, hash) of the zip being deployed
+    _deploy_hash = None
+
+    def _init_options(self, kwargs):
+        super(Deploy, self)._init_options(kwargs)
+        self.options['check_only'] = process_bool_arg(
+            self.options.get('check_only', False)
+        )
+        self.options['managed_src'] = process_bool_arg(
+            self.options.get('managed_src', False)
+        )
+        self.options['unmanaged_ee'] = process_bool_arg(
+            self.options.get('unmanaged_ee', False)
+        )
+        self.options['run_tests'] = process_list_arg(
+            self.options.get('run_tests')
+        ) or []
+
+    def _validate_options(self):
+        super(Deploy, self)._validate_options()
+        test_level = self.options.get('test_level')
+        if test_level and test_level not in self.test_levels:
+            raise TaskOptionsError(
+                'test_level must be one of: {}'.format(
+                    ', '.join(self.test_levels),
+                )
+            )
+        if self.options['run_tests'] and test_level != 'RunSpecifiedTests':
+            raise TaskOptionsError(
+                'run_tests can only be used with test_level RunSpecifiedTests'
+            )
+        if test_level == 'RunSpecifiedTests' and not self.options['run_tests']:
+            raise TaskOptionsError(
+                'test_level RunSpecifiedTests requires a list of tests in run_tests'
+            )
+        if self.options.get('compress_level') is not None:
+            try:
+                self.options['compress_level'] = int(self.options['compress_level'])
+            except ValueError:
+                raise TaskOptionsError('compress_level must be an integer')
+            if not 0 <= self.options['compress_level'] <= 9:
+                raise TaskOptionsError('compress_level must be from 0 to 9')
+            if self.options['compress_level'] and not ZIPFILE_COMPRESSLEVEL:
+                raise TaskOptionsError(
+                    'compress_level can only be 0 before Python 3.7'
+                )
+
+    def _run_task(self):
+        api = self._get_api()
+        if not api:
+            return
+        if self._is_deployed():
+            return
+        if process_bool_arg(self.options.get('background', False)):
+            if self.flow:
+                return self._run_background(api)
+            self.logger.info(
+                'Not running in a flow, waiting for deploy to complete'
+            )
+        result = api()
+        self.return_values['deploy_id'] = getattr(api, 'process_id', None)
+        if result == 'Success':
+            self._deploy_succeeded()
+        return result
+
+    def _run_background(self, api):
+        handle = api.start()
+        self.return_values['deploy_id'] = handle.process_id
+        future = handle.future()
+        deploy_hash = self._deploy_hash
+
+        # Called from the flow's thread when it waits for the deploy
+        def deploy_succeeded(result):
+            if result == 'Success':
+                self._deploy_succeeded(deploy_hash)
+        self.flow.add_background_step(self.name, future, deploy_succeeded)
+        self.logger.info(
+            'Deploy {} is running in the background'.format(handle.process_id)
+        )
+
     def _get_api(self, path=None):
         if not path:
             path = self.task_config.options__path
 
-        # Build the zip file
-        zip_file = tempfile.TemporaryFile()
-        zipf = zipfile.ZipFile(zip_file, 'w', zipfile.ZIP_DEFLATED)
+        package_zip = self._get_package_zip(path)
+        self._deploy_hash = (
+            os.path.abspath(path),
+            self._get_deploy_hash(package_zip),
+        )
 
-        pwd = os.getcwd()
+        return self.api_class(
+            self,
+            package_zip,
+            purge_on_delete=False,
+            check_only=self.options['check_only'],
+            test_level=self.options.get('test_level'),
+            run_tests=self.options['run_tests'],
+            progress_listeners=self._get_progress_listeners(),
+        )
 
-        os.chdir(path)
-        for root, dirs, files in os.walk('.'):
-            for f in files:
-                self._write_zip_file(zipf, root, f)
+    def _get_package_zip(self, path):
+        """ Returns a temporary file containing the processed zip of the
+            metadata in path, which ApiDeploy streams into the request """
+        path = os.path.abspath(path)
+
+        # Build the zip file.  The files are only compressed when the
+        # processed zip is written.
+        zip_file = tempfile.TemporaryFile()
+        zipf = zipfile.ZipFile(zip_file, 'w', zipfile.ZIP_STORED)
+        self._write_zip_files(zipf, path)
         zipf.close()
+
         zipf_processed = self._process_zip_file(zipfile.ZipFile(zip_file))
-        zipf_processed.fp.seek(0)
-        package_zip = base64.b64encode(zipf_processed.fp.read())
+        package_zip = zipf_processed.fp
+        zipf_processed.close()
+        package_zip.seek(0)
+        return package_zip
 
-        os.chdir(pwd)
+    def _get_deploy_hash(self, package_zip):
+        """ Returns a hash of the files in the package zip and the options
+            which affect what is deployed.  The zip file itself is not
+            hashed since it includes the modified time of each file. """
+        deploy_hash = hashlib.sha1()
+        options = dict(
+            (option, self.options.get(option))
+            for option in self.deploy_hash_options
+        )
+        # Deploy always deploys with purge_on_delete disabled
+        options['purge_on_delete'] = False
+        deploy_hash.update(json.dumps(options, sort_keys=True))
+        zipf = zipfile.ZipFile(package_zip)
+        for name in sorted(zipf.namelist()):
+            content = zipf.read(name)
+            if isinstance(name, unicode):
+                name = name.encode('utf-8')
+            deploy_hash.update('{}:{}:'.format(name, len(content)))
+            deploy_hash.update(content)
+        package_zip.seek(0)
+        return deploy_hash.hexdigest()
+
+    def _is_deployed(self):
+        """ Returns True if the last successful deploy of the path to the org
+            had the same hash so the deploy can be skipped """
+        if not self._deploy_hash or self.options['check_only']:
+            return False
+        if process_bool_arg(self.options.get('force', False)):
+            return False
+        path, deploy_hash = self._deploy_hash
+        if self._get_deploy_hashes().get(path) != deploy_hash:
+            return False
+        self.logger.info(
+            'Skipping deploy of {}, no changes since the last successful deploy to the org.  Use the force option to deploy anyway'.format(path)
+        )
+        return True
 
-        return self.api_class(self, package_zip, purge_on_delete=False)
+    def _deploy_succeeded(self, deploy_hash=None):
+        """ Called after the deploy succeeds, from the flow's thread for a
+            deploy run in the background """
+        self._set_deployed(deploy_hash)
+
+    def _set_deployed(self, deploy_hash=None):
+        if deploy_hash is None:
+            deploy_hash = self._deploy_hash
+        if not deploy_hash or self.options['check_only']:
+            return
+        path, deploy_hash = deploy_hash
+        deploy_hashes = self._get_deploy_hashes()
+        deploy_hashes[path] = deploy_hash
+        # Hashes of other orgs are dropped since they were recorded for a
+        # scratch org which has since been recreated
+        self.org_config.config[self.deploy_hashes_key] = {
+            self.org_config.org_id: deploy_hashes,
+        }
+        self.project_config.keychain.set_org(self.org_config)
+
+    def _get_deploy_hashes(self):
+        """ Returns a dict of path to the hash of the last successful deploy
+            of the path to the org """
+        deploy_hashes = self.org_config.config.get(self.deploy_hashes_key) or {}
+        return dict(deploy_hashes.get(self.org_config.org_id) or {})
+
+    def _get_progress_listeners(self):
+        listeners = []
+        if self.options.get('metrics_file'):
+            listeners.append(self._write_metrics)
+        return listeners
+
+    def _write_metrics(self, event):
+        event = dict(event, task=self.name or self.__class__.__name__)
+        with io.open(self.options['metrics_file'], mode='a', encoding='utf-8') as f:
+            f.write(unicode(json.dumps(event, sort_keys=True)) + u'\n')
 
     def _process_zip_file(self, zipf):
-        zipf = self._process_namespace(zipf)
-        zipf = self._process_meta_xml(zipf)
+        """ Applies the source, namespace and meta.xml transforms to the zip
+            in a single pass, writing the result compressed to a temporary
+            file """
+        self._cleaned_meta_xml = []
+        self._changed_src = []
+        transforms = self._get_src_transforms()
+        transforms.extend(self._get_namespace_transforms())
+        transforms.extend(self._get_meta_xml_transforms())
+        zip_dest = zipfile.ZipFile(
+            tempfile.TemporaryFile(),
+            'w',
+            zipfile.ZIP_DEFLATED,
+        )
+        zipf = zip_transform(
+            zipf,
+            transforms,
+            zip_dest,
+            compress_level=self.options.get('compress_level'),
+        )
+        if self._changed_src:
+            self.logger.info(
+                'Modified {} files for the deployment'.format(
+                    len(self._changed_src)
+                )
+            )
+        if self._cleaned_meta_xml:
+            self.logger.info(
+                'Cleaned package versions from {} meta.xml files'.format(
+                    len(self._cleaned_meta_xml)
+                )
+            )
         return zipf
-        
-    def _process_namespace(self, zipf):
+
+    def _get_src_transforms(self):
+        """ Returns the transforms for the managed_src and unmanaged_ee
+            options, which are applied to the metadata as it is deployed
+            instead of modifying the files in path """
+        transforms = []
+        if self.options['managed_src']:
+            self.logger.info(
+                'Removing the string {} from classes and triggers'.format(
+                    self.managed_token,
+                )
+            )
+            transforms.append(strip_managed_comments_transform(
+                self.managed_token,
+                self._changed_src,
+            ))
+        if self.options['unmanaged_ee']:
+            self.logger.info(
+                'Preparing metadata for unmanaged EE deployment'
+            )
+            for element in self.unmanaged_ee_elements:
+                file_pattern, element_name = element.split(':')
+                transforms.append(remove_xml_element_transform(
+                    element_name,
+                    file_pattern,
+                    self._changed_src,
+                ))
+        return transforms
+
+    def _get_namespace_transforms(self):
+        transforms = []
         if self.options.get('namespace_tokenize'):
             self.logger.info(
                 'Tokenizing namespace prefix {}__'.format(
                     self.options['namespace_tokenize'],
                 )
             )
-            zipf = zip_tokenize_namespace(zipf, self.options['namespace_tokenize'], logger=self.logger)
+            transforms.append(tokenize_namespace_transform(
+                self.options['namespace_tokenize'],
+            ))
         if self.options.get('namespace_inject'):
             kwargs = {}
             kwargs['managed'] = not process_bool_arg(self.options.get('unmanaged', True))
@@ -90,20 +386,49 @@ class Deploy(BaseSalesforceMetadataApiTask):
                 self.logger.info(
                     'Stripping namespace tokens from metadata for unmanaged deployment'
                 )
-            zipf = zip_inject_namespace(zipf, self.options['namespace_inject'], **kwargs)
+            transforms.append(inject_namespace_transform(
+                self.options['namespace_inject'],
+                **kwargs
+            ))
         if self.options.get('namespace_strip'):
-            zipf = zip_strip_namespace(zipf, self.options['namespace_strip'], logger=self.logger)
-        return zipf
+            transforms.append(strip_namespace_transform(
+                self.options['namespace_strip'],
+            ))
+        return transforms
 
-    def _process_meta_xml(self, zipf):
+    def _get_meta_xml_transforms(self):
         if not process_bool_arg(self.options.get('clean_meta_xml', True)):
-            return zipf
+            return []
 
         self.logger.info(
             'Cleaning meta.xml files of packageVersion elements for deploy'
         )
-        zipf = zip_clean_metaxml(zipf, logger=self.logger)
-        return zipf
+        return [clean_metaxml_transform(self._cleaned_meta_xml)]
+
+    def _write_zip_files(self, zipf, path):
+        for root, dirs, files in os.walk(path):
+            if root == os.path.join(path, 'staticresources'):
+                # Directories are bundles deployed as a zipped .resource
+                for bundle in sorted(dirs):
+                    self._write_static_resource_bundle(zipf, path, bundle)
+                dirs[:] = []
+            for f in files:
+                self._write_zip_file(zipf, root, f, path)
+
+    def _write_static_resource_bundle(self, zipf, path, bundle):
+        """ Writes the static resource zipped from the files in the bundle
+            directory.  Zips are cached by the hash of their files. """
+        zipf.writestr(
+            'staticresources/{}.resource'.format(bundle),
+            zip_static_resource_bundle(
+                os.path.join(path, 'staticresources', bundle),
+                cache_dir=os.path.join(
+                    self.project_config.project_local_dir,
+                    'static_resource_bundles',
+                ),
+            ),
+        )
 
-    def _write_zip_file(self, zipf, root, path):
-        zipf.write(os.path.join(root, path))
+    def _write_zip_file(self, zipf, root, path, base_path):
+        file_path = os.path.join(root, path)
+        zipf.write(file_path, os.path.relpath(file_path, base_path))
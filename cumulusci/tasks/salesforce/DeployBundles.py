@@ -1,13 +1,61 @@
+from distutils.version import LooseVersion
 import os
 
+from concurrent.futures import FIRST_COMPLETED
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import wait
+import yaml
+
+from cumulusci.core.exceptions import TaskOptionsError
+from cumulusci.core.utils import process_bool_arg
 from cumulusci.tasks.salesforce import Deploy
+from cumulusci.utils import elementtree_parse_file
+from cumulusci.utils import package_xml_from_dict
 
 
 deploy_options = Deploy.task_options.copy()
 deploy_options['path']['description'] = 'The path to the parent directory containing the metadata bundles directories'
+# Bundles are deployed in order so they can't run in the background
+del deploy_options['background']
+deploy_options.update({
+    'merge': {
+        'description': "If True, the bundles are merged into a single package.xml and deployed together.  With an order_file, each group of bundles is merged separately.  Bundles which contain the same file or destructive changes are deployed separately.  Defaults to False",
+    },
+    'max_concurrent': {
+        'description': "The maximum number of bundles to deploy at the same time.  Defaults to 1 which deploys the bundles one after another",
+    },
+    'order_file': {
+        'description': "The path to a YAML file with a list of groups of bundle names.  Each group is deployed after the group before it completes.  Bundles not listed are deployed with the first group",
+    },
+})
+
+
 class DeployBundles(Deploy):
     task_options = deploy_options
 
+    # Set to a list of bundle paths while building a merged deploy
+    _merge_paths = None
+
+    def _init_options(self, kwargs):
+        super(DeployBundles, self)._init_options(kwargs)
+        self.options['merge'] = process_bool_arg(
+            self.options.get('merge', False)
+        )
+        self.options['max_concurrent'] = self.options.get('max_concurrent', 1)
+
+    def _validate_options(self):
+        super(DeployBundles, self)._validate_options()
+        try:
+            self.options['max_concurrent'] = int(self.options['max_concurrent'])
+        except ValueError:
+            raise TaskOptionsError('max_concurrent must be an integer')
+        if self.options['max_concurrent'] < 1:
+            raise TaskOptionsError('max_concurrent must be at least 1')
+        if process_bool_arg(self.options.get('background', False)):
+            raise TaskOptionsError(
+                'DeployBundles does not support the background option'
+            )
+
     def _run_task(self):
         path = self.options['path']
         pwd = os.getcwd()
@@ -21,15 +69,206 @@ class DeployBundles(Deploy):
             self.logger.warn('Path {} not found, skipping'.format(path))
             return
 
+        bundles = []
         for item in sorted(os.listdir(path)):
-            item_path = os.path.join(path, item)
-            if not os.path.isdir(item_path):
+            if os.path.isdir(os.path.join(path, item)):
+                bundles.append(item)
+
+        for group in self._get_groups(bundles):
+            self._deploy_group(path, group)
+
+    def _get_groups(self, bundles):
+        """ Returns the lists of bundle names to deploy in order """
+        order_file = self.options.get('order_file')
+        if not order_file:
+            return [bundles]
+
+        with open(order_file, 'r') as f:
+            order = yaml.load(f) or []
+        groups = []
+        listed = set()
+        for group in order:
+            if not isinstance(group, list):
+                group = [group]
+            for bundle in group:
+                if bundle not in bundles:
+                    raise TaskOptionsError(
+                        'Bundle {} in {} was not found in {}'.format(
+                            bundle,
+                            order_file,
+                            self.options['path'],
+                        )
+                    )
+            listed.update(group)
+            groups.append(group)
+
+        unlisted = [bundle for bundle in bundles if bundle not in listed]
+        if not groups:
+            groups.append([])
+        groups[0] = unlisted + groups[0]
+        return groups
+
+    def _deploy_group(self, path, group):
+        paths = [os.path.join(path, bundle) for bundle in group]
+        if len(paths) > 1 and self.options['merge'] and self._can_merge(paths):
+            units = [paths]
+        else:
+            units = [[bundle_path] for bundle_path in paths]
+
+        if self.options['max_concurrent'] == 1:
+            for unit in units:
+                self._deploy_unit(unit)
+        else:
+            self._deploy_concurrent(units)
+
+    def _can_merge(self, paths):
+        """ Returns True if the bundles can be deployed as one package """
+        names = {}
+        for bundle_path in paths:
+            for name in self._get_bundle_files(bundle_path):
+                if name.startswith('destructiveChanges'):
+                    self.logger.info(
+                        'Not merging bundles, {} has destructive changes'.format(
+                            os.path.basename(bundle_path),
+                        )
+                    )
+                    return False
+                if name == 'package.xml':
+                    continue
+                if name in names:
+                    self.logger.info(
+                        'Not merging bundles, {} is in {} and {}'.format(
+                            name,
+                            names[name],
+                            os.path.basename(bundle_path),
+                        )
+                    )
+                    return False
+                names[name] = os.path.basename(bundle_path)
+        return True
+
+    def _get_bundle_files(self, path):
+        for root, dirs, files in os.walk(path):
+            for f in files:
+                yield os.path.relpath(
+                    os.path.join(root, f),
+                    path,
+                ).replace(os.sep, '/')
+
+    def _deploy_unit(self, unit):
+        api = self._get_unit_api(unit)
+        if not api or self._is_deployed():
+            return
+        result = api()
+        if result == 'Success':
+            self._set_deployed()
+        return result
+
+    def _deploy_concurrent(self, units):
+        """ Deploys the units with at most max_concurrent deploys running.
+            The zips are built and deploys started in this thread and only
+            the polling for results runs in the executor. """
+        executor = ThreadPoolExecutor(
+            max_workers=self.options['max_concurrent'],
+        )
+        running = {}
+        errors = []
+        try:
+            for unit in units:
+                while len(running) >= self.options['max_concurrent']:
+                    self._wait_running(running, errors)
+                if errors:
+                    break
+                api = self._get_unit_api(unit)
+                if not api or self._is_deployed():
+                    continue
+                handle = api.start()
+                running[handle.future(executor)] = self._deploy_hash
+            while running:
+                self._wait_running(running, errors)
+        finally:
+            executor.shutdown()
+        if errors:
+            raise errors[0]
+
+    def _wait_running(self, running, errors):
+        done, not_done = wait(list(running), return_when=FIRST_COMPLETED)
+        for future in done:
+            deploy_hash = running.pop(future)
+            try:
+                result = future.result()
+            except Exception as e:
+                errors.append(e)
                 continue
+            if result == 'Success':
+                self._set_deployed(deploy_hash)
+
+    def _get_unit_api(self, unit):
+        if len(unit) == 1:
+            self.logger.info('Deploying bundle: {}/{}'.format(
+                self.options['path'],
+                os.path.basename(unit[0]),
+            ))
+            return self._get_api(unit[0])
+
+        bundles = [os.path.basename(bundle_path) for bundle_path in unit]
+        self.logger.info('Deploying merged bundles: {}'.format(
+            ', '.join(bundles),
+        ))
+        self._merge_paths = unit
+        try:
+            # The merged path is only used as the key for the deploy hash
+            return self._get_api(os.path.join(
+                os.path.dirname(unit[0]),
+                '+'.join(bundles),
+            ))
+        finally:
+            self._merge_paths = None
 
-            self.logger.info('Deploying bundle: {}/{}'.format(self.options['path'], item))
+    def _write_zip_files(self, zipf, path):
+        if not self._merge_paths:
+            return super(DeployBundles, self)._write_zip_files(zipf, path)
 
-            self._deploy_bundle(item_path)
+        package_xmls = []
+        for bundle_path in self._merge_paths:
+            static_resource_bundles = set()
+            for name in self._get_bundle_files(bundle_path):
+                file_path = os.path.join(bundle_path, *name.split('/'))
+                if name == 'package.xml':
+                    package_xmls.append(file_path)
+                elif name.startswith('staticresources/') and name.count('/') > 1:
+                    static_resource_bundles.add(name.split('/')[1])
+                else:
+                    zipf.write(file_path, name)
+            for bundle in sorted(static_resource_bundles):
+                self._write_static_resource_bundle(zipf, bundle_path, bundle)
+        zipf.writestr(
+            'package.xml',
+            self._merge_package_xml(package_xmls).encode('utf-8'),
+        )
 
-    def _deploy_bundle(self, path):
-        api = self._get_api(path)
-        return api()
+    def _merge_package_xml(self, paths):
+        """ Returns a package.xml with the members of all of the package.xml
+            files and the highest api version """
+        ns = '{http://soap.sforce.com/2006/04/metadata}'
+        items = {}
+        api_version = None
+        for path in paths:
+            root = elementtree_parse_file(path).getroot()
+            for types in root.findall('{}types'.format(ns)):
+                md_type = types.find('{}name'.format(ns)).text
+                members = items.setdefault(md_type, set())
+                for member in types.findall('{}members'.format(ns)):
+                    members.add(member.text)
+            version = root.find('{}version'.format(ns))
+            if version is not None and (
+                api_version is None or
+                LooseVersion(version.text) > LooseVersion(api_version)
+            ):
+                api_version = version.text
+        if api_version is None:
+            api_version = self.project_config.project__package__api_version
+        return package_xml_from_dict(
+            dict((md_type, list(members)) for md_type, members in items.items()),
+            api_version,
+        )
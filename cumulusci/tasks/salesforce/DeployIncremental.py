@@ -0,0 +1,309 @@
+import hashlib
+import json
+import os
+
+import yaml
+
+from cumulusci.core.utils import process_bool_arg
+from cumulusci.tasks.metadata import package
+from cumulusci.tasks.salesforce import Deploy
+from cumulusci.utils import package_xml_from_dict
+
+
+deploy_incremental_options = Deploy.task_options.copy()
+deploy_incremental_options.update({
+    'delete': {
+        'description': "If True, components whose files were all removed since the last deploy are deleted from the org with destructiveChanges.xml.  Defaults to False",
+    },
+    'force': {
+        'description': "If True, deploys all metadata in path and rebuilds the manifest of deployed files.  Defaults to False",
+    },
+})
+
+
+class DeployIncremental(Deploy):
+    """ Deploys only the components changed since the last successful
+    deploy of the path to the org
+
+    A manifest of the hash of each file deployed is stored per org in the
+    project's local directory.  Changed files are mapped to their
+    components using metadata_map.yml and all files of a changed component,
+    including its -meta.xml file or bundle directory, are deployed with a
+    generated package.xml.  Without a manifest, or if the namespace options
+    changed, the whole path is deployed.
+    """
+    task_options = deploy_incremental_options
+
+    # Types for directories whose metadata_map.yml parsers only list the
+    # elements inside of each file
+    file_types = {
+        'matchingRules': 'MatchingRules',
+        'workflows': 'Workflow',
+    }
+
+    # Options which change the deployed content of each file
+    manifest_options = [
+        'namespace_inject',
+        'namespace_strip',
+        'namespace_tokenize',
+        'namespaced_org',
+        'unmanaged',
+        'clean_meta_xml',
+        'managed_src',
+        'unmanaged_ee',
+    ]
+
+    def _init_options(self, kwargs):
+        super(DeployIncremental, self)._init_options(kwargs)
+        self.options['delete'] = process_bool_arg(
+            self.options.get('delete', False)
+        )
+        self.options['force'] = process_bool_arg(
+            self.options.get('force', False)
+        )
+
+    def _get_api(self, path=None):
+        if not path:
+            path = self.task_config.options__path
+        self._path = os.path.abspath(path)
+        self._files = self._hash_files(self._path)
+
+        # None deploys all of the metadata in path
+        self.components = None
+        self.deleted = {}
+
+        previous = self._load_manifest().get(self._path)
+        if self.options['force']:
+            self.logger.info('Deploying all metadata in {}'.format(path))
+        elif not previous:
+            self.logger.info(
+                'No previous deploy of {} to the org, deploying all metadata'.format(path)
+            )
+        elif previous['options'] != self._get_options_hash():
+            self.logger.info(
+                'Deploy options changed since the last deploy, deploying all metadata'
+            )
+        else:
+            changes = self._get_changes(previous['files'])
+            if changes is None:
+                self.logger.info(
+                    'Changed files could not be mapped to components, deploying all metadata'
+                )
+            else:
+                self.components, self.deleted = changes
+                if not self.components and not self.deleted:
+                    self.logger.info(
+                        'No changes since the last deploy of {}'.format(path)
+                    )
+                    return
+                self._log_changes()
+
+        return super(DeployIncremental, self)._get_api(path)
+
+    def _hash_files(self, path):
+        files = {}
+        for root, dirs, filenames in os.walk(path):
+            for filename in filenames:
+                file_path = os.path.join(root, filename)
+                with open(file_path, 'rb') as f:
+                    file_hash = hashlib.sha1(f.read()).hexdigest()
+                name = os.path.relpath(file_path, path).replace(os.sep, '/')
+                files[name] = file_hash
+        return files
+
+    def _get_options_hash(self):
+        options = dict(
+            (option, self.options.get(option))
+            for option in self.manifest_options
+        )
+        options['api_version'] = self.project_config.project__package__api_version
+        return hashlib.sha1(json.dumps(options, sort_keys=True)).hexdigest()
+
+    def _get_changes(self, previous):
+        """ Returns dicts of the changed and deleted components by type or
+            None if a changed file is not part of a known component """
+        current = set()
+        changed = set()
+        for name, file_hash in self._files.items():
+            if name == 'package.xml':
+                continue
+            component = self._get_component(name)
+            if component:
+                current.add(component)
+            if previous.get(name) == file_hash:
+                continue
+            if not component:
+                return
+            changed.add(component)
+
+        deleted = set()
+        for name in previous:
+            if name == 'package.xml' or name in self._files:
+                continue
+            component = self._get_component(name)
+            if not component:
+                return
+            if component in current:
+                # A file was removed from a bundle which still exists
+                changed.add(component)
+            else:
+                deleted.add(component)
+
+        if deleted and not self.options['delete']:
+            for md_type, member in sorted(deleted):
+                self.logger.info(
+                    'Not deleting {}: {}, set the delete option to delete removed components'.format(md_type, member)
+                )
+            deleted = set()
+
+        return self._group_components(changed), self._group_components(deleted)
+
+    def _group_components(self, components):
+        items = {}
+        for md_type, member in components:
+            items.setdefault(md_type, []).append(member)
+        return items
+
+    def _log_changes(self):
+        for label, items in (('Deploying', self.components), ('Deleting', self.deleted)):
+            for md_type, members in sorted(items.items()):
+                for member in sorted(members):
+                    self.logger.info('{} {}: {}'.format(label, md_type, member))
+
+    def _get_metadata_map(self):
+        if not hasattr(self, '_metadata_map'):
+            map_path = os.path.join(
+                os.path.dirname(package.__file__),
+                'metadata_map.yml',
+            )
+            with open(map_path, 'r') as f:
+                self._metadata_map = yaml.load(f)
+        return self._metadata_map
+
+    def _get_type(self, directory, filename):
+        """ Returns the type and parser class for a file in a directory of
+            the package.  filename is None for files inside a bundle. """
+        if directory in self.file_types:
+            return self.file_types[directory], package.MetadataFilenameParser
+        for config in self._get_metadata_map().get(directory, []):
+            parser_class = getattr(package, config['class'])
+            if issubclass(parser_class, package.MetadataXmlElementParser):
+                continue
+            extension = config.get('extension')
+            if filename and extension and not filename.endswith('.' + extension):
+                continue
+            return config['type'], parser_class
+        return None, None
+
+    def _get_component(self, name):
+        """ Returns the (type, member) of the component a file belongs to """
+        parts = name.split('/')
+        if len(parts) < 2:
+            return
+        filename = parts[-1]
+        if filename.endswith('-meta.xml'):
+            filename = filename[:-len('-meta.xml')]
+
+        if len(parts) == 2:
+            md_type, parser_class = self._get_type(parts[0], filename)
+        else:
+            md_type, parser_class = self._get_type(parts[0], None)
+        if not md_type:
+            return
+
+        if issubclass(parser_class, package.MetadataFolderParser):
+            if len(parts) == 2:
+                # The folder's -meta.xml file
+                return md_type, filename
+            if len(parts) > 3:
+                return
+            if not issubclass(parser_class, package.DocumentParser):
+                filename = self._strip_extension(filename)
+            return md_type, '{}/{}'.format(parts[1], filename)
+
+        if len(parts) > 2:
+            # A file in a bundle directory
+            return md_type, parts[1]
+        return md_type, self._strip_extension(filename)
+
+    def _strip_extension(self, filename):
+        if '.' not in filename:
+            return filename
+        return '.'.join(filename.split('.')[:-1])
+
+    def _get_package_xml_items(self, items):
+        # Filename tokens are replaced with content tokens so the namespace
+        # options update the member names in the same way as the filenames
+        return dict(
+            (md_type, [
+                member.replace(
+                    '___NAMESPACE___', '%%%NAMESPACE%%%'
+                ).replace(
+                    '___NAMESPACED_ORG___', '%%%NAMESPACED_ORG%%%'
+                )
+                for member in members
+            ])
+            for md_type, members in items.items()
+        )
+
+    def _write_zip_files(self, zipf, path):
+        if self.components is None:
+            return super(DeployIncremental, self)._write_zip_files(zipf, path)
+
+        bundles = set()
+        for md_type, members in self.components.items():
+            members = set(members)
+            for name in sorted(self._files):
+                component = self._get_component(name)
+                if component and component[0] == md_type and component[1] in members:
+                    if md_type == 'StaticResource' and name.count('/') > 1:
+                        bundles.add(component[1])
+                        continue
+                    zipf.write(os.path.join(path, name), name)
+        for bundle in sorted(bundles):
+            self._write_static_resource_bundle(zipf, path, bundle)
+
+        api_version = self.project_config.project__package__api_version
+        zipf.writestr('package.xml', package_xml_from_dict(
+            self._get_package_xml_items(self.components),
+            api_version,
+        ).encode('utf-8'))
+        if self.deleted:
+            zipf.writestr('destructiveChanges.xml', package_xml_from_dict(
+                self._get_package_xml_items(self.deleted),
+                api_version,
+            ).encode('utf-8'))
+
+    def _is_deployed(self):
+        # The manifest already limits the deploy to changed components
+        return False
+
+    def _get_manifest_path(self):
+        manifest_dir = os.path.join(
+            self.project_config.project_local_dir,
+            'deploy_manifests',
+        )
+        if not os.path.isdir(manifest_dir):
+            os.makedirs(manifest_dir)
+        return os.path.join(
+            manifest_dir,
+            '{}.json'.format(self.org_config.org_id),
+        )
+
+    def _load_manifest(self):
+        manifest_path = self._get_manifest_path()
+        if not os.path.isfile(manifest_path):
+            return {}
+        with open(manifest_path, 'r') as f:
+            return json.load(f)
+
+    def _set_deployed(self, deploy_hash=None):
+        if self.options['check_only']:
+            return
+        manifest = self._load_manifest()
+        manifest[self._path] = {
+            'options': self._get_options_hash(),
+            'files': self._files,
+        }
+        with open(self._get_manifest_path(), 'w') as f:
+            json.dump(manifest, f)
@@ -1,4 +1,6 @@
 from cumulusci.salesforce_api.exceptions import MetadataApiError
+from cumulusci.salesforce_api.installed_packages import get_installed_packages
+from cumulusci.salesforce_api.installed_packages import reset_installed_packages
 from cumulusci.salesforce_api.package_zip import InstallPackageZipBuilder
 from cumulusci.tasks.salesforce import Deploy
 
@@ -46,7 +48,17 @@ class InstallPackageVersion(Deploy):
         return self.api_class(self, package_zip(), purge_on_delete=False)
 
     def _run_task(self):
-        self._retry()
+        installed = get_installed_packages(self)
+        if installed.get(self.options['namespace']) == str(self.options['version']):
+            self.logger.info('{} version {} is already installed'.format(
+                self.options['namespace'],
+                self.options['version'],
+            ))
+            return
+        try:
+            self._retry()
+        finally:
+            reset_installed_packages(self.org_config)
 
     def _try(self):
         api = self._get_api()
@@ -0,0 +1,27 @@
+from cumulusci.salesforce_api.metadata import ApiDeployRecentValidation
+from cumulusci.tasks.salesforce import BaseSalesforceMetadataApiTask
+
+
+class QuickDeploy(BaseSalesforceMetadataApiTask):
+    api_class = ApiDeployRecentValidation
+    name = 'QuickDeploy'
+    task_options = {
+        'validation_id': {
+            'description': "The id of a deployment validated with the check_only option of the deploy task.  In a flow, use ^^<step>.deploy_id to pass the deploy_id returned by the validation step",
+            'required': True,
+        },
+    }
+
+    def _get_api(self):
+        return self.api_class(self, self.options['validation_id'])
+
+    def _run_task(self):
+        self.logger.info(
+            'Deploying recent validation {}'.format(
+                self.options['validation_id'],
+            )
+        )
+        api = self._get_api()
+        result = api()
+        self.return_values['deploy_id'] = api.process_id
+        return result
@@ -0,0 +1,115 @@
+from cumulusci.core.utils import process_bool_arg
+from cumulusci.salesforce_api.metadata import ApiRetrieveUnpackaged
+from cumulusci.tasks.salesforce import BaseRetrieveMetadata
+from cumulusci.tasks.salesforce import BaseSalesforceApiTask
+from cumulusci.utils import package_xml_from_dict
+
+
+retrieve_changes_options = BaseRetrieveMetadata.task_options.copy()
+retrieve_changes_options.update({
+    'api_version': {
+        'description': (
+            'Override the default api version for the retrieve.' +
+            ' Defaults to project__package__api_version'
+        ),
+    },
+    'reset': {
+        'description': (
+            'If True, ignores the revision stored in the org config from' +
+            ' the last run and retrieves all changes tracked in the org.'
+        ),
+    },
+})
+
+
+class RetrieveChanges(BaseRetrieveMetadata, BaseSalesforceApiTask):
+    """ Retrieves metadata changed in a scratch org since the last run
+
+    Uses source tracking in the org to find the changed members with the
+    Tooling API's SourceMember object and retrieves only those members.  The
+    highest revision retrieved is stored in the org config by org id so a
+    recreated scratch org starts over from revision 0.
+    """
+    api_class = ApiRetrieveUnpackaged
+
+    task_options = retrieve_changes_options
+
+    revision_key = 'source_tracking_revisions'
+
+    def _init_options(self, kwargs):
+        super(RetrieveChanges, self)._init_options(kwargs)
+        if 'path' not in self.options:
+            self.options['path'] = 'src'
+        if 'api_version' not in self.options:
+            self.options['api_version'] = (
+                self.project_config.project__package__api_version
+            )
+
+    def _get_revision(self):
+        if process_bool_arg(self.options.get('reset', False)):
+            return 0
+        revisions = self.org_config.config.get(self.revision_key) or {}
+        return revisions.get(self.org_config.org_id, 0)
+
+    def _get_changes(self, revision):
+        soql = (
+            'SELECT MemberName, MemberType, RevisionCounter, IsNameObsolete' +
+            ' FROM SourceMember WHERE RevisionCounter > {}'.format(revision)
+        )
+        return self.tooling.query_all(soql)['records']
+
+    def _run_task(self):
+        revision = self._get_revision()
+        self.logger.info(
+            'Querying for changes since revision {}'.format(revision)
+        )
+        changes = self._get_changes(revision)
+        if not changes:
+            self.logger.info('No changes to retrieve')
+            return
+
+        items = {}
+        for change in changes:
+            revision = max(revision, change['RevisionCounter'])
+            if change['IsNameObsolete']:
+                self.logger.info(
+                    'Skipping deleted {MemberType}: {MemberName}'.format(**change)
+                )
+                continue
+            items.setdefault(change['MemberType'], set()).add(
+                change['MemberName']
+            )
+
+        if items:
+            for md_type, members in sorted(items.items()):
+                for member in sorted(members):
+                    self.logger.info('    {}: {}'.format(md_type, member))
+            package_xml = package_xml_from_dict(
+                dict((md_type, list(members)) for md_type, members in items.items()),
+                self.options['api_version'],
+            )
+            api = self.api_class(self, package_xml, self.options['api_version'])
+            src_zip = api()
+            self._extract_zip(src_zip)
+            self.logger.info(
+                'Extracted retrieved metadata into {}'.format(self.options['path'])
+            )
+
+        self._set_revision(revision)
+
+    def _extract_zip(self, src_zip):
+        src_zip = self._process_namespace(src_zip)
+        # The retrieved package.xml only lists the changed members so it
+        # must not replace the project's package.xml
+        members = [name for name in src_zip.namelist() if name != 'package.xml']
+        src_zip.extractall(self.options['path'], members)
+
+    def _set_revision(self, revision):
+        self.logger.info('Storing source tracking revision {}'.format(revision))
+        # Revisions of other orgs are dropped since they were recorded for
+        # a scratch org which has since been recreated
+        self.org_config.config[self.revision_key] = {
+            self.org_config.org_id: revision,
+        }
+        self.project_config.keychain.set_org(self.org_config)
+        self.return_values['revision'] = revision
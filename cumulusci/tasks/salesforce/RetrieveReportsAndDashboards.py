@@ -1,5 +1,6 @@
 from cumulusci.core.exceptions import TaskOptionsError
-from cumulusci.salesforce_api.metadata import ApiListMetadata
+from cumulusci.core.utils import process_list_arg
+from cumulusci.salesforce_api.inventory import list_metadata
 from cumulusci.salesforce_api.metadata import ApiRetrieveUnpackaged
 from cumulusci.tasks.salesforce import BaseRetrieveMetadata
 from cumulusci.utils import package_xml_from_dict
@@ -36,43 +37,33 @@ class RetrieveReportsAndDashboards(BaseRetrieveMetadata):
             raise TaskOptionsError('You must provide at least one folder name for either report_folders or dashboard_folders')
 
     def _get_api(self):
-        metadata = {}
+        folders = {}
         if 'report_folders' in self.options:
-            for folder in self.options['report_folders']:
-                api_reports = ApiListMetadata(
-                    self,
-                    'Report',
-                    metadata=metadata,
-                    folder=folder,
-                    as_of_version=self.options['api_version'],
-                )
-                metadata = api_reports()
+            folders['Report'] = process_list_arg(self.options['report_folders'])
         if 'dashboard_folders' in self.options:
-            for folder in self.options['dashboard_folders']:
-                api_dashboards = ApiListMetadata(
-                    self,
-                    'Dashboard',
-                    metadata=metadata,
-                    folder=folder,
-                    as_of_version=self.options['api_version'],
-                )
-                metadata = api_dashboards()
+            folders['Dashboard'] = process_list_arg(self.options['dashboard_folders'])
+
+        queries = [
+            (md_type, folder)
+            for md_type, type_folders in folders.items()
+            for folder in type_folders
+        ]
+        results = list_metadata(
+            self,
+            queries,
+            api_version=self.options['api_version'],
+        )
 
         items = {}
-        if 'Report' in metadata:
-            items['Report'] = []
-            items['Report'].extend(self.options['report_folders'])
-            for report in metadata['Report']:
-                items['Report'].append(report['fullName'])
-        if 'Dashboard' in metadata:
-            items['Dashboard'] = []
-            items['Dashboard'].extend(self.options['dashboard_folders'])
-            for dashboard in metadata['Dashboard']:
-                items['Dashboard'].append(dashboard['fullName'])
+        for md_type, type_folders in folders.items():
+            items[md_type] = list(type_folders)
+        for (md_type, folder), components in zip(queries, results):
+            items[md_type].extend(
+                component['fullName'] for component in components
+            )
 
         api_version = self.project_config.project__package__api_version
         package_xml = package_xml_from_dict(items, api_version)
-        print(package_xml)
         return self.api_class(
             self,
             package_xml,
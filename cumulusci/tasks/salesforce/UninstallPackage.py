@@ -1,3 +1,4 @@
+from cumulusci.salesforce_api.installed_packages import reset_installed_packages
 from cumulusci.salesforce_api.package_zip import UninstallPackageZipBuilder
 from cumulusci.tasks.salesforce import Deploy
 
@@ -29,3 +30,7 @@ class UninstallPackage(Deploy):
             self.project_config.project__package__api_version,
         )
         return self.api_class(self, package_zip(), purge_on_delete=self.options['purge_on_delete'])
+
+    def _deploy_succeeded(self, deploy_hash=None):
+        super(UninstallPackage, self)._deploy_succeeded(deploy_hash)
+        reset_installed_packages(self.org_config)
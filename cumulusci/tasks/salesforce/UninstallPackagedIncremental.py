@@ -1,9 +1,11 @@
+import io
 import os
-import shutil
-import tempfile
 
 import xmltodict
 
+from cumulusci.core.exceptions import TaskOptionsError
+from cumulusci.salesforce_api.inventory import OrgMetadataInventory
+from cumulusci.salesforce_api.metadata import ApiRetrievePackaged
 from cumulusci.tasks.salesforce import UninstallPackaged
 from cumulusci.utils import package_xml_from_dict
 
@@ -11,6 +13,8 @@ from cumulusci.utils import package_xml_from_dict
 class UninstallPackagedIncremental(UninstallPackaged):
     name = 'UninstallPackagedIncremental'
     skip_types = ['RecordType','Scontrol']
+    folder_types = ['Dashboard', 'Document', 'EmailTemplate', 'Report']
+    packaged_states = ['beta', 'released']
     task_options = {
         'path': {
             'description': 'The local path to compare to the retrieved packaged metadata from the org.  Defaults to src',
@@ -24,6 +28,9 @@ class UninstallPackagedIncremental(UninstallPackaged):
             'description': 'Sets the purgeOnDelete option for the deployment.  Defaults to True',
             'required': True,
         },
+        'manifest': {
+            'description': "How to find the metadata in the package in the target org.  retrieve (the default) retrieves the package to read its package.xml.  list_metadata uses listMetadata for the metadata types in the local package.xml and is much faster, but only finds metadata in a managed package namespace so it is only for use with a packaging org.  It does not delete metadata of a type which was removed from the local package.xml entirely",
+        },
     }
 
     def _init_options(self, kwargs):
@@ -34,83 +41,120 @@ class UninstallPackagedIncremental(UninstallPackaged):
             self.options['purge_on_delete'] = True
         if self.options['purge_on_delete'] == 'False':
             self.options['purge_on_delete'] = False
+        if 'manifest' not in self.options:
+            self.options['manifest'] = 'retrieve'
 
-    def _get_destructive_changes(self, path=None):
-        self.logger.info('Retrieving metadata in package {} from target org'.format(self.options['package']))
-        packaged = self._retrieve_packaged()
-
-        tempdir = tempfile.mkdtemp()
-        packaged.extractall(tempdir)
+    def _validate_options(self):
+        super(UninstallPackagedIncremental, self)._validate_options()
+        if self.options['manifest'] not in ('retrieve', 'list_metadata'):
+            raise TaskOptionsError(
+                'manifest must be either retrieve or list_metadata'
+            )
 
-        destructive_changes = self._package_xml_diff(
+    def _get_destructive_changes(self, path=None):
+        master_items = self._get_package_xml_items(
             os.path.join(self.options['path'], 'package.xml'),
-            os.path.join(tempdir, 'package.xml'),
         )
+        if self.options['manifest'] == 'list_metadata':
+            compare_items = self._get_packaged_items_from_org(master_items)
+        else:
+            compare_items = self._get_packaged_items_from_retrieve()
+
+        destructive_changes = self._diff_items(master_items, compare_items)
 
-        shutil.rmtree(tempdir)
         if destructive_changes:
             self.logger.info('Deleting metadata in package {} from target org'.format(self.options['package']))
         else:
             self.logger.info('No metadata found to delete')
         return destructive_changes
 
-    def _package_xml_diff(self, master, compare):
-        master_xml = xmltodict.parse(open(master, 'r'))
-        compare_xml = xmltodict.parse(open(compare, 'r'))
-
-        delete = {}
+    def _get_packaged_items_from_retrieve(self):
+        self.logger.info('Retrieving metadata in package {} from target org'.format(self.options['package']))
+        retrieve_api = ApiRetrievePackaged(
+            self,
+            self.options['package'],
+            self.project_config.project__package__api_version
+        )
+        packaged = retrieve_api()
+        # Only the manifest is needed so read it directly from the zip
+        # rather than extracting the retrieved metadata
+        package_xml = packaged.read('{}/package.xml'.format(self.options['package']))
+        return self._get_package_xml_items(io.BytesIO(package_xml))
+
+    def _get_packaged_items_from_org(self, master_items):
+        namespace = self.project_config.project__package__namespace
+        if not namespace:
+            raise TaskOptionsError(
+                'The list_metadata manifest requires project__package__namespace'
+            )
+        self.logger.info(
+            'Listing metadata in namespace {} from target org'.format(namespace)
+        )
+        # listMetadata requires folder names for folder based types.  The
+        # folders are the members without a / in the local package.xml
+        folders = {}
+        for md_type in self.folder_types:
+            if md_type in master_items:
+                folders[md_type] = [
+                    member for member in master_items[md_type]
+                    if '/' not in member
+                ]
+        inventory = OrgMetadataInventory(self)
+        inventory.refresh(list(master_items.keys()), folders=folders)
+        members = inventory.get_members(
+            types=list(master_items.keys()),
+            namespace=namespace,
+            manageable_states=self.packaged_states,
+        )
+        return dict(
+            (md_type, set(type_members))
+            for md_type, type_members in members.items()
+        )
 
-        master_items = {}
-        compare_items = {}
-        md_types = master_xml['Package'].get('types', [])
-        if not isinstance(md_types, list):
-            # needed when only 1 metadata type is found
-            md_types = [md_types]
-        for md_type in md_types:
-            master_items[md_type['name']] = []
-            if 'members' not in md_type:
-                continue
-            if isinstance(md_type['members'], unicode):
-                master_items[md_type['name']].append(md_type['members'])
-            else:
-                for item in md_type['members']:
-                    master_items[md_type['name']].append(item)
+    def _get_package_xml_items(self, package_xml):
+        """ Parse a package.xml path or file object into a dict of metadata
+        type to a set of members """
+        if isinstance(package_xml, basestring):
+            with open(package_xml, 'r') as f:
+                package = xmltodict.parse(f)
+        else:
+            package = xmltodict.parse(package_xml)
 
-        md_types = compare_xml['Package'].get('types', [])
+        items = {}
+        md_types = package['Package'].get('types', [])
         if not isinstance(md_types, list):
             # needed when only 1 metadata type is found
             md_types = [md_types]
         for md_type in md_types:
-            compare_items[md_type['name']] = []
-            if 'members' not in md_type:
-                continue
-            if isinstance(md_type['members'], unicode):
-                compare_items[md_type['name']].append(md_type['members'])
-            else:
-                for item in md_type['members']:
-                    compare_items[md_type['name']].append(item)
+            members = md_type.get('members', [])
+            if isinstance(members, basestring):
+                members = [members]
+            items.setdefault(md_type['name'], set()).update(members)
+        return items
 
+    def _diff_items(self, master_items, compare_items):
+        delete = {}
         for md_type, members in compare_items.items():
-            if md_type not in master_items:
-                delete[md_type] = members
+            if md_type in self.skip_types:
                 continue
-
-            for member in members:
-                if member not in master_items[md_type]:
-                    if md_type not in delete:
-                        delete[md_type] = []
-                    delete[md_type].append(member)
+            missing = members - master_items.get(md_type, set())
+            if missing:
+                delete[md_type] = sorted(missing)
 
         if delete:
             self.logger.info('Deleting metadata:')
-            for skip_type in self.skip_types:
-                delete.pop(skip_type, None)
-            for md_type, members in delete.items():
+            for md_type, members in sorted(delete.items()):
                 for member in members:
                     self.logger.info('    {}: {}'.format(md_type, member))
             destructive_changes = self._render_xml_from_items_dict(delete)
             return destructive_changes
 
+    def _package_xml_diff(self, master, compare):
+        return self._diff_items(
+            self._get_package_xml_items(master),
+            self._get_package_xml_items(compare),
+        )
+
     def _render_xml_from_items_dict(self, items):
         return package_xml_from_dict(
             items, 
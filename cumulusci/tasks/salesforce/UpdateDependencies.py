@@ -1,15 +1,22 @@
 from distutils.version import LooseVersion
+import threading
+import time
 
+from concurrent.futures import ThreadPoolExecutor
+
+from cumulusci.core.github import GithubArchiveCache
 from cumulusci.core.utils import process_bool_arg
 from cumulusci.salesforce_api.metadata import ApiDeploy
-from cumulusci.salesforce_api.metadata import ApiRetrieveInstalledPackages
 from cumulusci.salesforce_api.package_zip import InstallPackageZipBuilder
 from cumulusci.salesforce_api.package_zip import UninstallPackageZipBuilder
+from cumulusci.salesforce_api.installed_packages import get_installed_packages
+from cumulusci.salesforce_api.installed_packages import reset_installed_packages
 from cumulusci.salesforce_api.package_zip import ZipfilePackageZipBuilder
 from cumulusci.tasks.salesforce import BaseSalesforceMetadataApiTask
 from cumulusci.utils import download_extract_zip
 from cumulusci.utils import zip_inject_namespace
 from cumulusci.utils import zip_strip_namespace
+from cumulusci.utils import zip_subfolder
 from cumulusci.utils import zip_tokenize_namespace
 
 
@@ -23,8 +30,21 @@ class UpdateDependencies(BaseSalesforceMetadataApiTask):
         'purge_on_delete': {
             'description': 'Sets the purgeOnDelete option for the deployment. Defaults to True',
         },
+        'dry_run': {
+            'description': 'If True, logs the plan of the packages to install, upgrade and uninstall without changing the org.  Defaults to False',
+        },
+        'prefetch_workers': {
+            'description': 'The number of dependency zips downloaded and built at the same time while packages are installed in order. Defaults to 4',
+        },
     }
 
+    # Phases timed by the task in the order they are logged.  download and
+    # build are summed across the prefetch workers and wait is the time
+    # installs waited for a zip to be built.
+    timing_phases = ['download', 'build', 'wait', 'uninstall', 'install']
+
+    archive_cache = None
+
     def _init_options(self, kwargs):
         super(UpdateDependencies, self)._init_options(kwargs)
         if 'purge_on_delete' not in self.options:
@@ -33,6 +53,14 @@ class UpdateDependencies(BaseSalesforceMetadataApiTask):
             self.options['purge_on_delete'].lower() == 'false'):
             self.options['purge_on_delete'] = False
         self.options['namespaced_org'] = process_bool_arg(self.options.get('namespaced_org', False))
+        self.options['dry_run'] = process_bool_arg(
+            self.options.get('dry_run', False)
+        )
+        self.options['prefetch_workers'] = int(
+            self.options.get('prefetch_workers', 4)
+        )
+        self.timings = {}
+        self._timings_lock = threading.Lock()
 
     def _run_task(self):
         if not self.project_config.project__dependencies:
@@ -43,8 +71,6 @@ class UpdateDependencies(BaseSalesforceMetadataApiTask):
         dependencies = self.project_config.get_static_dependencies()
 
         self.installed = self._get_installed()
-        self.uninstall_queue = []
-        self.install_queue = []
 
         self.logger.info('Dependencies:')
         for line in self.project_config.pretty_dependencies(dependencies):
@@ -52,23 +78,59 @@ class UpdateDependencies(BaseSalesforceMetadataApiTask):
                 continue
             self.logger.info(line)
 
+        self._plan_dependencies(dependencies)
+        self._log_plan()
+        if self.options['dry_run']:
+            self.logger.info('Dry run, no dependencies were installed or uninstalled')
+            return
+
+        # The zips to install are downloaded and built while packages are
+        # uninstalled and installed
+        builds = self._start_builds()
+        try:
+            self._uninstall_dependencies()
+            self._install_dependencies(builds)
+        finally:
+            self._stop_builds(builds)
+            if self.uninstall_queue or self.install_queue:
+                reset_installed_packages(self.org_config)
+        self._log_timings()
+
+    def _plan_dependencies(self, dependencies):
+        """ Compares the dependencies with the installed packages and queues
+            the fewest uninstalls and installs needed to reach them.  The
+            steps are stored in self.plan in the order they run. """
+        self.uninstall_queue = []
+        self.install_queue = []
+        self.plan = []
+        self._install_steps = []
+        self._planned = {}
+        self._uninstalled = set()
+
         self._process_dependencies(dependencies)
 
-        # Reverse the uninstall queue
+        # Packages are uninstalled before the packages they depend on
         self.uninstall_queue.reverse()
-
-        self._uninstall_dependencies()
-        self._install_dependencies()
+        self.plan = [
+            self._get_plan_step(
+                'uninstall',
+                dependency,
+                installed=self.installed[dependency['namespace']],
+            )
+            for dependency in self.uninstall_queue
+        ] + self._install_steps
 
     def _process_dependencies(self, dependencies):
+        """ Plans the dependencies, children first.  Returns True if any
+            package in dependencies or their children is uninstalled. """
+        uninstalled = False
         for dependency in dependencies:
             # Process child dependencies
             dependency_uninstalled = False
             if 'dependencies' in dependency and dependency['dependencies']:
-                count_uninstall = len(self.uninstall_queue)
-                self._process_dependencies(dependency['dependencies'])
-                if count_uninstall != len(self.uninstall_queue):
-                    dependency_uninstalled = True
+                dependency_uninstalled = self._process_dependencies(
+                    dependency['dependencies']
+                )
 
             # Process zip_url dependencies (unmanaged metadata)
             if 'zip_url' in dependency:
@@ -76,132 +138,264 @@ class UpdateDependencies(BaseSalesforceMetadataApiTask):
 
             # Process namespace dependencies (managed packages)
             elif 'namespace' in dependency:
-                self._process_namespace_dependency(dependency, dependency_uninstalled)
+                if self._process_namespace_dependency(dependency, dependency_uninstalled):
+                    dependency_uninstalled = True
+
+            uninstalled = uninstalled or dependency_uninstalled
+        return uninstalled
 
     def _process_zip_dependency(self, dependency):
-        self.install_queue.append(dependency)    
+        # The same bundle can be required by more than one dependency
+        key = tuple(dependency.get(option) for option in (
+            'zip_url',
+            'subfolder',
+            'namespace_tokenize',
+            'namespace_inject',
+            'namespace_strip',
+            'unmanaged',
+        ))
+        if key in self._planned:
+            return
+        self._planned[key] = True
+        self._queue_install('deploy', dependency)
 
     def _process_namespace_dependency(self, dependency, dependency_uninstalled=None):
+        """ Plans the install of a package.  Returns True if the package is
+            uninstalled. """
+        namespace = dependency['namespace']
         dependency_version = str(dependency['version'])
 
-        if dependency['namespace'] in self.installed:
-            # Some version is installed, check what to do
-            installed_version = self.installed[dependency['namespace']]
-            if dependency_version == installed_version:
-                self.logger.info('  {}: version {} already installed'.format(
-                    dependency['namespace'],
-                    dependency_version,
-                ))
-                return
-
-            required_version = LooseVersion(dependency_version)
-            installed_version = LooseVersion(installed_version)
-
-            if 'Beta' in installed_version.vstring:
-                # Always uninstall Beta versions if required is different
-                self.uninstall_queue.append(dependency)
-                self.logger.info('  {}: Uninstall {} to upgrade to {}'.format(
-                    dependency['namespace'],
-                    installed_version,
-                    dependency['version'],
-                ))
-            elif dependency_uninstalled:
-                # If a dependency of this one needs to be uninstalled, always uninstall the package
-                self.uninstall_queue.append(dependency)
-                self.logger.info('  {}: Uninstall and Reinstall to allow downgrade of dependency'.format(
-                    dependency['namespace'],
-                ))
-            elif required_version < installed_version:
-                # Uninstall to downgrade
-                self.uninstall_queue.append(dependency)
-                self.logger.info('  {}: Downgrade from {} to {} (requires uninstall/install)'.format(
-                    dependency['namespace'],
-                    installed_version,
-                    dependency['version'],
-                ))
-            else:
-                self.logger.info('  {}: Upgrade from {} to {}'.format(
-                    dependency['namespace'],
-                    installed_version,
-                    dependency['version'],
-                ))
-            self.install_queue.append(dependency)
-        else:
+        if namespace in self._planned:
+            # Packages required by more than one dependency are only
+            # installed once
+            if self._planned[namespace] != dependency_version:
+                self.logger.warning(
+                    '{} version {} is also required, using version {}'.format(
+                        namespace,
+                        dependency_version,
+                        self._planned[namespace],
+                    )
+                )
+            return namespace in self._uninstalled
+        self._planned[namespace] = dependency_version
+
+        if namespace not in self.installed:
             # Just a regular install
-            self.logger.info('  {}: Install version {}'.format(
-                    dependency['namespace'],
-                    dependency['version'],
+            self._queue_install('install', dependency)
+            return False
+
+        installed_version = self.installed[namespace]
+        if dependency_uninstalled:
+            # A package can't be installed while it depends on the package
+            # being uninstalled, so always uninstall and reinstall it
+            reason = 'a dependency is uninstalled'
+        elif dependency_version == installed_version:
+            self._install_steps.append(self._get_plan_step(
+                'skip',
+                dependency,
+                installed=installed_version,
             ))
-            self.install_queue.append(dependency)
+            return False
+        elif 'Beta' in installed_version:
+            # Beta versions can't be upgraded
+            reason = 'beta versions can not be upgraded'
+        elif LooseVersion(dependency_version) < LooseVersion(installed_version):
+            reason = 'downgrades require an uninstall'
+        else:
+            # Upgrade in place
+            self._queue_install('upgrade', dependency, installed=installed_version)
+            return False
+
+        self.uninstall_queue.append(dependency)
+        self._uninstalled.add(namespace)
+        self._queue_install('install', dependency, reason=reason)
+        return True
+
+    def _queue_install(self, action, dependency, installed=None, reason=None):
+        self.install_queue.append(dependency)
+        self._install_steps.append(self._get_plan_step(
+            action,
+            dependency,
+            installed=installed,
+            reason=reason,
+        ))
+
+    def _get_plan_step(self, action, dependency, installed=None, reason=None):
+        """ Returns a dict describing a step of the plan.  The dependency
+            itself isn't included since it can contain auth headers. """
+        if 'zip_url' in dependency:
+            return {
+                'action': action,
+                'zip_url': dependency['zip_url'],
+                'subfolder': dependency.get('subfolder') or '',
+            }
+        return {
+            'action': action,
+            'namespace': dependency['namespace'],
+            'version': str(dependency['version']),
+            'installed': installed,
+            'reason': reason,
+        }
+
+    def _log_plan(self):
+        self.logger.info('Dependency plan:')
+        for step in self.plan:
+            if step['action'] == 'deploy':
+                message = 'Deploy unmanaged metadata from /{subfolder} of {zip_url}'
+            elif step['action'] == 'skip':
+                message = '{namespace}: version {version} already installed'
+            elif step['action'] == 'upgrade':
+                message = '{namespace}: Upgrade from {installed} to {version}'
+            elif step['action'] == 'uninstall':
+                message = '{namespace}: Uninstall version {installed}'
+            else:
+                message = '{namespace}: Install version {version}'
+            if step.get('reason'):
+                message += ' ({reason})'
+            self.logger.info('  ' + message.format(**step))
+        self.return_values['plan'] = self.plan
 
     def _get_installed(self):
-        self.logger.info('Retrieving list of packages from target org')
-        api = ApiRetrieveInstalledPackages(self)
-        return api()
+        return get_installed_packages(self)
 
     def _uninstall_dependencies(self):
         for dependency in self.uninstall_queue:
+            start = time.time()
             self._uninstall_dependency(dependency)
+            self._add_timing('uninstall', time.time() - start)
+
+    def _start_builds(self):
+        """ Starts downloading and building the zips for the install queue in
+            the background so they are ready when their turn to install
+            comes.  Returns a list of futures in the order of the queue. """
+        self.archive_cache = GithubArchiveCache()
+        self._executor = ThreadPoolExecutor(
+            max_workers=self.options['prefetch_workers'],
+        )
+        return [
+            self._executor.submit(self._build_dependency_zip, dependency)
+            for dependency in self.install_queue
+        ]
+
+    def _stop_builds(self, builds):
+        # Don't start builds for dependencies after a failed install
+        for build in builds:
+            build.cancel()
+        self._executor.shutdown()
 
-    def _install_dependencies(self):
-        for dependency in self.install_queue:
-            self._install_dependency(dependency)
+    def _install_dependencies(self, builds):
+        """ Installs the dependencies in order.  builds is the list of
+            futures from _start_builds """
+        for dependency, build in zip(self.install_queue, builds):
+            start = time.time()
+            package_zip = build.result()
+            self._add_timing('wait', time.time() - start)
+            start = time.time()
+            self._deploy_dependency_zip(dependency, package_zip)
+            self._add_timing('install', time.time() - start)
 
-    def _install_dependency(self, dependency):
+    def _deploy_dependency_zip(self, dependency, package_zip):
         if 'zip_url' in dependency:
             self.logger.info('Deploying unmanaged metadata from /{} of {}'.format(
                 dependency['subfolder'],
                 dependency['zip_url'],
             ))
-            package_zip = download_extract_zip(
-                dependency['zip_url'],
-                subfolder=dependency.get('subfolder'),
-                headers=dependency.get('headers', {}),
-            )
-            if dependency.get('namespace_tokenize'):
-                self.logger.info('Replacing namespace prefix {}__ in files and filenames with namespace token strings'.format(
-                    '{}__'.format(dependency['namespace_tokenize']),
-                ))
-                package_zip = zip_tokenize_namespace(
-                    package_zip,
-                    namespace = dependency['namespace_tokenize'],
-                    logger = self.logger,
-                )
-                
-            if dependency.get('namespace_inject'):
-                self.logger.info('Replacing namespace tokens with {}'.format(
-                    '{}__'.format(dependency['namespace_inject']),
-                ))
-                package_zip = zip_inject_namespace(
-                    package_zip,
-                    namespace = dependency['namespace_inject'],
-                    managed = not dependency.get('unmanaged'),
-                    namespaced_org = self.options['namespaced_org'],
-                    logger = self.logger,
-                )
-                
-            if dependency.get('namespace_strip'):
-                self.logger.info('Removing namespace prefix {}__ from all files and filenames'.format(
-                    '{}__'.format(dependency['namespace_strip']),
-                ))
-                package_zip = zip_strip_namespace(
-                    package_zip,
-                    namespace = dependency['namespace_strip'],
-                    logger = self.logger,
-                )
-                
-            package_zip = ZipfilePackageZipBuilder(package_zip)()
-
         elif 'namespace' in dependency:
             self.logger.info('Installing {} version {}'.format(
                 dependency['namespace'],
                 dependency['version'],
             ))
-            package_zip = InstallPackageZipBuilder(dependency['namespace'], dependency['version'])()
-            
         api = self.api_class(self, package_zip, purge_on_delete=self.options['purge_on_delete'])
         return api()
 
+    def _build_dependency_zip(self, dependency):
+        """ Returns the base64 encoded zip to deploy for the dependency """
+        if 'namespace' in dependency and 'zip_url' not in dependency:
+            return InstallPackageZipBuilder(dependency['namespace'], dependency['version'])()
+
+        start = time.time()
+        package_zip = self._download_dependency_zip(dependency)
+        self._add_timing('download', time.time() - start)
+
+        start = time.time()
+        if dependency.get('namespace_tokenize'):
+            self.logger.info('Replacing namespace prefix {}__ in files and filenames with namespace token strings'.format(
+                '{}__'.format(dependency['namespace_tokenize']),
+            ))
+            package_zip = zip_tokenize_namespace(
+                package_zip,
+                namespace = dependency['namespace_tokenize'],
+                logger = self.logger,
+            )
+
+        if dependency.get('namespace_inject'):
+            self.logger.info('Replacing namespace tokens with {}'.format(
+                '{}__'.format(dependency['namespace_inject']),
+            ))
+            package_zip = zip_inject_namespace(
+                package_zip,
+                namespace = dependency['namespace_inject'],
+                managed = not dependency.get('unmanaged'),
+                namespaced_org = self.options['namespaced_org'],
+                logger = self.logger,
+            )
+
+        if dependency.get('namespace_strip'):
+            self.logger.info('Removing namespace prefix {}__ from all files and filenames'.format(
+                '{}__'.format(dependency['namespace_strip']),
+            ))
+            package_zip = zip_strip_namespace(
+                package_zip,
+                namespace = dependency['namespace_strip'],
+                logger = self.logger,
+            )
+
+        package_zip = ZipfilePackageZipBuilder(package_zip)()
+        self._add_timing('build', time.time() - start)
+        return package_zip
+
+    def _add_timing(self, phase, seconds):
+        with self._timings_lock:
+            self.timings[phase] = self.timings.get(phase, 0) + seconds
+
+    def _log_timings(self):
+        self.logger.info('Dependency timings:')
+        for phase in self.timing_phases:
+            if phase in self.timings:
+                self.logger.info('  {}: {:.1f}s'.format(
+                    phase,
+                    self.timings[phase],
+                ))
+        self.return_values['timings'] = self.timings
+
+    def _download_dependency_zip(self, dependency):
+        if 'ref' not in dependency:
+            return download_extract_zip(
+                dependency['zip_url'],
+                subfolder=dependency.get('subfolder'),
+                headers=dependency.get('headers', {}),
+                logger=self.logger,
+            )
+
+        # Archives of a Github commit are cached so each is only downloaded
+        # once for all of the subfolders deployed from it
+        if self.archive_cache is None:
+            self.archive_cache = GithubArchiveCache()
+        archive = self.archive_cache.open(
+            dependency['repo_owner'],
+            dependency['repo_name'],
+            dependency['ref'],
+            dependency['zip_url'],
+            headers=dependency.get('headers', {}),
+            logger=self.logger,
+        )
+        if not dependency.get('subfolder'):
+            return archive
+        try:
+            return zip_subfolder(archive, dependency['subfolder'])
+        finally:
+            archive.close()
+
     def _uninstall_dependency(self, dependency):
         self.logger.info('Uninstalling {}'.format(dependency['namespace']))
         package_zip = UninstallPackageZipBuilder(
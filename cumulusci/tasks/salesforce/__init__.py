@@ -15,9 +15,11 @@ from cumulusci.tasks.salesforce.SOQLQuery import SOQLQuery
 from cumulusci.tasks.salesforce.BaseRetrieveMetadata import BaseRetrieveMetadata
 from cumulusci.tasks.salesforce.Deploy import Deploy
 from cumulusci.tasks.salesforce.GetInstalledPackages import GetInstalledPackages
+from cumulusci.tasks.salesforce.QuickDeploy import QuickDeploy
 from cumulusci.tasks.salesforce.UpdateDependencies import UpdateDependencies
 
 # inherit from BaseRetrieveMetadata
+from cumulusci.tasks.salesforce.RetrieveChanges import RetrieveChanges
 from cumulusci.tasks.salesforce.RetrievePackaged import RetrievePackaged
 from cumulusci.tasks.salesforce.RetrieveReportsAndDashboards import RetrieveReportsAndDashboards
 from cumulusci.tasks.salesforce.RetrieveUnpackaged import RetrieveUnpackaged
@@ -26,6 +28,7 @@ from cumulusci.tasks.salesforce.RetrieveUnpackaged import RetrieveUnpackaged
 from cumulusci.tasks.salesforce.BaseUninstallMetadata import BaseUninstallMetadata
 from cumulusci.tasks.salesforce.CreatePackage import CreatePackage
 from cumulusci.tasks.salesforce.DeployBundles import DeployBundles
+from cumulusci.tasks.salesforce.DeployIncremental import DeployIncremental
 from cumulusci.tasks.salesforce.InstallPackageVersion import InstallPackageVersion
 from cumulusci.tasks.salesforce.UninstallPackage import UninstallPackage
 from cumulusci.tasks.salesforce.UpdateAdminProfile import UpdateAdminProfile
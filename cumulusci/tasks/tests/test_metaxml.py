@@ -0,0 +1,64 @@
+""" Tests for the -meta.xml tasks """
+
+import os
+import unittest
+
+from cumulusci.core.config import TaskConfig
+from cumulusci.tasks.metaxml import UpdateApi
+from cumulusci.tasks.metaxml import UpdateDependencies
+from cumulusci.tests.util import create_project_config
+from cumulusci.utils import temporary_dir
+
+CLASS_META_XML = '''<?xml version="1.0" encoding="UTF-8"?>
+<ApexClass xmlns="http://soap.sforce.com/2006/04/metadata">
+    <apiVersion>{}</apiVersion>
+    <packageVersions>
+        <majorNumber>1</majorNumber>
+        <minorNumber>0</minorNumber>
+        <namespace>foo</namespace>
+    </packageVersions>
+    <status>Active</status>
+</ApexClass>
+'''
+
+
+class TestMetaXmlTasks(unittest.TestCase):
+
+    def _write_meta_xml(self, d, api_version):
+        classes = os.path.join(d, 'classes')
+        os.mkdir(classes)
+        for name in ('Foo', 'Bar'):
+            path = os.path.join(classes, '{}.cls-meta.xml'.format(name))
+            with open(path, 'w') as f:
+                f.write(CLASS_META_XML.format(api_version))
+        with open(os.path.join(classes, 'Foo.cls'), 'w') as f:
+            f.write('public class Foo {}')
+        return os.path.join(classes, 'Foo.cls-meta.xml')
+
+    def test_update_api(self):
+        with temporary_dir() as d:
+            path = self._write_meta_xml(d, '39.0')
+            task = UpdateApi(
+                create_project_config('TestRepo', 'TestOwner'),
+                TaskConfig({'options': {'dir': d, 'version': '41.0'}}),
+            )
+            task()
+
+            with open(path, 'r') as f:
+                self.assertEqual(CLASS_META_XML.format('41.0'), f.read())
+
+    def test_update_dependencies(self):
+        with temporary_dir() as d:
+            path = self._write_meta_xml(d, '41.0')
+            project_config = create_project_config('TestRepo', 'TestOwner')
+            project_config.config['project']['dependencies'] = [
+                {'namespace': 'foo', 'version': '1.2'},
+            ]
+            task = UpdateDependencies(
+                project_config,
+                TaskConfig({'options': {'dir': d}}),
+            )
+            task()
+
+            with open(path, 'r') as f:
+                self.assertIn('<minorNumber>2</minorNumber>', f.read())
@@ -1,4 +1,12 @@
+import base64
+import io
+import json
+import os
+import shutil
+import sys
+import tempfile
 import unittest
+import zipfile
 
 from mock import MagicMock
 from mock import patch
@@ -8,8 +16,18 @@ from cumulusci.core.config import BaseGlobalConfig
 from cumulusci.core.config import BaseProjectConfig
 from cumulusci.core.config import OrgConfig
 from cumulusci.core.config import TaskConfig
+from cumulusci.core.exceptions import TaskOptionsError
 from cumulusci.core.keychain import BaseProjectKeychain
+from cumulusci.salesforce_api.exceptions import MetadataApiError
 from cumulusci.tasks.salesforce import BaseSalesforceApiTask
+from cumulusci.tasks.salesforce import Deploy
+from cumulusci.tasks.salesforce import DeployBundles
+from cumulusci.tasks.salesforce import DeployIncremental
+from cumulusci.tasks.salesforce import RetrieveChanges
+from cumulusci.tasks.salesforce import RetrieveReportsAndDashboards
+from cumulusci.tasks.salesforce import UninstallPackage
+from cumulusci.tasks.salesforce import UninstallPackagedIncremental
+from cumulusci.tasks.salesforce import UpdateDependencies
 
 
 @patch('cumulusci.tasks.salesforce.BaseSalesforceTask._update_credentials',
@@ -40,3 +58,944 @@ class TestSalesforceToolingTask(unittest.TestCase):
         obj = task._get_tooling_object('TestObject')
         url = self.base_tooling_url + 'sobjects/TestObject/'
         self.assertEqual(obj.base_url, url)
+
+
+class SalesforceTaskTestCase(unittest.TestCase):
+    """ Sets up the project and org configs shared by the tests which
+    create a task_class task """
+
+    task_class = None
+
+    def setUp(self):
+        self.api_version = 36.0
+        self.global_config = BaseGlobalConfig(
+            {'project': {'package': {'api_version': self.api_version}}})
+        self.project_config = BaseProjectConfig(self.global_config)
+        self.project_config.config['project'] = {
+            'package': {
+                'api_version': self.api_version,
+            }
+        }
+        self.project_config.set_keychain(
+            BaseProjectKeychain(self.project_config, None))
+        self.org_config = OrgConfig({
+            'instance_url': 'example.com',
+            'access_token': 'abc123',
+            'org_id': '00D000000000001',
+        }, 'test')
+
+    def _create_task(self, options=None):
+        task_config = TaskConfig({'options': options or {}})
+        return self.task_class(
+            self.project_config, task_config, self.org_config)
+
+    def _get_deploy_hashes(self):
+        """ Returns the deploy hashes stored for the org """
+        return self.org_config.config['deploy_hashes'][self.org_config.org_id]
+
+    def _write_file(self, name, content):
+        """ Writes a file below self.path """
+        path = os.path.join(self.path, *name.split('/'))
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        with open(path, 'w') as f:
+            f.write(content)
+
+
+deploy_module = sys.modules[Deploy.__module__]
+
+
+@patch('cumulusci.tasks.salesforce.BaseSalesforceTask._update_credentials',
+    MagicMock(return_value=None))
+class TestDeploy(SalesforceTaskTestCase):
+
+    task_class = Deploy
+
+    def _create_task(self, options):
+        return super(TestDeploy, self)._create_task(dict(options, path='src'))
+
+    def test_check_only_run_tests(self):
+        task = self._create_task({
+            'check_only': 'True',
+            'test_level': 'RunSpecifiedTests',
+            'run_tests': 'TEST_Foo, TEST_Bar',
+        })
+        self.assertTrue(task.options['check_only'])
+        self.assertEqual(['TEST_Foo', 'TEST_Bar'], task.options['run_tests'])
+
+    def test_invalid_test_level(self):
+        with self.assertRaises(TaskOptionsError):
+            self._create_task({'test_level': 'RunSomeTests'})
+
+    def test_run_tests_requires_specified_test_level(self):
+        with self.assertRaises(TaskOptionsError):
+            self._create_task({'run_tests': 'TEST_Foo'})
+        with self.assertRaises(TaskOptionsError):
+            self._create_task({'test_level': 'RunSpecifiedTests'})
+
+    def test_write_metrics(self):
+        tempdir = tempfile.mkdtemp()
+        try:
+            metrics_file = os.path.join(tempdir, 'deploy.json')
+            task = self._create_task({'metrics_file': metrics_file})
+            listeners = task._get_progress_listeners()
+            for listener in listeners:
+                listener({'event': 'progress', 'numberComponentsDeployed': 1})
+                listener({'event': 'result', 'numberComponentsDeployed': 2})
+            with open(metrics_file, 'r') as f:
+                events = [json.loads(line) for line in f]
+        finally:
+            shutil.rmtree(tempdir)
+        self.assertEqual(['progress', 'result'], [e['event'] for e in events])
+        self.assertEqual('Deploy', events[0]['task'])
+
+    def test_no_metrics_file(self):
+        task = self._create_task({})
+        self.assertEqual([], task._get_progress_listeners())
+
+    def test_process_zip_file(self):
+        task = self._create_task({
+            'namespace_tokenize': 'ns',
+            'namespace_inject': 'other',
+            'unmanaged': False,
+        })
+        zf = zipfile.ZipFile(io.BytesIO(), 'w')
+        zf.writestr('ns__test', 'ns__test')
+        zf.writestr(
+            'classes/test.cls-meta.xml',
+            '<?xml version="1.0" ?>'
+            '<root xmlns="http://soap.sforce.com/2006/04/metadata">'
+            '<packageVersions>text</packageVersions></root>'
+        )
+        zf = task._process_zip_file(zf)
+        self.assertEqual('other__test', zf.read('other__test'))
+        self.assertNotIn(
+            'packageVersions', zf.read('classes/test.cls-meta.xml'))
+        self.assertEqual(
+            ['classes/test.cls-meta.xml'], task._cleaned_meta_xml)
+
+    def test_get_package_zip(self):
+        tempdir = tempfile.mkdtemp()
+        try:
+            os.mkdir(os.path.join(tempdir, 'classes'))
+            with open(os.path.join(tempdir, 'classes', 'Foo.cls'), 'w') as f:
+                f.write('%%%NAMESPACE%%%Foo')
+            with open(os.path.join(tempdir, 'package.xml'), 'w') as f:
+                f.write('<Package />')
+            task = self._create_task({'namespace_inject': 'ns'})
+            cwd = os.getcwd()
+            package_zip = task._get_package_zip(tempdir)
+            self.assertEqual(cwd, os.getcwd())
+        finally:
+            shutil.rmtree(tempdir)
+        zf = zipfile.ZipFile(package_zip)
+        self.assertEqual(
+            ['classes/Foo.cls', 'package.xml'], sorted(zf.namelist()))
+        self.assertEqual('Foo', zf.read('classes/Foo.cls'))
+
+    def test_get_package_zip_static_resource_bundle(self):
+        tempdir = tempfile.mkdtemp()
+        try:
+            bundle_path = os.path.join(tempdir, 'src', 'staticresources', 'test')
+            os.makedirs(bundle_path)
+            with open(os.path.join(bundle_path, 'test.js'), 'w') as f:
+                f.write('%%%NAMESPACE%%%test')
+            with open(os.path.join(bundle_path + '.resource-meta.xml'), 'w') as f:
+                f.write('<StaticResource />')
+            task = self._create_task({
+                'namespace_inject': 'ns',
+                'compress_level': '0',
+            })
+            with patch.object(
+                BaseProjectConfig,
+                'project_local_dir',
+                os.path.join(tempdir, 'local'),
+            ):
+                package_zip = task._get_package_zip(os.path.join(tempdir, 'src'))
+        finally:
+            shutil.rmtree(tempdir)
+        zf = zipfile.ZipFile(package_zip)
+        self.assertEqual([
+            'staticresources/test.resource',
+            'staticresources/test.resource-meta.xml',
+        ], sorted(zf.namelist()))
+        bundle = zipfile.ZipFile(io.BytesIO(zf.read('staticresources/test.resource')))
+        self.assertEqual('%%%NAMESPACE%%%test', bundle.read('test.js'))
+        info = zf.getinfo('staticresources/test.resource-meta.xml')
+        self.assertEqual(zipfile.ZIP_STORED, info.compress_type)
+        self.assertEqual(info.file_size, info.compress_size)
+
+    def test_invalid_compress_level(self):
+        with self.assertRaises(TaskOptionsError):
+            self._create_task({'compress_level': 'high'})
+        with self.assertRaises(TaskOptionsError):
+            self._create_task({'compress_level': '10'})
+
+    @patch.object(deploy_module, 'ZIPFILE_COMPRESSLEVEL', False)
+    def test_compress_level_unsupported(self):
+        self._create_task({'compress_level': '0'})
+        with self.assertRaises(TaskOptionsError):
+            self._create_task({'compress_level': '9'})
+
+    def _create_deploy_task(self, path, options=None):
+        task = super(TestDeploy, self)._create_task(
+            dict(options or {}, path=path))
+        task.api_class = MagicMock(
+            return_value=MagicMock(return_value='Success'))
+        return task
+
+    def test_skip_unchanged_deploy(self):
+        tempdir = tempfile.mkdtemp()
+        try:
+            with open(os.path.join(tempdir, 'package.xml'), 'w') as f:
+                f.write('<Package />')
+            task = self._create_deploy_task(tempdir)
+            task()
+            self.assertEqual(1, task.api_class.call_count)
+            self.assertIn(
+                os.path.abspath(tempdir),
+                self._get_deploy_hashes(),
+            )
+
+            task = self._create_deploy_task(tempdir)
+            task()
+            task.api_class.return_value.assert_not_called()
+
+            task = self._create_deploy_task(tempdir, {'force': True})
+            task()
+            task.api_class.return_value.assert_called_once()
+
+            task = self._create_deploy_task(tempdir, {'namespace_inject': 'ns'})
+            task()
+            task.api_class.return_value.assert_called_once()
+
+            with open(os.path.join(tempdir, 'package.xml'), 'w') as f:
+                f.write('<Package></Package>')
+            task = self._create_deploy_task(tempdir, {'namespace_inject': 'ns'})
+            task()
+            task.api_class.return_value.assert_called_once()
+        finally:
+            shutil.rmtree(tempdir)
+
+    def test_skip_unchanged_deploy_new_org(self):
+        tempdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tempdir)
+        with open(os.path.join(tempdir, 'package.xml'), 'w') as f:
+            f.write('<Package />')
+        self._create_deploy_task(tempdir)()
+
+        # A recreated scratch org keeps its config but has a new org id
+        self.org_config.config['org_id'] = '00D000000000002'
+        task = self._create_deploy_task(tempdir)
+        task()
+        task.api_class.return_value.assert_called_once()
+        self.assertEqual(
+            ['00D000000000002'],
+            list(self.org_config.config['deploy_hashes'].keys()),
+        )
+
+    def test_background_deploy(self):
+        tempdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tempdir)
+        with open(os.path.join(tempdir, 'package.xml'), 'w') as f:
+            f.write('<Package />')
+        task = self._create_deploy_task(tempdir, {'background': True})
+        task.flow = MagicMock()
+        task()
+        self.assertNotIn('deploy_hashes', self.org_config.config)
+
+        # The hash is recorded once the flow sees the deploy succeed
+        name, future, on_success = task.flow.add_background_step.call_args[0]
+        on_success('Success')
+        self.assertIn(os.path.abspath(tempdir), self._get_deploy_hashes())
+
+    def test_skip_unchanged_deploy_failed(self):
+        tempdir = tempfile.mkdtemp()
+        try:
+            with open(os.path.join(tempdir, 'package.xml'), 'w') as f:
+                f.write('<Package />')
+            task = self._create_deploy_task(tempdir)
+            task.api_class.return_value.return_value = None
+            task()
+            task = self._create_deploy_task(tempdir, {'check_only': True})
+            task()
+        finally:
+            shutil.rmtree(tempdir)
+        self.assertNotIn('deploy_hashes', self.org_config.config)
+
+    def test_process_zip_file_src_transforms(self):
+        task = self._create_task({
+            'managed_src': True,
+            'unmanaged_ee': 'True',
+            'clean_meta_xml': False,
+        })
+        zf = zipfile.ZipFile(io.BytesIO(), 'w')
+        zf.writestr('classes/Foo.cls', '//cumulusci-managed global class Foo')
+        zf.writestr('triggers/Foo.trigger', 'trigger Foo')
+        zf.writestr('pages/Foo.page', '//cumulusci-managed')
+        zf.writestr(
+            'objects/Foo__c.object',
+            '<?xml version="1.0" encoding="UTF-8"?>\n'
+            '<CustomObject xmlns="http://soap.sforce.com/2006/04/metadata">'
+            '<availableFields>Name</availableFields></CustomObject>\n'
+        )
+        zf = task._process_zip_file(zf)
+        self.assertEqual(' global class Foo', zf.read('classes/Foo.cls'))
+        self.assertEqual('trigger Foo', zf.read('triggers/Foo.trigger'))
+        self.assertEqual('//cumulusci-managed', zf.read('pages/Foo.page'))
+        self.assertNotIn('availableFields', zf.read('objects/Foo__c.object'))
+        self.assertEqual(
+            ['classes/Foo.cls', 'objects/Foo__c.object'],
+            task._changed_src,
+        )
+
+    def test_process_zip_file_no_transforms(self):
+        task = self._create_task({'clean_meta_xml': False})
+        zf = zipfile.ZipFile(io.BytesIO(), 'w')
+        zf.writestr('classes/test.cls', 'test' * 100)
+        zf = task._process_zip_file(zf)
+        # The zip is still compressed
+        info = zf.getinfo('classes/test.cls')
+        self.assertEqual(zipfile.ZIP_DEFLATED, info.compress_type)
+        self.assertEqual('test' * 100, zf.read('classes/test.cls'))
+
+
+@patch('cumulusci.tasks.salesforce.BaseSalesforceTask._update_credentials',
+    MagicMock(return_value=None))
+class TestDeployBundles(SalesforceTaskTestCase):
+
+    task_class = DeployBundles
+
+    def setUp(self):
+        super(TestDeployBundles, self).setUp()
+        self.tempdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tempdir, 'unpackaged')
+        for bundle in ('a', 'b', 'c'):
+            self._write_file(
+                '{}/package.xml'.format(bundle),
+                '<?xml version="1.0" encoding="UTF-8"?>'
+                '<Package xmlns="http://soap.sforce.com/2006/04/metadata">'
+                '<types><members>{0}</members><members>Shared</members>'
+                '<name>ApexClass</name></types>'
+                '<version>{1}</version></Package>'.format(
+                    bundle.upper(),
+                    '41.0' if bundle == 'b' else '40.0',
+                ),
+            )
+            self._write_file(
+                '{0}/classes/{1}.cls'.format(bundle, bundle.upper()),
+                bundle,
+            )
+        self.zips = []
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+
+    def _create_task(self, options=None):
+        task = super(TestDeployBundles, self)._create_task(
+            dict(options or {}, path=self.path))
+
+        def api_class(task, package_zip, **kwargs):
+            zf = zipfile.ZipFile(package_zip)
+            self.zips.append(dict(
+                (name, zf.read(name)) for name in zf.namelist()
+            ))
+            api = MagicMock(return_value='Success')
+            api.start.return_value.future.side_effect = (
+                lambda executor: executor.submit(lambda: 'Success')
+            )
+            return api
+        task.api_class = api_class
+        return task
+
+    def test_run_task(self):
+        task = self._create_task()
+        task()
+        self.assertEqual(
+            [['classes/A.cls'], ['classes/B.cls'], ['classes/C.cls']],
+            [sorted(name for name in zf if name != 'package.xml') for zf in self.zips],
+        )
+
+    def test_run_task_merge(self):
+        task = self._create_task({'merge': True})
+        task()
+        self.assertEqual(1, len(self.zips))
+        self.assertEqual(
+            ['classes/A.cls', 'classes/B.cls', 'classes/C.cls', 'package.xml'],
+            sorted(self.zips[0]),
+        )
+        package_xml = self.zips[0]['package.xml']
+        self.assertIn('<members>A</members>', package_xml)
+        self.assertIn('<members>C</members>', package_xml)
+        self.assertEqual(1, package_xml.count('<members>Shared</members>'))
+        self.assertIn('<version>41.0</version>', package_xml)
+        self.assertEqual(
+            [os.path.join(self.path, 'a+b+c')],
+            list(self._get_deploy_hashes().keys()),
+        )
+
+    def test_run_task_merge_conflict(self):
+        self._write_file('c/classes/A.cls', 'c')
+        task = self._create_task({'merge': True})
+        task()
+        self.assertEqual(3, len(self.zips))
+
+    def test_run_task_order_file(self):
+        order_file = os.path.join(self.tempdir, 'order.yml')
+        with open(order_file, 'w') as f:
+            f.write('- b\n- [a]\n')
+        task = self._create_task({'merge': True, 'order_file': order_file})
+        task()
+        self.assertEqual(
+            [['classes/B.cls', 'classes/C.cls'], ['classes/A.cls']],
+            [sorted(name for name in zf if name != 'package.xml') for zf in self.zips],
+        )
+
+    def test_run_task_order_file_missing_bundle(self):
+        order_file = os.path.join(self.tempdir, 'order.yml')
+        with open(order_file, 'w') as f:
+            f.write('- d\n')
+        task = self._create_task({'order_file': order_file})
+        with self.assertRaises(TaskOptionsError):
+            task()
+
+    def test_run_task_concurrent(self):
+        task = self._create_task({'max_concurrent': '2'})
+        task()
+        self.assertEqual(3, len(self.zips))
+        self.assertEqual(
+            3, len(self._get_deploy_hashes()))
+
+    def test_run_task_concurrent_error(self):
+        task = self._create_task({'max_concurrent': 2})
+        api_class = task.api_class
+
+        def failing_api_class(task, package_zip, **kwargs):
+            api = api_class(task, package_zip, **kwargs)
+            if len(self.zips) == 1:
+                def fail():
+                    raise MetadataApiError('Failed', None)
+                api.start.return_value.future.side_effect = (
+                    lambda executor: executor.submit(fail)
+                )
+            return api
+        task.api_class = failing_api_class
+        with self.assertRaises(MetadataApiError):
+            task()
+        # c isn't started after a fails but b still completes
+        self.assertEqual(2, len(self.zips))
+        self.assertEqual(
+            [os.path.join(self.path, 'b')],
+            list(self._get_deploy_hashes().keys()),
+        )
+
+    def test_invalid_max_concurrent(self):
+        with self.assertRaises(TaskOptionsError):
+            self._create_task({'max_concurrent': 0})
+
+    def test_background_not_supported(self):
+        self.assertNotIn('background', DeployBundles.task_options)
+        self.assertIn('background', Deploy.task_options)
+        with self.assertRaises(TaskOptionsError):
+            self._create_task({'background': 'True'})
+
+
+@patch('cumulusci.tasks.salesforce.BaseSalesforceTask._update_credentials',
+    MagicMock(return_value=None))
+class TestUpdateDependencies(SalesforceTaskTestCase):
+
+    task_class = UpdateDependencies
+
+    def setUp(self):
+        super(TestUpdateDependencies, self).setUp()
+        self.project_config.config['project']['dependencies'] = [
+            {'github': 'https://github.com/TestOwner/Dep'},
+        ]
+        self.dependencies = [
+            {
+                'zip_url': 'https://github.com/TestOwner/Dep/archive/abc.zip',
+                'subfolder': 'Dep-abc/unpackaged/pre/first',
+                'namespace_inject': 'ns',
+            },
+            {
+                'namespace': 'ns',
+                'version': '1.1',
+            },
+            {
+                'namespace': 'other',
+                'version': '2.0',
+            },
+        ]
+        self.project_config.get_static_dependencies = MagicMock(
+            return_value=self.dependencies)
+
+    def _create_task(self, options=None):
+        task = super(TestUpdateDependencies, self)._create_task(options)
+        task._get_installed = MagicMock(return_value={'other': '3.0'})
+        self.deployed = []
+
+        def api_class(task, package_zip, **kwargs):
+            self.deployed.append(zipfile.ZipFile(
+                io.BytesIO(base64.b64decode(package_zip))).namelist())
+            return MagicMock(return_value='Success')
+        task.api_class = api_class
+
+        def download(dependency):
+            zf = zipfile.ZipFile(io.BytesIO(), 'w')
+            zf.writestr('classes/___NAMESPACE___Foo.cls', 'Foo')
+            return zf
+        task._download_dependency_zip = MagicMock(side_effect=download)
+        return task
+
+    def test_run_task(self):
+        task = self._create_task({'prefetch_workers': '2'})
+        task()
+        self.assertEqual([
+            ['destructiveChanges.xml', 'package.xml'],
+            ['classes/ns__Foo.cls'],
+            ['installedPackages/ns.installedPackage', 'package.xml'],
+            ['installedPackages/other.installedPackage', 'package.xml'],
+        ], [sorted(names) for names in self.deployed])
+        for phase in ('download', 'build', 'wait', 'uninstall', 'install'):
+            self.assertIn(phase, task.return_values['timings'])
+
+    def test_run_task_build_error(self):
+        task = self._create_task()
+        task._download_dependency_zip.side_effect = ValueError('Not Found')
+        with self.assertRaises(ValueError):
+            task()
+        # Only the uninstall ran
+        self.assertEqual(1, len(self.deployed))
+
+    def test_dry_run(self):
+        task = self._create_task({'dry_run': 'True'})
+        task()
+        self.assertEqual([], self.deployed)
+        self.assertEqual([
+            ('uninstall', None),
+            ('deploy', None),
+            ('install', None),
+            ('install', 'downgrades require an uninstall'),
+        ], [
+            (step['action'], step.get('reason'))
+            for step in task.return_values['plan']
+        ])
+
+    def test_plan(self):
+        task = self._create_task()
+        task.installed = {
+            'base': '1.0',
+            'child': '2.0',
+            'parent': '3.0',
+            'beta': '1.0 (Beta 2)',
+            'upgrade': '1.0',
+        }
+        task._plan_dependencies([
+            {
+                'namespace': 'parent',
+                'version': '3.0',
+                'dependencies': [
+                    {'namespace': 'base', 'version': '1.0'},
+                    {'namespace': 'child', 'version': '1.5'},
+                ],
+            },
+            {
+                'namespace': 'other',
+                'version': '1.0',
+                'dependencies': [
+                    {'namespace': 'child', 'version': '1.5'},
+                ],
+            },
+            {'namespace': 'beta', 'version': '1.0'},
+            {'namespace': 'upgrade', 'version': '1.1'},
+        ])
+        self.assertEqual([
+            ('uninstall', 'beta'),
+            ('uninstall', 'parent'),
+            ('uninstall', 'child'),
+            ('skip', 'base'),
+            ('install', 'child'),
+            ('install', 'parent'),
+            ('install', 'other'),
+            ('install', 'beta'),
+            ('upgrade', 'upgrade'),
+        ], [(step['action'], step['namespace']) for step in task.plan])
+        self.assertEqual(
+            ['child', 'parent', 'other', 'beta', 'upgrade'],
+            [dependency['namespace'] for dependency in task.install_queue],
+        )
+
+
+@patch('cumulusci.tasks.salesforce.BaseSalesforceTask._update_credentials',
+    MagicMock(return_value=None))
+class TestDeployIncremental(SalesforceTaskTestCase):
+
+    task_class = DeployIncremental
+
+    def setUp(self):
+        super(TestDeployIncremental, self).setUp()
+        self.tempdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tempdir, 'src')
+        self.manifest_path = os.path.join(self.tempdir, 'manifest.json')
+        self._write_file('package.xml', '<Package />')
+        self._write_file('classes/Foo.cls', 'Foo')
+        self._write_file('classes/Foo.cls-meta.xml', '<ApexClass />')
+        self._write_file('classes/Bar.cls', 'Bar')
+        self._write_file('classes/Bar.cls-meta.xml', '<ApexClass />')
+        self._write_file('aura/Cmp/Cmp.cmp', '<aura:component />')
+        self._write_file('aura/Cmp/CmpController.js', '({})')
+        self._write_file('reports/Sales-meta.xml', '<ReportFolder />')
+        self._write_file('reports/Sales/Pipeline.report', '<Report />')
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+
+    def _run_task(self, options=None):
+        task = self._create_task(dict(options or {}, path=self.path))
+        task._get_manifest_path = MagicMock(return_value=self.manifest_path)
+        task.api_class = MagicMock(
+            return_value=MagicMock(return_value='Success'))
+        task()
+        return task
+
+    def _get_deployed_zip(self, task):
+        return zipfile.ZipFile(task.api_class.call_args[0][1])
+
+    def test_deploy_changes(self):
+        task = self._run_task()
+        self.assertIsNone(task.components)
+        self.assertEqual('<Package />', self._get_deployed_zip(task).read('package.xml'))
+
+        task = self._run_task()
+        task.api_class.assert_not_called()
+
+        self._write_file('classes/Foo.cls', 'Foo2')
+        self._write_file('aura/Cmp/CmpController.js', '({foo: 1})')
+        self._write_file('reports/Sales/Pipeline.report', '<Report></Report>')
+        task = self._run_task()
+        self.assertEqual({
+            'ApexClass': ['Foo'],
+            'AuraDefinitionBundle': ['Cmp'],
+            'Report': ['Sales/Pipeline'],
+        }, task.components)
+        zf = self._get_deployed_zip(task)
+        self.assertEqual([
+            'aura/Cmp/Cmp.cmp',
+            'aura/Cmp/CmpController.js',
+            'classes/Foo.cls',
+            'classes/Foo.cls-meta.xml',
+            'package.xml',
+            'reports/Sales/Pipeline.report',
+        ], sorted(zf.namelist()))
+        self.assertIn('<members>Sales/Pipeline</members>', zf.read('package.xml'))
+
+        task = self._run_task()
+        task.api_class.assert_not_called()
+
+    def test_deploy_deleted(self):
+        self._run_task()
+        os.remove(os.path.join(self.path, 'classes', 'Bar.cls'))
+        os.remove(os.path.join(self.path, 'classes', 'Bar.cls-meta.xml'))
+
+        task = self._run_task()
+        task.api_class.assert_not_called()
+
+        task = self._run_task({'delete': True})
+        self.assertEqual({'ApexClass': ['Bar']}, task.deleted)
+        zf = self._get_deployed_zip(task)
+        self.assertEqual(
+            ['destructiveChanges.xml', 'package.xml'], sorted(zf.namelist()))
+        self.assertIn('<members>Bar</members>', zf.read('destructiveChanges.xml'))
+
+    def test_deploy_options_changed(self):
+        self._run_task()
+        self._write_file('classes/Foo.cls', 'Foo2')
+        task = self._run_task({'namespace_inject': 'ns'})
+        self.assertIsNone(task.components)
+
+    def test_deploy_unknown_directory(self):
+        self._run_task()
+        self._write_file('unknown/Foo.txt', 'Foo')
+        task = self._run_task()
+        self.assertIsNone(task.components)
+
+    def test_deploy_failed(self):
+        task = DeployIncremental(
+            self.project_config,
+            TaskConfig({'options': {'path': self.path}}),
+            self.org_config,
+        )
+        task._get_manifest_path = MagicMock(return_value=self.manifest_path)
+        task.api_class = MagicMock(return_value=MagicMock(return_value=None))
+        task()
+        self.assertFalse(os.path.exists(self.manifest_path))
+
+    def test_get_component(self):
+        task = DeployIncremental(
+            self.project_config,
+            TaskConfig({'options': {'path': self.path}}),
+            self.org_config,
+        )
+        self.assertEqual(
+            ('CustomObject', 'Foo__c'),
+            task._get_component('objects/Foo__c.object'),
+        )
+        self.assertEqual(
+            ('Document', 'Files/logo.png'),
+            task._get_component('documents/Files/logo.png-meta.xml'),
+        )
+        self.assertEqual(
+            ('FeatureParameterDate', 'Start'),
+            task._get_component('featureParameters/Start.featureParameterDate'),
+        )
+        self.assertEqual(
+            ('CustomLabels', 'CustomLabels'),
+            task._get_component('labels/CustomLabels.labels'),
+        )
+        self.assertEqual(
+            ('Workflow', 'Account'),
+            task._get_component('workflows/Account.workflow'),
+        )
+        self.assertIsNone(task._get_component('package.xml'))
+
+
+uninstall_incremental_module = sys.modules[UninstallPackagedIncremental.__module__]
+
+
+@patch('cumulusci.tasks.salesforce.BaseSalesforceTask._update_credentials',
+    MagicMock(return_value=None))
+class TestUninstallPackagedIncremental(SalesforceTaskTestCase):
+
+    task_class = UninstallPackagedIncremental
+
+    def setUp(self):
+        super(TestUninstallPackagedIncremental, self).setUp()
+        self.project_config.config['project']['package'].update({
+            'name': 'TestPackage',
+            'namespace': 'ns',
+        })
+        self.tempdir = tempfile.mkdtemp()
+        with open(os.path.join(self.tempdir, 'package.xml'), 'w') as f:
+            f.write(self._package_xml({
+                'ApexClass': ['Foo'],
+                'CustomObject': ['Foo__c'],
+            }))
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+
+    def _package_xml(self, items):
+        types = ''
+        for name, members in items.items():
+            types += '<types>'
+            for member in members:
+                types += '<members>{}</members>'.format(member)
+            types += '<name>{}</name></types>'.format(name)
+        return (
+            '<?xml version="1.0" encoding="UTF-8"?>'
+            '<Package xmlns="http://soap.sforce.com/2006/04/metadata">'
+            '{}<version>36.0</version></Package>'.format(types)
+        )
+
+    def _create_task(self, options=None):
+        return super(TestUninstallPackagedIncremental, self)._create_task(
+            dict(options or {}, path=self.tempdir))
+
+    @patch.object(uninstall_incremental_module, 'ApiRetrievePackaged')
+    def test_get_destructive_changes_retrieve(self, ApiRetrievePackaged):
+        packaged = MagicMock()
+        packaged.read.return_value = self._package_xml({
+            'ApexClass': ['Foo', 'Bar'],
+            'CustomObject': ['Foo__c'],
+            'RecordType': ['Foo__c.Bar'],
+            'ApexPage': ['Baz'],
+        })
+        ApiRetrievePackaged.return_value.return_value = packaged
+        task = self._create_task()
+        destructive_changes = task._get_destructive_changes()
+        packaged.read.assert_called_once_with('TestPackage/package.xml')
+        self.assertIn('<members>Bar</members>', destructive_changes)
+        self.assertIn('<members>Baz</members>', destructive_changes)
+        self.assertNotIn('Foo', destructive_changes)
+        self.assertNotIn('RecordType', destructive_changes)
+
+    @patch.object(uninstall_incremental_module, 'OrgMetadataInventory')
+    def test_get_destructive_changes_list_metadata(self, OrgMetadataInventory):
+        inventory = OrgMetadataInventory.return_value
+        inventory.get_members.return_value = {
+            'ApexClass': ['Bar', 'Foo'],
+        }
+        task = self._create_task({'manifest': 'list_metadata'})
+        destructive_changes = task._get_destructive_changes()
+        self.assertEqual(
+            ['ApexClass', 'CustomObject'],
+            sorted(inventory.refresh.call_args[0][0]),
+        )
+        self.assertEqual('ns', inventory.get_members.call_args[1]['namespace'])
+        self.assertIn('<members>Bar</members>', destructive_changes)
+        self.assertNotIn('Foo', destructive_changes)
+
+    def test_get_destructive_changes_none(self):
+        task = self._create_task()
+        task._get_packaged_items_from_retrieve = MagicMock(return_value={
+            'ApexClass': set(['Foo']),
+        })
+        self.assertIsNone(task._get_destructive_changes())
+
+    def test_invalid_manifest(self):
+        with self.assertRaises(TaskOptionsError):
+            self._create_task({'manifest': 'bogus'})
+
+
+@patch('cumulusci.tasks.salesforce.BaseSalesforceTask._update_credentials',
+    MagicMock(return_value=None))
+class TestUninstallPackage(SalesforceTaskTestCase):
+
+    task_class = UninstallPackage
+
+    def setUp(self):
+        super(TestUninstallPackage, self).setUp()
+        self.org_config.installed_packages = {'ns': '1.0'}
+
+    def _create_task(self, options=None):
+        task = super(TestUninstallPackage, self)._create_task(
+            dict(options or {}, namespace='ns'))
+        task.api_class = MagicMock()
+        return task
+
+    def test_run_task_resets_installed_packages(self):
+        task = self._create_task()
+        task.api_class.return_value.return_value = 'Success'
+        task()
+        self.assertIsNone(self.org_config.installed_packages)
+
+    def test_run_task_failed(self):
+        task = self._create_task()
+        task.api_class.return_value.return_value = None
+        task()
+        self.assertEqual({'ns': '1.0'}, self.org_config.installed_packages)
+
+    def test_background_resets_installed_packages(self):
+        task = self._create_task({'background': True})
+        task.flow = MagicMock()
+        task()
+        self.assertEqual({'ns': '1.0'}, self.org_config.installed_packages)
+
+        name, future, on_success = task.flow.add_background_step.call_args[0]
+        on_success('Success')
+        self.assertIsNone(self.org_config.installed_packages)
+
+
+@patch('cumulusci.tasks.salesforce.BaseSalesforceTask._update_credentials',
+    MagicMock(return_value=None))
+class TestRetrieveChanges(SalesforceTaskTestCase):
+
+    task_class = RetrieveChanges
+
+    def setUp(self):
+        super(TestRetrieveChanges, self).setUp()
+        self.org_config.config['source_tracking_revisions'] = {
+            '00D000000000001': 2,
+        }
+
+    def _create_task(self, options=None):
+        task = super(TestRetrieveChanges, self)._create_task(options)
+        task.api_class = MagicMock()
+        task._extract_zip = MagicMock()
+        return task
+
+    def _get_revisions(self):
+        return self.project_config.keychain.get_org('test').config[
+            'source_tracking_revisions']
+
+    def test_run_task(self):
+        task = self._create_task()
+        task._get_changes = MagicMock(return_value=[
+            {'MemberName': 'Foo', 'MemberType': 'ApexClass',
+                'RevisionCounter': 3, 'IsNameObsolete': False},
+            {'MemberName': 'Foo__c.Bar__c', 'MemberType': 'CustomField',
+                'RevisionCounter': 5, 'IsNameObsolete': False},
+            {'MemberName': 'Baz', 'MemberType': 'ApexClass',
+                'RevisionCounter': 4, 'IsNameObsolete': True},
+        ])
+        task()
+        task._get_changes.assert_called_once_with(2)
+        package_xml = task.api_class.call_args[0][1]
+        self.assertIn('<members>Foo</members>', package_xml)
+        self.assertIn('<members>Foo__c.Bar__c</members>', package_xml)
+        self.assertNotIn('Baz', package_xml)
+        task._extract_zip.assert_called_once()
+        self.assertEqual({'00D000000000001': 5}, self._get_revisions())
+
+    def test_run_task_extract(self):
+        tempdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tempdir)
+        with open(os.path.join(tempdir, 'package.xml'), 'w') as f:
+            f.write('<Package />')
+        task = self._create_task({'path': tempdir})
+        del task._extract_zip
+        src_zip = zipfile.ZipFile(io.BytesIO(), 'w')
+        src_zip.writestr('package.xml', '<Package>changes</Package>')
+        src_zip.writestr('classes/Foo.cls', 'Foo')
+        task.api_class.return_value.return_value = src_zip
+        task._get_changes = MagicMock(return_value=[
+            {'MemberName': 'Foo', 'MemberType': 'ApexClass',
+                'RevisionCounter': 3, 'IsNameObsolete': False},
+        ])
+        task()
+        with open(os.path.join(tempdir, 'package.xml'), 'r') as f:
+            self.assertEqual('<Package />', f.read())
+        with open(os.path.join(tempdir, 'classes', 'Foo.cls'), 'r') as f:
+            self.assertEqual('Foo', f.read())
+
+    def test_run_task_new_org(self):
+        self.org_config.config['org_id'] = '00D000000000002'
+        task = self._create_task()
+        task._get_changes = MagicMock(return_value=[
+            {'MemberName': 'Foo', 'MemberType': 'ApexClass',
+                'RevisionCounter': 1, 'IsNameObsolete': False},
+        ])
+        task()
+        task._get_changes.assert_called_once_with(0)
+        self.assertEqual({'00D000000000002': 1}, self._get_revisions())
+
+    def test_run_task_no_changes(self):
+        task = self._create_task({'reset': True})
+        task._get_changes = MagicMock(return_value=[])
+        task()
+        task._get_changes.assert_called_once_with(0)
+        task.api_class.assert_not_called()
+        self.assertEqual(
+            {'00D000000000001': 2},
+            self.org_config.source_tracking_revisions,
+        )
+
+
+retrieve_reports_module = sys.modules[RetrieveReportsAndDashboards.__module__]
+
+
+@patch('cumulusci.tasks.salesforce.BaseSalesforceTask._update_credentials',
+    MagicMock(return_value=None))
+class TestRetrieveReportsAndDashboards(SalesforceTaskTestCase):
+
+    task_class = RetrieveReportsAndDashboards
+
+    @patch.object(retrieve_reports_module, 'list_metadata')
+    def test_get_api(self, list_metadata):
+        list_metadata.return_value = [
+            [{'fullName': 'Sales/Pipeline'}],
+            [{'fullName': 'Service/Cases'}],
+        ]
+        task = self._create_task({
+            'path': 'src',
+            'report_folders': 'Sales,Service',
+        })
+        task.api_class = MagicMock()
+        task._get_api()
+        self.assertEqual(
+            [('Report', 'Sales'), ('Report', 'Service')],
+            list_metadata.call_args[0][1],
+        )
+        package_xml = task.api_class.call_args[0][1]
+        for member in ('Sales', 'Service', 'Sales/Pipeline', 'Service/Cases'):
+            self.assertIn('<members>{}</members>'.format(member), package_xml)
@@ -5,6 +5,7 @@ import glob
 from xml.dom.minidom import parse
 
 from cumulusci.core.tasks import BaseTask
+from cumulusci.core.utils import process_list_arg
 from cumulusci.utils import download_extract_zip, findReplace, findReplaceRegex
 
 
@@ -37,6 +38,7 @@ class DownloadZip(BaseTask):
             self.options['url'],
             self.options['dir'],
             self.options.get('subfolder'),
+            logger=self.logger,
         )
 
 
@@ -91,6 +93,26 @@ class Sleep(BaseTask):
         self.logger.info('Done')
 
 
+class WaitBackgroundTasks(BaseTask):
+    name = 'WaitBackgroundTasks'
+    task_options = {
+        'tasks': {
+            'description': 'A list of flow step names to wait for.  Defaults to all steps running in the background',
+        },
+    }
+
+    def _init_options(self, kwargs):
+        super(WaitBackgroundTasks, self)._init_options(kwargs)
+        self.options['tasks'] = process_list_arg(self.options.get('tasks'))
+
+    def _run_task(self):
+        if not self.flow:
+            self.logger.info('Not running in a flow, nothing to wait for')
+            return
+        self.flow.wait_background_steps(self.options['tasks'])
+        self.logger.info('Done')
+
+
 class Delete(BaseTask):
     name = 'Delete'
     task_options = {
@@ -172,7 +194,7 @@ class FindReplace(BaseTask):
         kwargs = {}
         if 'max' in self.options:
             kwargs['max'] = self.options['max']
-        findReplace(
+        summary = findReplace(
             find=self.options['find'],
             replace=self.options['replace'],
             directory=self.options['path'],
@@ -180,6 +202,13 @@ class FindReplace(BaseTask):
             logger=self.logger,
             **kwargs
         )
+        self._log_summary(summary)
+
+    def _log_summary(self, summary):
+        self.logger.info(
+            'Updated {changed} of {files} files ({bytes_scanned} bytes scanned)'.format(**summary)
+        )
+        self.return_values = summary
 
 
 find_replace_regex_options = FindReplace.task_options.copy()
@@ -190,13 +219,14 @@ class FindReplaceRegex(FindReplace):
     task_options = find_replace_regex_options
 
     def _run_task(self):
-        findReplaceRegex(
+        summary = findReplaceRegex(
             find=self.options['find'],
             replace=self.options['replace'],
             directory=self.options['path'],
             filePattern=self.options['file_pattern'],
             logger=self.logger,
         )
+        self._log_summary(summary)
 
 
 class CopyFile(BaseTask):
@@ -1,6 +1,8 @@
 from collections import OrderedDict
 import io
 import os
+import shutil
+import tempfile
 import unittest
 import zipfile
 
@@ -56,6 +58,56 @@ class TestUtils(unittest.TestCase):
                 result = f.read()
             self.assertEqual(result, 'xx')
 
+    def test_findReplace_summary(self):
+        with utils.temporary_dir() as d:
+            for name, content in (('a', 'foo'), ('b', 'bar'), ('c', '')):
+                with open(os.path.join(d, name), 'w') as f:
+                    f.write(content)
+
+            rewrite = mock.Mock(side_effect=lambda s: s.replace('foo', 'bar'))
+            summary = utils.rewrite_files(
+                d,
+                '*',
+                rewrite,
+                prescan=lambda content: content.find(b'foo'),
+            )
+
+            self.assertEqual({
+                'files': 3,
+                'changed': 1,
+                'bytes_scanned': 6,
+            }, summary)
+            rewrite.assert_called_once_with(b'foo')
+            self.assertEqual(['a', 'b', 'c'], sorted(os.listdir(d)))
+            with open(os.path.join(d, 'a'), 'r') as f:
+                self.assertEqual('bar', f.read())
+
+    def test_findReplaceRegex_prescan(self):
+        with utils.temporary_dir() as d:
+            path = os.path.join(d, 'test')
+            with open(path, 'w') as f:
+                f.write('aa')
+
+            logger = mock.Mock()
+            summary = utils.findReplaceRegex(r'\d+', 'x', d, '*', logger)
+
+            logger.info.assert_not_called()
+            self.assertEqual(0, summary['changed'])
+
+    def test_write_file_atomic(self):
+        with utils.temporary_dir() as d:
+            path = os.path.join(d, 'test')
+            with open(path, 'w') as f:
+                f.write('foo')
+            os.chmod(path, 0o755)
+
+            utils.write_file_atomic(path, b'bar')
+
+            self.assertEqual(['test'], os.listdir(d))
+            self.assertEqual(0o755, os.stat(path).st_mode & 0o777)
+            with open(path, 'r') as f:
+                self.assertEqual('bar', f.read())
+
     def test_findRename(self):
         with utils.temporary_dir() as d:
             path = os.path.join(d, 'foo')
@@ -102,11 +154,112 @@ class TestUtils(unittest.TestCase):
             with open(path, 'r') as f:
                 result = f.read()
             expected = (
-                '''<?xml version='1.0' encoding='UTF-8'?>
-<root xmlns="http://soap.sforce.com/2006/04/metadata" />'''
+                '''<?xml version="1.0" encoding="UTF-8"?>
+<root xmlns="http://soap.sforce.com/2006/04/metadata"/>
+'''
             )
             self.assertEqual(expected, result)
 
+    def test_XmlTransform(self):
+        with utils.temporary_dir() as d:
+            for name in ('a.object', 'b.object', 'c.txt'):
+                with open(os.path.join(d, name), 'w') as f:
+                    f.write(
+                        '<?xml version="1.0" encoding="UTF-8"?>\n'
+                        '<CustomObject xmlns="http://soap.sforce.com/2006/04/metadata">'
+                        '<label>{}</label><fields /></CustomObject>\n'.format(name)
+                    )
+
+            transform = utils.XmlTransform()
+            transform.add_files(
+                utils.RemoveXmlElements('.//ns:fields'),
+                d,
+                '*.object',
+            )
+            transform.add(
+                utils.RemoveXmlElements('.//ns:label'),
+                [os.path.join(d, 'a.object')],
+            )
+            transform.add(
+                utils.RemoveXmlElements('.//ns:missing'),
+                [os.path.join(d, 'c.txt')],
+            )
+            logger = mock.Mock()
+            summary = transform(logger=logger)
+
+            self.assertEqual({'files': 3, 'changed': 2}, summary)
+            self.assertEqual(2, logger.info.call_count)
+            with open(os.path.join(d, 'a.object'), 'r') as f:
+                self.assertEqual(
+                    '<?xml version="1.0" encoding="UTF-8"?>\n'
+                    '<CustomObject xmlns="http://soap.sforce.com/2006/04/metadata"/>\n',
+                    f.read(),
+                )
+            with open(os.path.join(d, 'b.object'), 'r') as f:
+                self.assertEqual(
+                    '<?xml version="1.0" encoding="UTF-8"?>\n'
+                    '<CustomObject xmlns="http://soap.sforce.com/2006/04/metadata">\n'
+                    '  <label>b.object</label>\n'
+                    '</CustomObject>\n',
+                    f.read(),
+                )
+            with open(os.path.join(d, 'c.txt'), 'r') as f:
+                self.assertIn('<fields />', f.read())
+
+    def test_XmlTransform_processes(self):
+        with utils.temporary_dir() as d:
+            paths = []
+            for i in range(3):
+                path = os.path.join(d, '{}.object'.format(i))
+                with open(path, 'w') as f:
+                    f.write(
+                        '<CustomObject xmlns="http://soap.sforce.com/2006/04/metadata">'
+                        '<fields /></CustomObject>'
+                    )
+                paths.append(path)
+
+            transform = utils.XmlTransform()
+            transform.add(utils.RemoveXmlElements('ns:fields'), paths)
+            with mock.patch.object(utils, 'XML_TRANSFORM_PARALLEL_MIN_FILES', 2):
+                summary = transform(max_workers=2)
+
+            self.assertEqual({'files': 3, 'changed': 3}, summary)
+            for path in paths:
+                with open(path, 'r') as f:
+                    self.assertNotIn('fields', f.read())
+
+    def test_parallel_executor(self):
+        with mock.patch.object(utils.sys, 'platform', 'linux2'):
+            executor = utils.parallel_executor(2)
+        self.assertIsInstance(executor, utils.ProcessPoolExecutor)
+        executor.shutdown()
+
+    def test_parallel_executor_frozen(self):
+        with mock.patch.object(utils.sys, 'frozen', True, create=True):
+            executor = utils.parallel_executor(2)
+        self.assertIsInstance(executor, utils.ThreadPoolExecutor)
+        executor.shutdown()
+
+    def test_XmlTransform_frozen(self):
+        with utils.temporary_dir() as d:
+            paths = []
+            for i in range(3):
+                path = os.path.join(d, '{}.object'.format(i))
+                with open(path, 'w') as f:
+                    f.write(
+                        '<CustomObject xmlns="http://soap.sforce.com/2006/04/metadata">'
+                        '<fields /></CustomObject>'
+                    )
+                paths.append(path)
+
+            transform = utils.XmlTransform()
+            transform.add(utils.RemoveXmlElements('ns:fields'), paths)
+            with mock.patch.object(utils, 'XML_TRANSFORM_PARALLEL_MIN_FILES', 2):
+                with mock.patch.object(utils.sys, 'frozen', True, create=True):
+                    summary = transform(max_workers=2)
+
+            self.assertEqual({'files': 3, 'changed': 3}, summary)
+
     def test_remove_xml_element_not_found(self):
         tree = ET.fromstring('<root />')
         result = utils.remove_xml_element('tag', tree)
@@ -149,6 +302,51 @@ class TestUtils(unittest.TestCase):
             utils.download_extract_zip('http://test', target=d)
             self.assertIn('test', os.listdir(d))
 
+    @responses.activate
+    def test_download_extract_zip_subfolder_to_target(self):
+        with utils.temporary_dir() as d:
+            f = io.BytesIO()
+            with zipfile.ZipFile(f, 'w') as zf:
+                zf.writestr('top', 'top')
+                zf.writestr('folder/', '')
+                zf.writestr('folder/sub/test', 'test')
+                zf.writestr('folder/../escape', 'escape')
+            f.seek(0)
+            responses.add(
+                method=responses.GET,
+                url='http://test',
+                body=f.read(),
+                content_type='application/zip',
+            )
+
+            target = os.path.join(d, 'target')
+            logger = mock.Mock()
+            utils.download_extract_zip(
+                'http://test', target=target, subfolder='folder', logger=logger)
+            self.assertEqual(['sub'], os.listdir(target))
+            with open(os.path.join(target, 'sub', 'test')) as f:
+                self.assertEqual('test', f.read())
+            self.assertFalse(os.path.exists(os.path.join(d, 'escape')))
+            logger.info.assert_called_once()
+
+    @responses.activate
+    def test_download_extract_zip_spooled_to_disk(self):
+        f = io.BytesIO()
+        with zipfile.ZipFile(f, 'w') as zf:
+            zf.writestr('test', 'x' * 1000)
+        f.seek(0)
+        responses.add(
+            method=responses.GET,
+            url='http://test',
+            body=f.read(),
+            content_type='application/zip',
+        )
+
+        with mock.patch.object(utils, 'DOWNLOAD_SPOOL_MAX_SIZE', 100):
+            zf = utils.download_extract_zip('http://test')
+        self.assertTrue(zf.fp._rolled)
+        self.assertEqual('x' * 1000, zf.read('test'))
+
     def test_zip_inject_namespace_managed(self):
         logger = mock.Mock()
         zf = zipfile.ZipFile(io.BytesIO(), 'w')
@@ -190,6 +388,31 @@ class TestUtils(unittest.TestCase):
         result = zf.read('test')
         self.assertEqual(contents, result)
 
+    def test_zip_inject_namespace_skips_null_bytes(self):
+        contents = b'%%%NAMESPACE%%%\x00'
+        zf = zipfile.ZipFile(io.BytesIO(), 'w')
+        zf.writestr('test', contents)
+
+        zf = utils.zip_inject_namespace(zf, namespace='ns', managed=True)
+        result = zf.read('test')
+        self.assertEqual(contents, result)
+
+    def test_token_substitution(self):
+        found = set()
+        substitute = utils.token_substitution({
+            '%%%NAMESPACE%%%': 'ns__',
+            '%%%NAMESPACED_ORG%%%': '',
+            '%%%NAMESPACE_OR_C%%%': 'ns',
+        })
+        result = substitute(
+            '%%%NAMESPACE%%%Foo %%%NAMESPACE_OR_C%%%:bar', found)
+        self.assertEqual(('ns__Foo ns:bar', 2), result)
+        self.assertEqual(('test', 0), substitute('test'))
+        self.assertEqual(
+            (b'\xe2\x98\x83ns__', 1), substitute(b'\xe2\x98\x83%%%NAMESPACE%%%'))
+        self.assertEqual(
+            set(['%%%NAMESPACE%%%', '%%%NAMESPACE_OR_C%%%']), found)
+
     def test_zip_strip_namespace(self):
         zf = zipfile.ZipFile(io.BytesIO(), 'w')
         zf.writestr('ns__test', 'ns__test ns:test')
@@ -246,6 +469,129 @@ class TestUtils(unittest.TestCase):
         result = zf.read('classes/test-meta.xml')
         self.assertNotIn('packageVersions', result)
 
+    def test_zip_transform(self):
+        zf = zipfile.ZipFile(io.BytesIO(), 'w')
+        zf.writestr('ns__test', 'ns__test ns:test')
+        zf.writestr(
+            'classes/test.cls-meta.xml',
+            '<?xml version="1.0" ?>'
+            '<root xmlns="http://soap.sforce.com/2006/04/metadata">'
+            '<packageVersions>text</packageVersions></root>'
+        )
+        changed = []
+
+        zf = utils.zip_transform(zf, [
+            utils.tokenize_namespace_transform('ns'),
+            utils.inject_namespace_transform('other', managed=True),
+            utils.clean_metaxml_transform(changed),
+        ])
+        self.assertEqual('other__test othertest', zf.read('other__test'))
+        self.assertNotIn(
+            'packageVersions', zf.read('classes/test.cls-meta.xml'))
+        self.assertEqual(['classes/test.cls-meta.xml'], changed)
+
+    def test_zip_transform_zip_dest(self):
+        zf = zipfile.ZipFile(io.BytesIO(), 'w')
+        zf.writestr('test', 'test')
+        zip_dest = zipfile.ZipFile(io.BytesIO(), 'w')
+
+        result = utils.zip_transform(
+            zf, [lambda name, content: (name + '2', content)], zip_dest)
+        self.assertIs(zip_dest, result)
+        self.assertEqual(['test2'], result.namelist())
+
+    def test_zip_transform_binary_metadata(self):
+        zf = zipfile.ZipFile(io.BytesIO(), 'w')
+        content = b'%%%NAMESPACE%%%\x00\xff' * 100
+        zf.writestr('staticresources/___NAMESPACE___test.resource', content)
+        zf.writestr(
+            'staticresources/___NAMESPACE___test.resource-meta.xml',
+            '%%%NAMESPACE%%%',
+        )
+        zf.writestr('classes/test.cls', 'public class test {}' * 100)
+
+        zf = utils.zip_transform(
+            zf,
+            [utils.inject_namespace_transform('ns', managed=True)],
+        )
+        name = 'staticresources/ns__test.resource'
+        self.assertEqual(content, zf.read(name))
+        self.assertEqual(zipfile.ZIP_STORED, zf.getinfo(name).compress_type)
+        self.assertEqual('ns__', zf.read(name + '-meta.xml'))
+        info = zf.getinfo('classes/test.cls')
+        self.assertEqual(zipfile.ZIP_DEFLATED, info.compress_type)
+        self.assertLess(info.compress_size, info.file_size)
+        self.assertEqual('public class test {}' * 100, zf.read('classes/test.cls'))
+        self.assertIsNone(zf.testzip())
+
+    def test_zip_writestr_stored(self):
+        zf = zipfile.ZipFile(io.BytesIO(), 'w', zipfile.ZIP_DEFLATED)
+        utils.zip_writestr(zf, 'test', 'test' * 100, 0)
+        info = zf.getinfo('test')
+        self.assertEqual(zipfile.ZIP_STORED, info.compress_type)
+        self.assertEqual(400, info.compress_size)
+
+    def test_zip_writestr_deflated(self):
+        zf = zipfile.ZipFile(io.BytesIO(), 'w', zipfile.ZIP_DEFLATED)
+        utils.zip_writestr(zf, 'test', 'test' * 100)
+        info = zf.getinfo('test')
+        self.assertEqual(zipfile.ZIP_DEFLATED, info.compress_type)
+        self.assertLess(info.compress_size, 400)
+
+    @unittest.skipUnless(
+        utils.ZIPFILE_COMPRESSLEVEL, 'compresslevel requires Python 3.7')
+    def test_zip_writestr_compress_level(self):
+        content = ' '.join(str(i * 7919 % 1000) for i in range(5000))
+        sizes = []
+        for compress_level in (1, 9):
+            zf = zipfile.ZipFile(io.BytesIO(), 'w', zipfile.ZIP_DEFLATED)
+            utils.zip_writestr(zf, 'test', content, compress_level)
+            sizes.append(zf.getinfo('test').compress_size)
+        self.assertLess(sizes[1], sizes[0])
+
+    @mock.patch.object(utils, 'ZIPFILE_COMPRESSLEVEL', False)
+    def test_zip_writestr_compress_level_unsupported(self):
+        zf = zipfile.ZipFile(io.BytesIO(), 'w', zipfile.ZIP_DEFLATED)
+        with self.assertRaises(ValueError):
+            utils.zip_writestr(zf, 'test', 'test', 9)
+
+    def test_is_binary_metadata(self):
+        self.assertTrue(utils.is_binary_metadata('staticresources/test.resource'))
+        self.assertTrue(utils.is_binary_metadata('documents/Folder/test.png'))
+        self.assertTrue(utils.is_binary_metadata('contentassets/test.asset'))
+        self.assertFalse(utils.is_binary_metadata('staticresources/test.resource-meta.xml'))
+        self.assertFalse(utils.is_binary_metadata('classes/test.cls'))
+
+    def test_zip_static_resource_bundle(self):
+        tempdir = tempfile.mkdtemp()
+        try:
+            bundle_path = os.path.join(tempdir, 'bundle')
+            cache_dir = os.path.join(tempdir, 'cache')
+            os.makedirs(os.path.join(bundle_path, 'js'))
+            with open(os.path.join(bundle_path, 'js', 'test.js'), 'w') as f:
+                f.write('test')
+
+            bundle = utils.zip_static_resource_bundle(bundle_path, cache_dir)
+            zf = zipfile.ZipFile(io.BytesIO(bundle))
+            self.assertEqual(['js/test.js'], zf.namelist())
+            self.assertEqual(1, len(os.listdir(cache_dir)))
+
+            with mock.patch('zipfile.ZipFile') as ZipFile:
+                self.assertEqual(
+                    bundle,
+                    utils.zip_static_resource_bundle(bundle_path, cache_dir),
+                )
+            ZipFile.assert_not_called()
+
+            with open(os.path.join(bundle_path, 'js', 'test.js'), 'w') as f:
+                f.write('changed')
+            bundle = utils.zip_static_resource_bundle(bundle_path, cache_dir)
+            zf = zipfile.ZipFile(io.BytesIO(bundle))
+            self.assertEqual('changed', zf.read('js/test.js'))
+            self.assertEqual(2, len(os.listdir(cache_dir)))
+        finally:
+            shutil.rmtree(tempdir)
+
     def test_doc_task(self):
         task_config = TaskConfig({
             'class_path': 'cumulusci.tests.test_utils.TestTask',
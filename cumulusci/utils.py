@@ -1,16 +1,23 @@
 from __future__ import unicode_literals
 from future import standard_library
 standard_library.install_aliases()
+from collections import OrderedDict
 from contextlib import contextmanager
-import difflib
 import fnmatch
+import hashlib
 import os
 import re
 import io
+import mmap
 import shutil
+import sys
 import tempfile
+import time
 import zipfile
 
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import ThreadPoolExecutor
+import lxml.etree
 import requests
 
 import xml.etree.ElementTree as ET
@@ -21,35 +28,145 @@ CUMULUSCI_PATH = os.path.realpath(
 
 
 def findReplace(find, replace, directory, filePattern, logger=None, max=None):
-    for path, dirs, files in os.walk(os.path.abspath(directory)):
-        for filename in fnmatch.filter(files, filePattern):
-            filepath = os.path.join(path, filename)
-            with open(filepath) as f:
-                s = f.read()
-            if max:
-                s_updated = s.replace(find, replace, max)
-            else:
-                s_updated = s.replace(find, replace)
-            if s != s_updated:
-                if logger:
-                    logger.info('Updating {}'.format(filepath))
-                with open(filepath, "w") as f:
-                    f.write(s_updated)
+    """ Replaces find with replace in the files matching filePattern under
+        directory and returns the summary from rewrite_files """
+    def rewrite(s):
+        if max:
+            return s.replace(find, replace, max)
+        return s.replace(find, replace)
+
+    find_bytes = _encode_pattern(find)
+    return rewrite_files(
+        directory,
+        filePattern,
+        rewrite,
+        prescan=lambda content: content.find(find_bytes),
+        logger=logger,
+    )
 
 
 def findReplaceRegex(find, replace, directory, filePattern, logger=None):
+    """ Replaces matches of the regular expression find with replace in the
+        files matching filePattern under directory and returns the summary
+        from rewrite_files """
     pattern = re.compile(find)
+    prescan_pattern = re.compile(_encode_pattern(find))
+    return rewrite_files(
+        directory,
+        filePattern,
+        lambda s: pattern.sub(replace, s),
+        prescan=lambda content: 0 if prescan_pattern.search(content) else -1,
+        logger=logger,
+    )
+
+
+def _encode_pattern(pattern):
+    if isinstance(pattern, bytes):
+        return pattern
+    return pattern.encode('utf-8')
+
+
+# Number of files rewritten concurrently by rewrite_files
+REWRITE_FILES_WORKERS = 4
+
+def parallel_executor(max_workers=None):
+    """ Returns an executor for CPU bound work on files
+
+    Worker processes are used except in a frozen (PyInstaller) build or on
+    Windows, where starting a worker process runs the cci executable again,
+    so threads are used instead.  Work submitted to the executor must be
+    picklable module level functions.
+    """
+    if getattr(sys, 'frozen', False) or sys.platform == 'win32':
+        return ThreadPoolExecutor(max_workers=max_workers or 4)
+    return ProcessPoolExecutor(max_workers=max_workers)
+
+
+def rewrite_files(directory, file_pattern, rewrite, prescan=None, logger=None, max_workers=None):
+    """ Applies rewrite to the content of each file matching file_pattern
+    under directory and writes back the files which changed
+
+    prescan is called with a memory map of each file before it is read and
+    should return -1, like str.find, if rewrite can't change the file so the
+    file is skipped.  Files are processed by a pool of max_workers threads
+    and written atomically.  Returns a dict with the number of files
+    matching file_pattern, the number of files changed, and the number of
+    bytes scanned.
+    """
+    paths = []
     for path, dirs, files in os.walk(os.path.abspath(directory)):
-        for filename in fnmatch.filter(files, filePattern):
-            filepath = os.path.join(path, filename)
-            with open(filepath) as f:
-                s = f.read()
-            s_updated = pattern.sub(replace, s)
-            if s != s_updated:
+        for filename in fnmatch.filter(files, file_pattern):
+            paths.append(os.path.join(path, filename))
+
+    summary = {
+        'files': len(paths),
+        'changed': 0,
+        'bytes_scanned': 0,
+    }
+    if not paths:
+        return summary
+
+    executor = ThreadPoolExecutor(
+        max_workers=max_workers if max_workers else REWRITE_FILES_WORKERS,
+    )
+    try:
+        results = executor.map(
+            lambda filepath: _rewrite_file(filepath, rewrite, prescan),
+            paths,
+        )
+        for filepath, size, changed in results:
+            summary['bytes_scanned'] += size
+            if changed:
+                summary['changed'] += 1
                 if logger:
                     logger.info('Updating {}'.format(filepath))
-                with open(filepath, "w") as f:
-                    f.write(s_updated)
+    finally:
+        executor.shutdown()
+    return summary
+
+
+def _rewrite_file(filepath, rewrite, prescan):
+    """ Returns the path, size, and whether the file was changed """
+    with open(filepath, 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        if prescan:
+            # Empty files can't be memory mapped
+            if size:
+                content = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            else:
+                content = b''
+            try:
+                if prescan(content) == -1:
+                    return filepath, size, False
+            finally:
+                if size:
+                    content.close()
+        s = f.read()
+    s_updated = rewrite(s)
+    if s == s_updated:
+        return filepath, size, False
+    write_file_atomic(filepath, s_updated)
+    return filepath, size, True
+
+
+def write_file_atomic(path, content):
+    """ Writes content to a temporary file in the same directory as path and
+        renames it over path so readers never see a partial file """
+    dirname, filename = os.path.split(os.path.abspath(path))
+    fd, temp_path = tempfile.mkstemp(dir=dirname, prefix='.{}.'.format(filename))
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(content)
+        if os.path.exists(path):
+            shutil.copymode(path, temp_path)
+            if os.name == 'nt':
+                # os.rename doesn't replace existing files on Windows
+                os.remove(path)
+        os.rename(temp_path, path)
+    except Exception:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
 
 
 def findRename(find, replace, directory, logger=None):
@@ -73,10 +190,13 @@ def elementtree_parse_file(path):
 
 def removeXmlElement(name, directory, file_pattern, logger=None):
     """ Recursively walk a directory and remove XML elements """
-    for path, dirs, files in os.walk(os.path.abspath(directory)):
-        for filename in fnmatch.filter(files, file_pattern):
-            filepath = os.path.join(path, filename)
-            remove_xml_element_file(name, filepath)
+    transform = XmlTransform()
+    transform.add_files(
+        RemoveXmlElements('.//ns:{}'.format(name)),
+        directory,
+        file_pattern,
+    )
+    return transform(logger=logger)
 
 def remove_xml_element_file(name, path):
     """ Remove XML elements from a single file """
@@ -116,19 +236,191 @@ def remove_xml_element(name, tree):
 
     return tree
 
-def download_extract_zip(url, target=None, subfolder=None, headers=None):
+METADATA_NAMESPACE = 'http://soap.sforce.com/2006/04/metadata'
+
+# XmlTransform only starts worker processes for at least this many files
+XML_TRANSFORM_PARALLEL_MIN_FILES = 100
+
+class XmlTransform(object):
+    """ Applies a set of operations to XML files with a single parse and
+    serialize of each file
+
+    Operations are callables which modify an lxml ElementTree in place and
+    return True if they changed it.  Any number of operations can be added
+    for each file and only the files changed by an operation are written.
+    Operations are pickled to run in worker processes so they should be
+    instances of module level classes like RemoveXmlElements.
+    """
+
+    def __init__(self):
+        self.files = OrderedDict()
+
+    def add(self, operation, paths):
+        """ Adds an operation for a list of file paths """
+        for path in paths:
+            self.files.setdefault(os.path.abspath(path), []).append(operation)
+
+    def add_files(self, operation, directory, file_pattern):
+        """ Adds an operation for the files matching file_pattern anywhere
+        under directory """
+        paths = []
+        for path, dirs, files in os.walk(os.path.abspath(directory)):
+            for filename in fnmatch.filter(files, file_pattern):
+                paths.append(os.path.join(path, filename))
+        self.add(operation, sorted(paths))
+
+    def __call__(self, logger=None, max_workers=None):
+        """ Transforms the files and returns a dict with the number of files
+        processed and changed.  Large sets of files are transformed by a pool
+        of max_workers processes, which defaults to the number of CPUs.  See
+        parallel_executor for where threads are used instead. """
+        files = list(self.files.items())
+        summary = {
+            'files': len(files),
+            'changed': 0,
+        }
+        if max_workers == 1 or len(files) < XML_TRANSFORM_PARALLEL_MIN_FILES:
+            results = (transform_xml_file(*item) for item in files)
+            self._collect(results, summary, logger)
+            return summary
+
+        executor = parallel_executor(max_workers)
+        try:
+            paths, operations = zip(*files)
+            self._collect(
+                executor.map(transform_xml_file, paths, operations),
+                summary,
+                logger,
+            )
+        finally:
+            executor.shutdown()
+        return summary
+
+    def _collect(self, results, summary, logger):
+        for path, changed in results:
+            if changed:
+                summary['changed'] += 1
+                if logger:
+                    logger.info('Updating {}'.format(path))
+
+
+def transform_xml_file(path, operations):
+    """ Applies the XmlTransform operations to a file and writes it if
+        changed.  Returns the path and whether the file was changed. """
+    tree = lxml.etree.parse(path)
+    changed = False
+    for operation in operations:
+        if operation(tree):
+            changed = True
+    if changed:
+        write_file_atomic(path, serialize_metadata_xml(tree))
+    return path, changed
+
+
+def serialize_metadata_xml(tree):
+    """ Serializes an lxml ElementTree with the XML declaration used in
+        Salesforce metadata files """
+    return b'<?xml version="1.0" encoding="UTF-8"?>\n' + lxml.etree.tostring(
+        tree,
+        encoding='UTF-8',
+        pretty_print=True,
+    )
+
+
+class RemoveXmlElements(object):
+    """ XmlTransform operation which removes the elements matching an
+        ElementPath expression.  Metadata elements in the path need to be
+        prefixed with ns:, for example: ./ns:Layout/ns:relatedLists """
+
+    def __init__(self, path):
+        self.path = path
+
+    def __call__(self, tree):
+        elements = tree.findall(
+            self.path.replace('ns:', '{{{}}}'.format(METADATA_NAMESPACE))
+        )
+        for element in elements:
+            element.getparent().remove(element)
+        return bool(elements)
+
+
+# Downloaded zips larger than this are spooled to a temporary file on disk
+DOWNLOAD_SPOOL_MAX_SIZE = 10 * 1024 * 1024
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
+
+def download_extract_zip(url, target=None, subfolder=None, headers=None, logger=None):
+    """ Downloads a zip file and either extracts it into target or returns
+        the ZipFile.  If subfolder is set, only the files in the subfolder
+        are extracted or returned with the subfolder stripped from their
+        names.  The response is streamed into a temporary file which is only
+        written to disk once it grows past DOWNLOAD_SPOOL_MAX_SIZE.
+    """
+    zip_content = tempfile.SpooledTemporaryFile(
+        max_size=DOWNLOAD_SPOOL_MAX_SIZE,
+    )
+    download_file(url, zip_content, headers=headers, logger=logger)
+    zip_content.seek(0)
+    return extract_zip(zipfile.ZipFile(zip_content), target, subfolder)
+
+def download_file(url, fileobj, headers=None, logger=None):
+    """ Streams the response for url into fileobj and returns the number of
+        bytes written """
     if not headers:
         headers = {}
-    resp = requests.get(url, headers=headers)
-    zip_content = io.BytesIO(resp.content)
-    zip_file = zipfile.ZipFile(zip_content)
-    if subfolder:
-        zip_file = zip_subfolder(zip_file, subfolder)
+    start = time.time()
+    resp = requests.get(url, headers=headers, stream=True)
+    resp.raise_for_status()
+    size = 0
+    for chunk in resp.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE):
+        fileobj.write(chunk)
+        size += len(chunk)
+    if logger:
+        elapsed = time.time() - start
+        logger.info('Downloaded {:.1f} MB in {:.1f}s ({:.1f} MB/s)'.format(
+            size / 1048576.0,
+            elapsed,
+            size / 1048576.0 / elapsed if elapsed else 0,
+        ))
+    return size
+
+def extract_zip(zip_file, target=None, subfolder=None):
+    """ Extracts the zip, or only subfolder of it, into target.  Without a
+        target the ZipFile is returned with only the files in subfolder. """
     if target:
-        zip_file.extractall(target)
+        if subfolder:
+            extract_zip_subfolder(zip_file, subfolder, target)
+        else:
+            zip_file.extractall(target)
         return
+    if subfolder:
+        zip_file = zip_subfolder(zip_file, subfolder)
     return zip_file
 
+def extract_zip_subfolder(zip_src, path, target):
+    """ Extracts only the files under path in the zip into target with path
+        stripped from their names """
+    if not path.endswith('/'):
+        path = path + '/'
+    target = os.path.abspath(target)
+    for name in zip_src.namelist():
+        if not name.startswith(path):
+            continue
+        rel_name = name[len(path):]
+        if not rel_name:
+            continue
+        dest = os.path.normpath(os.path.join(target, *rel_name.split('/')))
+        # Don't write outside of target for names with .. in them
+        if not dest.startswith(target + os.sep):
+            continue
+        if name.endswith('/'):
+            if not os.path.isdir(dest):
+                os.makedirs(dest)
+            continue
+        if not os.path.isdir(os.path.dirname(dest)):
+            os.makedirs(os.path.dirname(dest))
+        with zip_src.open(name) as src, open(dest, 'wb') as f:
+            shutil.copyfileobj(src, f)
+
 def zip_subfolder(zip_src, path):
     if not path.endswith('/'):
         path = path + '/'
@@ -147,10 +439,191 @@ def zip_subfolder(zip_src, path):
     return zip_dest
 
 
-def zip_inject_namespace(zip_src, namespace=None, managed=None, filename_token=None, namespace_token=None, namespaced_org=None, logger=None):
-    """ Replaces %%%NAMESPACE%%% for all files and ___NAMESPACE___ in all 
-        filenames in the zip with the either '' if no namespace is provided
-        or 'namespace__' if provided.
+# ZipFile.writestr takes compresslevel from Python 3.7
+ZIPFILE_COMPRESSLEVEL = sys.version_info >= (3, 7)
+
+
+def zip_transform(zip_src, transforms, zip_dest=None, compress_level=None):
+    """ Applies a list of transforms to each file in the zip in a single pass
+
+    Each transform is a function which takes the (name, content) of a file
+    and returns the new (name, content).  The transforms are composed once
+    and each file is read, transformed and written to zip_dest, which
+    defaults to a new in memory zip, without rebuilding the zip in between
+    transforms.
+
+    Files of the binary metadata types are only renamed by the transforms.
+    Their content is copied untouched and stored without compression while
+    other files are compressed at compress_level.
+    """
+    if zip_dest is None:
+        zip_dest = zipfile.ZipFile(io.BytesIO(), 'w', zipfile.ZIP_DEFLATED)
+    transform = compose_zip_transforms(*transforms)
+    for name in zip_src.namelist():
+        content = zip_src.read(name)
+        if is_binary_metadata(name):
+            name, _ = transform(name, b'')
+            zip_writestr(zip_dest, name, content, 0)
+            continue
+        name, content = transform(name, content)
+        zip_writestr(zip_dest, name, content, compress_level)
+    return zip_dest
+
+def zip_writestr(zipf, name, content, compress_level=None):
+    """ Writes content to the zip, stored for a compress_level of 0 and
+        otherwise with the zip's compression.  ZipFile.writestr only takes
+        the level of a deflated file in Python 3.7 and later, so earlier
+        versions raise ValueError for levels other than 0. """
+    if compress_level and not ZIPFILE_COMPRESSLEVEL:
+        raise ValueError(
+            'Compression levels other than 0 require Python 3.7 or later'
+        )
+    if compress_level == 0:
+        zipf.writestr(name, content, zipfile.ZIP_STORED)
+    elif compress_level is None or zipf.compression != zipfile.ZIP_DEFLATED:
+        zipf.writestr(name, content)
+    else:
+        zipf.writestr(name, content, compresslevel=compress_level)
+
+# Top level directories of the metadata types with binary content
+BINARY_METADATA_DIRECTORIES = ('staticresources', 'documents', 'contentassets')
+
+def is_binary_metadata(name):
+    """ Returns True if a file in a package is the content of a static
+        resource, document or content asset, which is never decoded as text.
+        Their -meta.xml files are text. """
+    parts = name.split('/')
+    return (
+        len(parts) > 1 and
+        parts[0] in BINARY_METADATA_DIRECTORIES and
+        not name.endswith('-meta.xml')
+    )
+
+def zip_static_resource_bundle(path, cache_dir=None):
+    """ Returns the content of a static resource zipped from the files in
+        the bundle directory path.  If cache_dir is set, the zip is stored
+        there by a hash of the bundle's file names and content so unchanged
+        bundles are only zipped once. """
+    files = []
+    for root, dirs, filenames in os.walk(path):
+        dirs.sort()
+        for filename in sorted(filenames):
+            if filename.startswith('.'):
+                continue
+            file_path = os.path.join(root, filename)
+            files.append((
+                os.path.relpath(file_path, path).replace(os.sep, '/'),
+                file_path,
+            ))
+
+    bundle_hash = hashlib.sha1()
+    contents = []
+    for name, file_path in files:
+        with open(file_path, 'rb') as f:
+            content = f.read()
+        bundle_hash.update('{}:{}:'.format(name, len(content)).encode('utf-8'))
+        bundle_hash.update(content)
+        contents.append((name, content))
+
+    cache_path = None
+    if cache_dir:
+        cache_path = os.path.join(cache_dir, bundle_hash.hexdigest() + '.zip')
+        if os.path.isfile(cache_path):
+            with open(cache_path, 'rb') as f:
+                return f.read()
+
+    zip_file = io.BytesIO()
+    zipf = zipfile.ZipFile(zip_file, 'w', zipfile.ZIP_DEFLATED)
+    for name, content in contents:
+        # A fixed date makes the zip the same for the same files
+        zinfo = zipfile.ZipInfo(name, (1980, 1, 1, 0, 0, 0))
+        zinfo.compress_type = zipfile.ZIP_DEFLATED
+        zinfo.external_attr = 0o644 << 16
+        zipf.writestr(zinfo, content)
+    zipf.close()
+    bundle = zip_file.getvalue()
+
+    if cache_path:
+        if not os.path.isdir(cache_dir):
+            os.makedirs(cache_dir)
+        write_file_atomic(cache_path, bundle)
+    return bundle
+
+def compose_zip_transforms(*transforms):
+    """ Returns a single (name, content) transform which applies the
+        transforms in order
+    """
+    transforms = [transform for transform in transforms if transform]
+
+    def transform_all(name, content):
+        for transform in transforms:
+            name, content = transform(name, content)
+        return name, content
+
+    return transform_all
+
+def token_substitution(replacements):
+    """ Returns a function which replaces each key of replacements in a string
+        with its value.  Content without the prefix shared by the tokens is
+        returned after a single substring search without being copied and
+        only the tokens found in the content are replaced.  The function
+        returns the new string and the number of distinct tokens found and
+        takes an optional set which the tokens found are added to.  Byte
+        strings are scanned without decoding them.
+    """
+    unicode_replacements = dict(
+        (unicode(token), unicode(value))
+        for token, value in replacements.items()
+    )
+    bytes_replacements = dict(
+        (token.encode('utf-8'), value.encode('utf-8'))
+        for token, value in unicode_replacements.items()
+    )
+    substitutions = {}
+    for string_type, values in ((unicode, unicode_replacements), (bytes, bytes_replacements)):
+        # Longer tokens are replaced first in case a token contains another
+        tokens = sorted(values, key=len, reverse=True)
+        prefix = os.path.commonprefix(tokens)
+        substitutions[string_type] = (
+            prefix,
+            [(token, values[token]) for token in tokens],
+        )
+
+    def substitute(content, found=None):
+        prefix, tokens = substitutions[
+            unicode if isinstance(content, unicode) else bytes
+        ]
+        if prefix not in content:
+            return content, 0
+        count = 0
+        for token, value in tokens:
+            if token in content:
+                content = content.replace(token, value)
+                count += 1
+                if found is not None:
+                    found.add(token)
+        return content, count
+
+    return substitute
+
+def is_binary_content(content, sniff_size=1024):
+    """ Sniffs the start of file content for null bytes, which text
+        metadata files never contain """
+    return b'\x00' in content[:sniff_size]
+
+def is_ascii_content(content):
+    if isinstance(content, unicode):
+        return True
+    try:
+        content.decode('ascii')
+    except UnicodeDecodeError:
+        return False
+    return True
+
+def inject_namespace_transform(namespace=None, managed=None, filename_token=None, namespace_token=None, namespaced_org=None, logger=None):
+    """ Returns a zip transform which replaces %%%NAMESPACE%%% in file
+        content and ___NAMESPACE___ in filenames with either '' if no
+        namespace is provided or 'namespace__' if provided.
     """
 
     # Handle namespace and filename tokens
@@ -176,116 +649,197 @@ def zip_inject_namespace(zip_src, namespace=None, managed=None, filename_token=N
     namespaced_org_or_c_token = '%%%NAMESPACED_ORG_OR_C%%%'
     namespaced_org_or_c = namespace if namespaced_org else 'c'
 
-    zip_dest = zipfile.ZipFile(io.BytesIO(), 'w', zipfile.ZIP_DEFLATED)
-
-    differ = difflib.Differ()
-
-    for name in zip_src.namelist():
+    # (token, replacement, value logged) in the order they are logged
+    content_tokens = [
+        (namespace_token, namespace_prefix, namespace),
+        (namespace_or_c_token, namespace_or_c, namespace_or_c),
+        (namespaced_org_token, namespaced_org, namespaced_org),
+        (namespaced_org_or_c_token, namespaced_org_or_c, namespaced_org_or_c),
+    ]
+    substitute_content = token_substitution(dict(
+        (token, replacement) for token, replacement, _ in content_tokens
+    ))
+    substitute_name = token_substitution({
+        filename_token: namespace_prefix,
+        namespaced_org_file_token: namespaced_org,
+    })
+
+    def transform(name, content):
         orig_name = unicode(name)
-        try:
-            content = zip_src.read(name)
-            orig_content = unicode(content)
-            content = content.replace(namespace_token, namespace_prefix)
-            if logger and content != orig_content:
-                logger.info('  {}: Replaced %%%NAMESPACE%%% with "{}"'.format(name, namespace))
-
-            prev_content = unicode(content)
-            content = content.replace(namespace_or_c_token, namespace_or_c)
-            if logger and content != prev_content:
-                logger.info('  {}: Replaced %%%NAMESPACE_OR_C%%% with "{}"'.format(name, namespace_or_c))
-
-            prev_content = unicode(content)
-            content = content.replace(namespaced_org_token, namespaced_org)
-            if logger and content != prev_content:
-                logger.info('  {}: Replaced %%%NAMESPACED_ORG%%% with "{}"'.format(name, namespaced_org))
-
-            prev_content = unicode(content)
-            content = content.replace(namespaced_org_or_c_token, namespaced_org_or_c)
-            if logger and content != prev_content:
-                logger.info('  {}: Replaced %%%NAMESPACED_ORG_OR_C%%% with "{}"'.format(name, namespaced_org_or_c))
-
-        except UnicodeDecodeError:
-            # if we cannot decode the content, don't try and replace it.
-            pass
+        # if we cannot decode the content, don't try and replace it.  The
+        # check is only needed if tokens were found.
+        if not is_binary_content(content):
+            found = set() if logger else None
+            new_content, count = substitute_content(content, found)
+            if count and is_ascii_content(content):
+                content = new_content
+                if logger:
+                    for token, _, value in content_tokens:
+                        if token in found:
+                            logger.info('  {}: Replaced {} with "{}"'.format(name, token, value))
 
         # Replace namespace token in file name
-        name = name.replace(filename_token, namespace_prefix)
-        name = name.replace(namespaced_org_file_token, namespaced_org)
+        name, _ = substitute_name(name)
         if logger and name != orig_name:
             logger.info('  {}: renamed to {}'.format(orig_name, name))
-        zip_dest.writestr(name, content)
+        return name, content
+
+    return transform
+
+def _namespace_prefix_transform(content_replacements, name_replacements):
+    substitute_content = token_substitution(content_replacements)
+    substitute_name = token_substitution(name_replacements)
+
+    def transform(name, content):
+        if is_binary_content(content):
+            return name, content
+        new_content, count = substitute_content(content)
+        new_name, name_count = substitute_name(name)
+        if not count and not name_count:
+            return name, content
+        if not is_ascii_content(content):
+            # if we cannot decode the content, don't try and replace it.
+            return name, content
+        return new_name, new_content
 
-    return zip_dest
+    return transform
 
-def zip_strip_namespace(zip_src, namespace, logger=None):
-    """ Given a namespace, strips 'namespace__' from all files and filenames 
-        in the zip 
+def strip_namespace_transform(namespace):
+    """ Returns a zip transform which strips 'namespace__' from file content
+        and filenames
     """
     namespace_prefix = '{}__'.format(namespace)
     lightning_namespace = '{}:'.format(namespace)
-    zip_dest = zipfile.ZipFile(io.BytesIO(), 'w', zipfile.ZIP_DEFLATED)
-    for name in zip_src.namelist():
-        try:
-            content = zip_src.read(name)
-            content = unicode(content)
-            content = content.replace(namespace_prefix, '')
-            content = content.replace(lightning_namespace, 'c:')
-            name = name.replace(namespace_prefix, '')
-        except UnicodeDecodeError:
-            # if we cannot decode the content, don't try and replace it.
-            pass
-        zip_dest.writestr(name, content)
-    return zip_dest
+    return _namespace_prefix_transform(
+        {namespace_prefix: '', lightning_namespace: 'c:'},
+        {namespace_prefix: ''},
+    )
 
-def zip_tokenize_namespace(zip_src, namespace, logger=None):
-    """ Given a namespace, replaces 'namespace__' with %%%NAMESPACE%%% for all 
-        files and ___NAMESPACE___ in all filenames in the zip 
+def tokenize_namespace_transform(namespace):
+    """ Returns a zip transform which replaces 'namespace__' with
+        %%%NAMESPACE%%% in file content and ___NAMESPACE___ in filenames
     """
     if not namespace:
-        return zip_src
+        return None
 
     namespace_prefix = '{}__'.format(namespace)
     lightning_namespace = '{}:'.format(namespace)
-    zip_dest = zipfile.ZipFile(io.BytesIO(), 'w', zipfile.ZIP_DEFLATED)
-    for name in zip_src.namelist():
-        try:
-            content = zip_src.read(name)
-            content = unicode(content)
-            content = content.replace(namespace_prefix, '%%%NAMESPACE%%%')
-            content = content.replace(lightning_namespace, '%%%NAMESPACE_OR_C%%%')
-            name = name.replace(namespace_prefix, '___NAMESPACE___')
-        except UnicodeDecodeError:
-            # if we cannot decode the content, don't try and replace it.
-            pass
-        zip_dest.writestr(name, content)
-    return zip_dest
+    return _namespace_prefix_transform(
+        {
+            namespace_prefix: '%%%NAMESPACE%%%',
+            lightning_namespace: '%%%NAMESPACE_OR_C%%%',
+        },
+        {namespace_prefix: '___NAMESPACE___'},
+    )
 
-def zip_clean_metaxml(zip_src, logger=None):
-    """ Given a zipfile, cleans all *-meta.xml files in the zip for 
-        deployment by stripping all <packageVersions/> elements
+def clean_metaxml_transform(changed=None):
+    """ Returns a zip transform which strips all <packageVersions/> elements
+        from the classes and triggers *-meta.xml files.  The names of the
+        cleaned files are appended to the changed list if provided.
     """
-    zip_dest = zipfile.ZipFile(io.BytesIO(), 'w', zipfile.ZIP_DEFLATED)
-    changed = []
-    for name in zip_src.namelist():
-        content = zip_src.read(name)
+
+    def transform(name, content):
         if not name.endswith('-meta.xml'):
-            zip_dest.writestr(name, content)
-            continue
+            return name, content
         if not name.startswith('classes/') and not name.startswith('triggers/'):
-            zip_dest.writestr(name, content)
-            continue
+            return name, content
         try:
             clean_content = remove_xml_element_string(
                 'packageVersions',
-                zip_src.read(name),
+                content,
             )
-            if clean_content != content:
-                changed.append(name)
-
-            zip_dest.writestr(name, clean_content)
         except UnicodeDecodeError:
             # if we cannot decode the content, don't try and replace it.
-            pass
+            return name, content
+        if clean_content != content and changed is not None:
+            changed.append(name)
+        return name, clean_content
+
+    return transform
+
+def strip_managed_comments_transform(token='//cumulusci-managed', changed=None):
+    """ Returns a zip transform which removes token from the Apex classes and
+        triggers so the code commented out with it is deployed to a managed
+        package.  The names of the changed files are appended to the changed
+        list if provided.
+    """
+    token_bytes = token.encode('utf-8')
+
+    def transform(name, content):
+        if not (fnmatch.fnmatch(name, 'classes/*.cls') or
+                fnmatch.fnmatch(name, 'triggers/*.trigger')):
+            return name, content
+        if token_bytes not in content:
+            return name, content
+        if changed is not None:
+            changed.append(name)
+        return name, content.replace(token_bytes, b'')
+
+    return transform
+
+def remove_xml_element_transform(name, file_pattern, changed=None):
+    """ Returns a zip transform which removes the metadata elements with
+        name from the files with a filename matching file_pattern.  The
+        names of the changed files are appended to the changed list if
+        provided.
+    """
+    operation = RemoveXmlElements('.//ns:{}'.format(name))
+    element_bytes = '<{}'.format(name).encode('utf-8')
+
+    def transform(path, content):
+        if not fnmatch.fnmatch(path.split('/')[-1], file_pattern):
+            return path, content
+        if element_bytes not in content:
+            return path, content
+        tree = lxml.etree.fromstring(content).getroottree()
+        if not operation(tree):
+            return path, content
+        if changed is not None:
+            changed.append(path)
+        return path, serialize_metadata_xml(tree)
+
+    return transform
+
+def zip_inject_namespace(zip_src, namespace=None, managed=None, filename_token=None, namespace_token=None, namespaced_org=None, logger=None):
+    """ Replaces %%%NAMESPACE%%% for all files and ___NAMESPACE___ in all 
+        filenames in the zip with the either '' if no namespace is provided
+        or 'namespace__' if provided.
+    """
+    return zip_transform(zip_src, [inject_namespace_transform(
+        namespace,
+        managed=managed,
+        filename_token=filename_token,
+        namespace_token=namespace_token,
+        namespaced_org=namespaced_org,
+        logger=logger,
+    )])
+
+def zip_strip_namespace(zip_src, namespace, logger=None):
+    """ Given a namespace, strips 'namespace__' from all files and filenames 
+        in the zip 
+    """
+    return zip_transform(
+        zip_src,
+        [strip_namespace_transform(namespace)],
+    )
+
+def zip_tokenize_namespace(zip_src, namespace, logger=None):
+    """ Given a namespace, replaces 'namespace__' with %%%NAMESPACE%%% for all 
+        files and ___NAMESPACE___ in all filenames in the zip 
+    """
+    if not namespace:
+        return zip_src
+    return zip_transform(
+        zip_src,
+        [tokenize_namespace_transform(namespace)],
+    )
+
+def zip_clean_metaxml(zip_src, logger=None):
+    """ Given a zipfile, cleans all *-meta.xml files in the zip for 
+        deployment by stripping all <packageVersions/> elements
+    """
+    changed = []
+    zip_dest = zip_transform(zip_src, [clean_metaxml_transform(changed)])
     if changed and logger:
         logger.info(
             'Cleaned package versions from {} meta.xml files'.format(
@@ -0,0 +1,143 @@
+""" Micro-benchmark for the namespace token transforms used on deploy zips
+
+Generates a package with 5,000 files in memory and compares
+cumulusci.utils.token_substitution, which skips files without tokens and
+binary files after a single scan, with the previous approach of one
+str.replace() call per token on every file.
+
+    python scripts/benchmark_namespace_tokens.py --files 5000 --repeat 5
+"""
+
+import argparse
+import io
+import os
+import random
+import sys
+import timeit
+import zipfile
+
+# Import cumulusci from this checkout rather than an installed version
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from cumulusci.utils import inject_namespace_transform
+from cumulusci.utils import zip_inject_namespace
+
+CLASS_BODY = """public with sharing class %%%NAMESPACE%%%Foo{n} {{
+""" + """    public static void run{{m}}() {{{{
+        %%%NAMESPACE%%%Account__c record = new %%%NAMESPACE%%%Account__c();
+        // Sets the amount of the record to the number of the class
+        record.Amount__c = {{n}};
+        insert record;
+    }}}}
+""".format() * 40 + """}}
+"""
+
+COMPONENT_BODY = """<aura:component controller="%%%NAMESPACE_OR_C%%%.Foo{n}">
+    <%%%NAMESPACED_ORG_OR_C%%%:child />
+</aura:component>
+"""
+
+OBJECT_BODY = """<?xml version="1.0" encoding="UTF-8"?>
+<CustomObject xmlns="http://soap.sforce.com/2006/04/metadata">
+    <label>Object {n}</label>
+""" + """    <fields>
+        <fullName>Field{n}__c</fullName>
+        <type>Text</type>
+        <length>255</length>
+    </fields>
+""" * 100 + """</CustomObject>
+"""
+
+
+def generate_package(count):
+    """ Returns a list of (name, content) for a package with count files """
+    random.seed(0)
+    files = []
+    for n in range(count):
+        kind = n % 10
+        if kind < 5:
+            files.append((
+                'classes/___NAMESPACE___Foo{}.cls'.format(n),
+                CLASS_BODY.format(n=n, m=n),
+            ))
+        elif kind < 7:
+            files.append((
+                'aura/Cmp{0}/Cmp{0}.cmp'.format(n),
+                COMPONENT_BODY.format(n=n),
+            ))
+        elif kind < 9:
+            files.append((
+                'objects/Object{}__c.object'.format(n),
+                OBJECT_BODY.format(n=n),
+            ))
+        else:
+            files.append((
+                'staticresources/Resource{}.resource'.format(n),
+                os.urandom(4096) + b'\x00',
+            ))
+    return files
+
+
+def legacy_inject_namespace(name, content, namespace):
+    """ The per-file work done by zip_inject_namespace before
+    token_substitution """
+    namespace_prefix = namespace + '__'
+    try:
+        content = unicode(content)
+        content = content.replace(u'%%%NAMESPACE%%%', namespace_prefix)
+        content = content.replace(u'%%%NAMESPACE_OR_C%%%', namespace)
+        content = content.replace(u'%%%NAMESPACED_ORG%%%', u'')
+        content = content.replace(u'%%%NAMESPACED_ORG_OR_C%%%', u'c')
+    except UnicodeDecodeError:
+        # the content is binary so it isn't changed
+        pass
+    name = name.replace(u'___NAMESPACE___', namespace_prefix)
+    name = name.replace(u'___NAMESPACED_ORG___', u'')
+    return name, content
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Benchmark namespace token substitution on a generated package',
+    )
+    parser.add_argument('--files', type=int, default=5000)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--namespace', default='ns')
+    args = parser.parse_args()
+
+    files = generate_package(args.files)
+    size = sum(len(content) for name, content in files)
+    print('Generated {} files ({:.1f} MB)'.format(len(files), size / 1048576.0))
+
+    transform = inject_namespace_transform(args.namespace, managed=True)
+    for name, content in files:
+        expected = legacy_inject_namespace(name, content, args.namespace)
+        if transform(name, content) != expected:
+            raise AssertionError('Results differ for {}'.format(name))
+
+    def run_legacy():
+        for name, content in files:
+            legacy_inject_namespace(name, content, args.namespace)
+
+    def run_substitution():
+        for name, content in files:
+            transform(name, content)
+
+    legacy = min(timeit.repeat(run_legacy, number=1, repeat=args.repeat))
+    substitution = min(timeit.repeat(run_substitution, number=1, repeat=args.repeat))
+    print('str.replace per token: {:.3f}s'.format(legacy))
+    print('token_substitution:    {:.3f}s ({:.1f}x)'.format(substitution, legacy / substitution))
+
+    zip_src = zipfile.ZipFile(io.BytesIO(), 'w', zipfile.ZIP_DEFLATED)
+    for name, content in files:
+        zip_src.writestr(name, content)
+    zip_time = min(timeit.repeat(
+        lambda: zip_inject_namespace(zip_src, args.namespace, managed=True),
+        number=1,
+        repeat=args.repeat,
+    ))
+    print('zip_inject_namespace:  {:.3f}s including zip read and write'.format(zip_time))
+
+
+if __name__ == '__main__':
+    main()
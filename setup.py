@@ -25,6 +25,7 @@ requirements = [
     'coloredlogs==9.3.1',
     'docutils==0.14',
     'future==0.16.0',
+    'futures==3.2.0; python_version < "3"',
     'github3.py==0.9.6',
     'HiYaPyCo>=0.4.11',
     'lxml==4.2.1',